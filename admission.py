@@ -0,0 +1,199 @@
+"""
+Admission control for the server: a fixed pool of worker threads fed from a bounded queue of
+accepted connections, and caps on how many of each expensive command run at once.
+When either is full the client is answered with ResCode.SERVER_NOT_READY instead of
+the server taking on more work than it can hold in memory.
+The data connections of striped transfers do not queue for a worker, the transfer they belong to
+already holds one and would wait for them until STRIPE_TIMEOUT.
+"""
+import queue
+import selectors
+import socket
+import threading
+import time
+from typing import Callable
+
+from encoder import HEADER, Encoder, peek_code
+from metrics import Metrics
+from type import MAX_LOGIN_MSG_SIZE, MSG_HEADER, Command, ResCode, receive_msg, send_msg
+
+REJECT_TIMEOUT = 2.0  # seconds a rejected client gets to send its first request
+PEEK_SIZE = MSG_HEADER.size + HEADER.size  # bytes of a first message that show its command
+TRIAGE_INTERVAL = 1.0  # seconds between checks for connections that never sent a request
+
+
+class CommandLimiter:
+    """Caps how many of each listed command run at the same time across all clients"""
+
+    def __init__(self, limits: dict[Command, int], metrics: Metrics):
+        self.metrics: Metrics = metrics
+        self.semaphores: dict[Command, threading.BoundedSemaphore] = {
+            cmd: threading.BoundedSemaphore(limit) for cmd, limit in limits.items()}
+
+    def try_acquire(self, cmd: Command) -> bool:
+        """Takes a slot for cmd without waiting, False if all slots are in use"""
+        semaphore = self.semaphores.get(cmd)
+        if semaphore is None:
+            return True
+        if semaphore.acquire(blocking=False):
+            self.metrics.incr(f"active_{cmd.name.lower()}")
+            return True
+        self.metrics.incr(f"rejected_{cmd.name.lower()}")
+        return False
+
+    def release(self, cmd: Command) -> None:
+        semaphore = self.semaphores.get(cmd)
+        if semaphore is not None:
+            self.metrics.incr(f"active_{cmd.name.lower()}", -1)
+            semaphore.release()
+
+
+class WorkerPool:
+    """
+    Serves accepted connections with a fixed number of threads.
+    Connections wait in a bounded queue until a worker is free, once the queue is full
+    new connections are rejected by a single background thread.
+    A new connection is held in a selector until its first message arrived. If that is a STRIPE
+    it is served by a thread of its own, up to stripe_threads at once, the rest go to the queue.
+    """
+
+    def __init__(self, handle_client: Callable[[socket.socket, tuple], None], workers: int,
+                 pending: int, metrics: Metrics, stripe_threads: int = 0, idle_timeout: float = 0):
+        """
+        Args:
+            handle_client: Serves a connection until it closes
+            workers: Threads serving connections
+            pending: Connections waiting for a worker at most
+            metrics: Receives the worker and connection counters
+            stripe_threads: STRIPE data connections served outside the workers at once
+            idle_timeout: Seconds a new connection has to send its first message, 0 waits forever
+        """
+        self.handle_client = handle_client
+        self.metrics: Metrics = metrics
+        self.idle_timeout: float = idle_timeout
+        self.pending: queue.Queue = queue.Queue()
+        self.rejected: queue.Queue = queue.Queue(maxsize=pending)
+        # one slot per connection being served or waiting, counted before a worker picks it up
+        self.slots = threading.BoundedSemaphore(workers + pending)
+        self.stripe_slots = threading.BoundedSemaphore(stripe_threads) if stripe_threads else None
+
+        # accepted connections are handed to the triage thread, the socket pair wakes up its select
+        self.arrivals: queue.SimpleQueue = queue.SimpleQueue()
+        self.selector = selectors.DefaultSelector()
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.selector.register(self.wake_recv, selectors.EVENT_READ)
+
+        metrics.set("worker_threads", workers)
+        metrics.set("pending_limit", pending)
+        for num in range(workers):
+            threading.Thread(target=self._work, name=f"server-worker-{num}", daemon=True).start()
+        threading.Thread(target=self._reject, name="server-rejector", daemon=True).start()
+        threading.Thread(target=self._triage, name="server-triage", daemon=True).start()
+
+    def submit(self, conn: socket.socket, addr) -> bool:
+        """Queues an accepted connection, returns False if it was rejected"""
+        if not self.slots.acquire(blocking=False):
+            self.metrics.incr("rejected_connections")
+            try:
+                self.rejected.put_nowait(conn)
+            except queue.Full:
+                conn.close()  # even the rejector is behind, drop it without an answer
+            return False
+
+        self.arrivals.put((conn, addr))
+        self.wake_send.send(b"\0")
+        return True
+
+    def _triage(self) -> None:
+        """Waits for the first message of every new connection and sends it where it is served"""
+        while True:
+            for key, _ in self.selector.select(TRIAGE_INTERVAL):
+                if key.fileobj is self.wake_recv:
+                    self._arrived()
+                    continue
+                conn: socket.socket = key.fileobj
+                try:
+                    head: bytes = conn.recv(PEEK_SIZE, socket.MSG_PEEK)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    head = b""
+                self.selector.unregister(conn)
+                self._dispatch(conn, key.data[0], peek_code(head[MSG_HEADER.size:]))
+
+            if self.idle_timeout:
+                now: float = time.monotonic()
+                for key in list(self.selector.get_map().values()):
+                    if key.fileobj is not self.wake_recv and now - key.data[1] > self.idle_timeout:
+                        self.selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                        self.slots.release()
+                        print(f"[IDLE] {key.data[0]} sent nothing in {self.idle_timeout:g} s, closed")
+
+    def _arrived(self) -> None:
+        try:
+            while self.wake_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while not self.arrivals.empty():
+            conn, addr = self.arrivals.get()
+            conn.setblocking(False)
+            self.selector.register(conn, selectors.EVENT_READ, (addr, time.monotonic()))
+
+    def _dispatch(self, conn: socket.socket, addr, cmd: Command | ResCode | None) -> None:
+        """
+        Hands a connection whose first message arrived to a worker, or a STRIPE to a thread of its own.
+        A closed connection or a pickled message goes to a worker as well, handle_client deals with it.
+        """
+        conn.setblocking(True)
+        if cmd == Command.STRIPE and self.stripe_slots is not None and self.stripe_slots.acquire(blocking=False):
+            self.slots.release()  # a data connection is not counted with the ones waiting for a worker
+            threading.Thread(target=self._serve_stripe, args=(conn, addr), name="server-stripe", daemon=True).start()
+            return
+        self.pending.put((conn, addr))
+        self.metrics.set("pending_connections", self.pending.qsize())
+
+    def _serve_stripe(self, conn: socket.socket, addr) -> None:
+        self.metrics.incr("stripe_connections")
+        try:
+            self.handle_client(conn, addr)
+        except Exception as e:
+            print(f"[WORKER ERROR] {addr}: {e}")
+            conn.close()
+        finally:
+            self.metrics.incr("stripe_connections", -1)
+            self.stripe_slots.release()
+
+    def _work(self) -> None:
+        while True:
+            conn, addr = self.pending.get()
+            self.metrics.set("pending_connections", self.pending.qsize())
+            self.metrics.incr("busy_workers")
+            try:
+                self.handle_client(conn, addr)
+            except Exception as e:
+                print(f"[WORKER ERROR] {addr}: {e}")
+                conn.close()
+            finally:
+                self.metrics.incr("busy_workers", -1)
+                self.slots.release()
+
+    def _reject(self) -> None:
+        """
+        Answers the first request of a rejected client with SERVER_NOT_READY.
+        The request is read first, closing a socket with unread data resets the
+        connection and the client could lose the answer.
+        """
+        encoder = Encoder()
+        while True:
+            conn: socket.socket = self.rejected.get()
+            try:
+                conn.settimeout(REJECT_TIMEOUT)
+                receive_msg(conn, MAX_LOGIN_MSG_SIZE)
+                send_msg(conn, encoder.encode({}, ResCode.SERVER_NOT_READY))
+            except OSError:
+                pass
+            finally:
+                conn.close()
@@ -0,0 +1,119 @@
+"""
+asyncio engine for the server, selected with SERVER_MODE = async in config.ini.
+Every connection lives on one event loop, so an idle client costs a coroutine and a
+4 byte header buffer instead of a thread and its stack. Commands run the same handlers
+as the threaded server: cheap ones on the loop, everything that touches the disk or
+burns CPU (listings, zip compression and extraction) in a thread pool. Logins wait there
+for the bcrypt pool of auth.py. Transfers run in a pool of their own: a striped transfer holds
+a thread while its data connections, each on a thread too, move the ranges, and neither may
+wait behind the other clients' commands or leave them waiting.
+"""
+import asyncio
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from encoder import Encoder, DecodeError
+from type import Command, KeyData, receive_msg_async, send_msg_async
+
+# answered on the event loop itself, they neither block nor take long.
+# VERIFY_AUTH is not one of them, a token missing from the cache is checked against data.db
+INLINE_COMMANDS = (Command.STARTING_MSG, Command.LOGOUT)
+
+
+class AsyncServer:
+    """
+    Accepts clients on a non-blocking socket and serves each one from a coroutine.
+
+    Args:
+        addr: Address to listen on
+        workers: Threads in the executor used for disk and CPU heavy commands
+        transfer_workers: Threads in the executor of the transfers and STRIPE data connections
+        allow_pickle: Passed on to the Encoder of every connection
+        handle_request: Runs a single reply command, handle_request(encoder, in_data, addr) -> bytes
+        handle_transfer: Runs a bulk transfer on a blocking socket, handle_transfer(conn, addr, encoder, in_data) -> bool
+        transfer_commands: Commands that go to handle_transfer
+    """
+
+    def __init__(self, addr: tuple[str, int], workers: int, transfer_workers: int, allow_pickle: bool,
+                 handle_request: Callable[[Encoder, dict, tuple], bytes],
+                 handle_transfer: Callable[[socket.socket, tuple, Encoder, dict], bool],
+                 transfer_commands: tuple[Command, ...]):
+        self.addr = addr
+        self.allow_pickle: bool = allow_pickle
+        self.handle_request = handle_request
+        self.handle_transfer = handle_transfer
+        self.transfer_commands = transfer_commands
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="server-worker")
+        self.transfer_executor = ThreadPoolExecutor(max_workers=transfer_workers, thread_name_prefix="server-transfer")
+        self.clients: set[asyncio.Task] = set()  # keeps the client tasks referenced until they finish
+
+    def run(self) -> None:
+        asyncio.run(self.serve())
+
+    async def serve(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        print("Starting the server (asyncio)")
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  ## used IPV4 and TCP connection
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(self.addr)
+        server.listen(socket.SOMAXCONN)
+        server.setblocking(False)
+        print(f"server is listening on {self.addr[0]}:{self.addr[1]}")
+
+        try:
+            while True:
+                conn, addr = await loop.sock_accept(server)
+                task = asyncio.create_task(self.handle_client(conn, addr))
+                self.clients.add(task)
+                task.add_done_callback(self.clients.discard)
+        finally:
+            server.close()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.transfer_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def handle_client(self, conn: socket.socket, addr) -> None:
+        print(f"[NEW CONNECTION] {addr} connected.")
+        loop = asyncio.get_running_loop()
+        conn.setblocking(False)
+        encoder = Encoder(allow_pickle=self.allow_pickle)
+
+        try:
+            while True:
+                encoded_data = await receive_msg_async(loop, conn, encoder.max_msg_size)
+                if not encoded_data:
+                    break
+
+                in_data: dict = encoder.decode(encoded_data)
+                cmd: Command = in_data[KeyData.CMD]
+
+                if cmd in self.transfer_commands:
+                    # transfers use the blocking socket helpers, hand the socket to a transfer thread until done
+                    conn.setblocking(True)
+                    try:
+                        keep_open: bool = await loop.run_in_executor(
+                            self.transfer_executor, self.handle_transfer, conn, addr, encoder, in_data)
+                    finally:
+                        conn.setblocking(False)
+                    if not keep_open:
+                        break
+                    continue
+
+                if cmd in INLINE_COMMANDS:
+                    out_data: bytes = self.handle_request(encoder, in_data, addr)
+                else:
+                    out_data: bytes = await loop.run_in_executor(self.executor, self.handle_request, encoder, in_data,
+                                                                    addr)
+                await send_msg_async(loop, conn, out_data)
+
+                if cmd == Command.LOGOUT:
+                    break
+
+        except (ConnectionError, DecodeError) as e:
+            print(f"[CONNECTION ERROR] {addr}: {e}")
+        except Exception as e:
+            print(f"[WORKER ERROR] {addr}: {e}")
+        finally:
+            print(f"{addr} disconnected")
+            conn.close()
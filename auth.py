@@ -0,0 +1,128 @@
+"""
+Password checks for VERIFY_PAS off the connection threads.
+bcrypt is slow on purpose, about 0.3 s of CPU a check, so a burst of logins checked by the
+threads serving the clients takes every core from the transfers. The checks run in a pool of
+their own with a fixed number of workers, threads by default (bcrypt releases the GIL) or
+processes. Logins waiting or being checked are capped in total, per user and per IP address,
+past a cap the client gets ResCode.SERVER_NOT_READY right away instead of queueing more CPU work.
+
+Every other request is authorized with the JWT token a login returns, checked without bcrypt.
+The time a check waits for a worker and the time bcrypt takes are recorded apart, in
+auth_queue_ms and auth_check_ms, a long queue means logins wait on each other, not on bcrypt.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from database import DataStorage, check_password
+from metrics import Metrics
+from type import ResCode
+
+
+def timed_check(password: str, stored_hash: bytes) -> tuple[bool, float, float]:
+    """
+    check_password in a worker, with when it started and ended.
+    time.monotonic is the same clock in every process, so the times compare with the server's.
+    """
+    started: float = time.monotonic()
+    matches: bool = check_password(password, stored_hash)
+    return matches, started, time.monotonic()
+
+
+def default_workers() -> int:
+    """Half the cores, the rest stay free for the transfers"""
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+class AuthExecutor:
+    """Checks logins in a bounded pool, with caps on the logins in flight in total, per user and per IP"""
+
+    def __init__(self, data: DataStorage, metrics: Metrics, workers: int = 0, processes: bool = False,
+                 queue_limit: int = 8, per_user: int = 2, per_ip: int = 4):
+        """
+        Args:
+            data: Users and their password hashes, issues the tokens
+            metrics: Receives the auth_ counters
+            workers: Checks run at once, 0 for half the cores
+            processes: Runs the checks in processes instead of threads
+            queue_limit: Logins waiting for or in a check, on every server thread together
+            per_user: Logins of one username in flight at once
+            per_ip: Logins from one IP address in flight at once
+        """
+        self.data: DataStorage = data
+        self.metrics: Metrics = metrics
+        self.queue_limit: int = queue_limit
+        self.per_user: int = per_user
+        self.per_ip: int = per_ip
+        workers = workers or default_workers()
+
+        self.lock = threading.Lock()
+        self.in_flight: int = 0
+        self.users: dict[str, int] = {}
+        self.ips: dict[str, int] = {}
+
+        self.pool: Executor
+        if processes and "fork" in multiprocessing.get_all_start_methods():
+            # forked, a spawned worker would import the server's script again with all it does on import.
+            # The workers start now, while the server has few threads to fork
+            self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+            self.pool.submit(int).result()
+        else:
+            if processes:
+                print("[AUTH] processes need fork on this platform, checking passwords in threads")
+            self.pool = ThreadPoolExecutor(workers, "auth")
+        metrics.set("auth_workers", workers)
+
+    def login(self, username: str, password: str, ip: str = "") -> tuple[ResCode, str]:
+        """
+        Checks a password in the pool and waits for the result.
+
+        Returns:
+            (ResCode.OK, token), (ResCode.AUTH_FAILED, "") or (ResCode.SERVER_NOT_READY, "") when over a cap
+        """
+        if not self._admit(username, ip):
+            self.metrics.incr("rejected_logins")
+            return ResCode.SERVER_NOT_READY, ""
+
+        try:
+            found: tuple[int, bytes] | None = self.data.credentials(username)
+            if found is None:
+                self.metrics.incr("auth_failed")
+                return ResCode.AUTH_FAILED, ""
+
+            user_id, stored_hash = found
+            submitted: float = time.monotonic()
+            matches, started, ended = self.pool.submit(timed_check, password, stored_hash).result()
+            self.metrics.incr("auth_checks")
+            self.metrics.incr("auth_queue_ms", (started - submitted) * 1000)
+            self.metrics.incr("auth_check_ms", (ended - started) * 1000)
+
+            if not matches:
+                self.metrics.incr("auth_failed")
+                return ResCode.AUTH_FAILED, ""
+            return ResCode.OK, self.data.issue_token(user_id, username)
+        finally:
+            self._release(username, ip)
+
+    def _admit(self, username: str, ip: str) -> bool:
+        with self.lock:
+            if (self.in_flight >= self.queue_limit or self.users.get(username, 0) >= self.per_user
+                    or self.ips.get(ip, 0) >= self.per_ip):
+                return False
+            self.in_flight += 1
+            self.users[username] = self.users.get(username, 0) + 1
+            self.ips[ip] = self.ips.get(ip, 0) + 1
+            self.metrics.set("auth_in_flight", self.in_flight)
+            return True
+
+    def _release(self, username: str, ip: str) -> None:
+        with self.lock:
+            self.in_flight -= 1
+            # entries are dropped at zero so the dicts only hold logins in flight
+            for counts, key in ((self.users, username), (self.ips, ip)):
+                counts[key] -= 1
+                if counts[key] == 0:
+                    del counts[key]
+            self.metrics.set("auth_in_flight", self.in_flight)
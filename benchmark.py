@@ -0,0 +1,601 @@
+"""
+Benchmarks for the wire protocol and the transfer paths, results are printed as tables.
+Run one benchmark at a time:
+    python benchmark.py codec [sizes ...]
+    python benchmark.py download [megabytes]
+    python benchmark.py stripes [megabytes] [stripe counts ...]
+    python benchmark.py index [files] [files per directory]
+    python benchmark.py paths [entries]
+    python benchmark.py walk [files] [files per directory] [threads] [milliseconds per directory]
+    python benchmark.py database [statistics rows per thread] [thread counts ...]
+    python benchmark.py logins [logins in the burst] [auth workers]
+    python benchmark.py tokens [clients] [verifications]
+    python benchmark.py recorder [records per thread] [threads]
+    python benchmark.py stats [rows of history ...]
+"""
+import copy
+import os
+import pickle
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from zipfile import ZIP_DEFLATED
+
+import jwt
+from zipstream import ZipStream
+
+import database
+import dirscan
+from auth import AuthExecutor
+from database import DataStorage
+from encoder import Encoder, Codec
+from file_transfer import Transfer
+from fileindex import FileIndex
+from listing import ListingCache
+from metrics import Metrics
+from recorder import StatsRecorder
+from rollup import SERVER, WINDOWS
+from sketch import Sketch
+from relativepath import RelativePath
+from striping import RangeQueue
+from type import MAX_CHECKS, Command, ResCode, KeyData, format_bytes, format_table
+
+
+def make_listing(num_entries: int, per_dir: int = 1000) -> list[RelativePath]:
+    """Builds a synthetic TREE listing with per_dir files in each directory"""
+    rng = random.Random(num_entries)
+    return [RelativePath(f"media/dir{i // per_dir:05}", f"file_{i:07}.mp4",
+                         rng.randrange(1 << 31), 1.7e9 + rng.random() * 1e7)
+            for i in range(num_entries)]
+
+
+def timed(func, repeat: int) -> tuple[float, object]:
+    """Returns the best time out of repeat runs and the result of the last run"""
+    best: float = float("inf")
+    result = None
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_codec(sizes: list[int]) -> None:
+    """Compares encode/decode time and bytes on the wire of the BINARY and PICKLE codecs for a DIR/TREE reply"""
+    rows: list[list[str]] = []
+    for size in sizes:
+        listing: list[RelativePath] = make_listing(size)
+        repeat: int = 5 if size <= 10_000 else 1
+
+        for codec in Codec:
+            encoder = Encoder(codec)
+            encode_time, data = timed(lambda: encoder.encode({KeyData.REL_PATHS: listing}, ResCode.OK), repeat)
+            decode_time, decoded = timed(lambda: encoder.decode(data), repeat)
+            assert decoded[KeyData.REL_PATHS] == listing
+
+            rows.append([f"{size:,}", codec.name, f"{encode_time * 1000:.2f} ms", f"{decode_time * 1000:.2f} ms",
+                         format_bytes(len(data)), f"{len(data) / size:.1f}"])
+
+    print(format_table(rows, ["Entries", "Codec", "Encode", "Decode", "Wire size", "Bytes/entry"]))
+
+
+def loopback_pair() -> tuple[socket.socket, socket.socket]:
+    """Returns both ends of a TCP connection over localhost"""
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        client = socket.create_connection(listener.getsockname())
+        server, _ = listener.accept()
+    return server, client
+
+
+def timed_transfer(send, recv) -> tuple[float, float]:
+    """
+    Runs send(conn) in a thread against recv(conn) over loopback.
+    Returns the wall time and the CPU time used by the sending thread.
+    """
+    sender, receiver = loopback_pair()
+    cpu_time: list[float] = [0.0]
+
+    def sending():
+        start_cpu: float = time.thread_time()
+        assert send(sender)
+        cpu_time[0] = time.thread_time() - start_cpu
+
+    start: float = time.perf_counter()
+    thread = threading.Thread(target=sending)
+    thread.start()
+    assert recv(receiver)
+    thread.join()
+    elapsed: float = time.perf_counter() - start
+
+    sender.close()
+    receiver.close()
+    return elapsed, cpu_time[0]
+
+
+def bench_download(megabytes: int) -> None:
+    """Compares the zip DOWNLOAD path with the raw sendfile path for one incompressible file"""
+    with tempfile.TemporaryDirectory() as temp:
+        source: Path = Path(temp) / "video.mp4"
+        with open(source, "wb") as file:
+            for _ in range(megabytes):
+                file.write(os.urandom(1024 * 1024))
+        num_bytes: int = source.stat().st_size
+        target_dir: Path = Path(temp) / "received"
+        target_dir.mkdir()
+
+        def zip_send(conn) -> bool:
+            zs = ZipStream(compress_type=ZIP_DEFLATED, compress_level=6)
+            zs.add_path(source)
+            return Transfer.send_file(conn, zs, num_bytes)
+
+        results: dict[str, tuple[float, float]] = {
+            "zip (deflate 6)": timed_transfer(zip_send, lambda conn: Transfer.recv_file(conn, target_dir, num_bytes)),
+            "raw (sendfile)": timed_transfer(lambda conn: Transfer.send_raw(conn, source, num_bytes),
+                                             lambda conn: Transfer.recv_raw(conn, target_dir / "raw.mp4", num_bytes)),
+        }
+
+    rows: list[list[str]] = [[name, f"{elapsed:.2f} s", f"{format_bytes(num_bytes / elapsed)}/s", f"{cpu:.2f} s"]
+                             for name, (elapsed, cpu) in results.items()]
+    print(f"Download of {format_bytes(num_bytes)} over loopback")
+    print(format_table(rows, ["Path", "Time", "Throughput", "Sender CPU"]))
+
+
+def bench_stripes(megabytes: int, counts: list[int]) -> None:
+    """Times a striped transfer of one file over loopback with different numbers of connections"""
+    with tempfile.TemporaryDirectory() as temp:
+        source: Path = Path(temp) / "video.mp4"
+        with open(source, "wb") as file:
+            for _ in range(megabytes):
+                file.write(os.urandom(1024 * 1024))
+        num_bytes: int = source.stat().st_size
+        target: Path = Path(temp) / "received.mp4"
+
+        rows: list[list[str]] = []
+        for stripes in counts:
+            with open(target, "wb") as file:
+                Transfer.preallocate(file, num_bytes)
+            queue = RangeQueue(num_bytes)
+            pairs: list[tuple[socket.socket, socket.socket]] = [loopback_pair() for _ in range(stripes)]
+            received: list[int] = [0] * stripes
+
+            def receiving(num: int) -> None:
+                received[num] = Transfer.recv_ranges(pairs[num][1], target, num_bytes)
+
+            start: float = time.perf_counter()
+            threads: list[threading.Thread] = []
+            for num, (sender, _) in enumerate(pairs):
+                threads.append(threading.Thread(target=Transfer.send_ranges, args=(sender, source, queue)))
+                threads.append(threading.Thread(target=receiving, args=(num,)))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed: float = time.perf_counter() - start
+
+            for sender, receiver in pairs:
+                sender.close()
+                receiver.close()
+            assert sum(received) == num_bytes
+            rows.append([str(stripes), f"{elapsed:.2f} s", f"{format_bytes(num_bytes / elapsed)}/s"])
+
+    print(f"Striped transfer of {format_bytes(num_bytes)} over loopback")
+    print(format_table(rows, ["Stripes", "Time", "Throughput"]))
+
+
+def make_tree(root: Path, num_files: int, per_dir: int) -> None:
+    """Fills root with num_files small files, per_dir to a directory and 100 directories to a directory above them"""
+    print(f"Creating {num_files:,} files ...")
+    for i in range(num_files):
+        directory: Path = root / f"dir{i // per_dir // 100:03}" / f"sub{i // per_dir:05}"
+        if i % per_dir == 0:
+            directory.mkdir(parents=True)
+        with open(directory / f"file_{i:07}.txt", "wb") as file:
+            file.write(b"x" * (i % 100))
+
+
+def bench_index(num_files: int, per_dir: int) -> None:
+    """
+    Compares DIR, TREE, existence checks and size totals read from the files table with the
+    walks of the disk list_directory does without it, on a tree of num_files files.
+    Both listing caches keep nothing so every listing is built again.
+    """
+    with tempfile.TemporaryDirectory() as temp:
+        root: Path = Path(temp) / "server_location"
+        make_tree(root, num_files, per_dir)
+
+        index = FileIndex(DataStorage("benchmark", str(Path(temp) / "data.db")), root, Metrics())
+        build_time, _ = timed(index.reconcile, 1)
+        reconcile_time, _ = timed(index.reconcile, 1)
+        disk = ListingCache(0, Metrics())
+        indexed = ListingCache(0, Metrics(), index)
+        base: Path = root.resolve()
+        directory: Path = base / "dir000" / "sub00000"
+
+        def tree(cache: ListingCache) -> int:
+            entries, cursor = cache.page(base, True)
+            count: int = len(entries)
+            while cursor:
+                entries, cursor = cache.page(base, True, cursor)
+                count += len(entries)
+            return count
+
+        rng = random.Random(num_files)
+        probes: list[Path] = [base / f"dir{i // per_dir // 100:03}" / f"sub{i // per_dir:05}" / f"file_{i:07}.txt"
+                              for i in (rng.randrange(num_files) for _ in range(10_000))]
+
+        def disk_size() -> int:
+            return sum(os.stat(os.path.join(path, name)).st_size for path, _, names in os.walk(base) for name in names)
+
+        rows: list[list[str]] = []
+        for name, disk_func, index_func, repeat in (
+                ("DIR", lambda: len(disk.page(directory, False)[0]), lambda: len(indexed.page(directory, False)[0]), 5),
+                ("TREE, every page", lambda: tree(disk), lambda: tree(indexed), 1),
+                ("10,000 VERIFY_RES", lambda: sum(path.exists() and not path.is_dir() for path in probes),
+                 lambda: sum(not entry[2] for offset in range(0, len(probes), MAX_CHECKS)
+                             for entry in index.lookup_many(probes[offset:offset + MAX_CHECKS])), 3),
+                ("Size total", disk_size, lambda: index.total_size(base), 1),
+        ):
+            disk_time, disk_result = timed(disk_func, repeat)
+            index_time, index_result = timed(index_func, repeat)
+            assert disk_result == index_result, (name, disk_result, index_result)
+            rows.append([name, f"{disk_result:,}", f"{disk_time * 1000:.1f} ms", f"{index_time * 1000:.1f} ms",
+                         f"{disk_time / max(index_time, 1e-9):.1f}x"])
+
+    print(f"Index of {num_files:,} files, built in {build_time:.2f} s, reconciled unchanged in {reconcile_time:.2f} s")
+    print(format_table(rows, ["Query", "Result", "Disk", "Index", "Speedup"]))
+
+
+def bench_paths(num_entries: int) -> None:
+    """
+    Times what a large TREE listing costs in RelativePath objects: building them the way the
+    file index does, their memory, pickling them, copying the list like the clients do and
+    rendering the columns of a listing.
+    """
+    rng = random.Random(num_entries)
+    # a file's location ends with its name, the strings are joined while building like the index does
+    rows: list[tuple[str, str, int, float]] = [
+        (f"media/dir{i // 1000:04}", f"file_{i:07}.mp4", rng.randrange(1 << 31), 1.7e9 + i)
+        for i in range(num_entries)]
+
+    build_time, listing = timed(lambda: [RelativePath(f"{directory}/{name}", name, size, mtime)
+                                         for directory, name, size, mtime in rows], 1)
+    tracemalloc.start()
+    traced: list[RelativePath] = [RelativePath(f"{directory}/{name}", name, size, mtime)
+                                  for directory, name, size, mtime in rows]
+    memory: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+
+    dump_time, data = timed(lambda: pickle.dumps(listing), 1)
+    load_time, loaded = timed(lambda: pickle.loads(data), 1)
+    assert loaded == listing
+    copy_time, _ = timed(lambda: copy.deepcopy(listing), 1)
+    render_time, _ = timed(lambda: [(path.isdir, path.true_name, path.location, path.str_bytes, path.time_str)
+                                    for path in listing], 1)
+    path_time, _ = timed(lambda: [path.path() for path in listing], 1)
+    hash_time, _ = timed(lambda: len(set(listing)), 1)
+
+    print(f"{num_entries:,} RelativePath entries, {format_bytes(memory)} of objects "
+          f"({memory / num_entries:.0f} B/entry), pickled to {format_bytes(len(data))}")
+    print(format_table([[name, f"{elapsed * 1000:.1f} ms", f"{elapsed * 1e9 / num_entries:.0f} ns"]
+                        for name, elapsed in (("Build", build_time), ("Pickle", dump_time), ("Unpickle", load_time),
+                                              ("Deep copy", copy_time), ("Render", render_time),
+                                              ("path()", path_time), ("Hash into a set", hash_time))],
+                       ["Operation", "Total", "Per entry"]))
+
+
+def bench_walk(num_files: int, per_dir: int, threads: int, latency: float) -> None:
+    """
+    Compares the walks of the disk behind DIR and TREE without the file index: names from os.scandir
+    with RelativePath.from_path for every entry as before, against the rows of dirscan.scan, read in
+    turn and with threads reading ahead. os.scandir waits latency seconds to stand in for network storage.
+    System calls are counted by wrapping os.stat and os.scandir, the DirEntry.stat() of a file is one lstat.
+    """
+    counts: dict[str, int] = {"stat": 0, "scandir": 0}
+    os_stat, os_scandir = os.stat, os.scandir
+
+    def counted_stat(*args, **kwargs):
+        counts["stat"] += 1
+        return os_stat(*args, **kwargs)
+
+    def counted_scandir(*args, **kwargs):
+        counts["scandir"] += 1
+        if latency:
+            time.sleep(latency)
+        return os_scandir(*args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as temp:
+        root: Path = Path(temp).resolve()
+        make_tree(root, num_files, per_dir)
+        directory: Path = root / "dir000" / "sub00000"
+
+        def before(base: Path, recursive: bool) -> list[RelativePath]:
+            def children(parts: tuple[str, ...]) -> list[tuple[str, bool]]:
+                with os.scandir(base.joinpath(*parts)) as entries:
+                    return sorted((entry.name, entry.is_dir(follow_symlinks=False)) for entry in entries)
+            return [path for _, path in ListingCache.walk(
+                children, lambda parts, row: RelativePath.from_path(base.joinpath(*parts), base), recursive)]
+
+        def after(scanner: dirscan.Scanner, base: Path, recursive: bool) -> list[RelativePath]:
+            return [path for _, path in ListingCache.walk(scanner.children(base, recursive), dirscan.entry, recursive)]
+
+        walkers: list[tuple[str, dirscan.Scanner | None]] = [("from_path", None), ("scandir", dirscan.Scanner())]
+        if threads:
+            walkers.append((f"scandir, {threads} threads", dirscan.Scanner(threads)))
+        rows: list[list[str]] = []
+        reference: dict[bool, list[RelativePath]] = {}
+        os.stat, os.scandir = counted_stat, counted_scandir
+        try:
+            for recursive, base in ((False, directory), (True, root)):
+                for name, scanner in walkers:
+                    counts.update(stat=0, scandir=0)
+                    elapsed, paths = timed(lambda: before(base, recursive) if scanner is None
+                                           else after(scanner, base, recursive), 1)
+                    assert reference.setdefault(recursive, paths) == paths, name
+                    stats: int = counts["stat"] + (0 if scanner is None else sum(path.isfile for path in paths))
+                    rows.append(["TREE" if recursive else "DIR", name, f"{len(paths):,}", f"{elapsed * 1000:.1f} ms",
+                                 f"{counts['scandir']:,}", f"{stats:,}", f"{(stats + counts['scandir']) / len(paths):.2f}"])
+        finally:
+            os.stat, os.scandir = os_stat, os_scandir
+
+    print(f"Walks of {num_files:,} files, {latency * 1000:g} ms per directory read")
+    print(format_table(rows, ["Listing", "Walk", "Entries", "Time", "scandir", "stat", "Calls per entry"]))
+
+
+def bench_database(operations: int, thread_counts: list[int]) -> None:
+    """
+    Threads share one DataStorage like the server's handler threads: each logs in with get_token
+    and stores rows with set_statistics. A call that raises or returns a wrong result is an error.
+    get_token is bounded by bcrypt, so every thread only logs in twice.
+    """
+    with tempfile.TemporaryDirectory() as temp:
+        data = DataStorage("benchmark", str(Path(temp) / "data.db"))
+        for i in range(max(thread_counts)):
+            data.create_user(f"user{i}", f"pass{i}")
+
+        rows: list[list[str]] = []
+        for threads in thread_counts:
+            for name, count, operation in (
+                    ("get_token", 2, lambda i: bool(data.get_token(f"user{i}", f"pass{i}"))),
+                    ("set_statistics", operations, lambda i: data.set_statistics(f"user{i}", 1.0, 2.0, 3.0, 4.0))):
+                errors: list[str] = []
+
+                def worker(i: int) -> None:
+                    for _ in range(count):
+                        try:
+                            if not operation(i):
+                                errors.append("wrong result")
+                        except Exception as e:
+                            errors.append(repr(e))
+
+                workers: list[threading.Thread] = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+                start: float = time.perf_counter()
+                for thread in workers:
+                    thread.start()
+                for thread in workers:
+                    thread.join()
+                elapsed: float = time.perf_counter() - start
+                rows.append([name, str(threads), f"{threads * count:,}", f"{elapsed * 1000:.0f} ms",
+                             f"{threads * count / elapsed:,.0f}", str(len(errors)), errors[0][:40] if errors else ""])
+
+    print(format_table(rows, ["Operation", "Threads", "Calls", "Time", "Calls/s", "Errors", "First error"]))
+
+
+def bench_logins(logins: int, workers: int) -> None:
+    """
+    A burst of logins, each on a thread of its own like the server's client threads, while
+    another thread counts in a loop as a stand-in for the transfers.
+    The logins check bcrypt on their own thread (get_token) or in an AuthExecutor with enough
+    room for the whole burst, in threads or processes.
+    """
+    with tempfile.TemporaryDirectory() as temp:
+        data = DataStorage("benchmark", str(Path(temp) / "data.db"))
+        data.create_user("user", "pass")
+
+        def count(seconds: float, stop: threading.Event | None = None) -> int:
+            counted: int = 0
+            end: float = time.perf_counter() + seconds
+            while time.perf_counter() < end and not (stop and stop.is_set()):
+                counted += 1
+            return counted
+
+        baseline: float = count(1.0)
+        rows: list[list[str]] = []
+        for name, processes in (("inline", None), ("auth threads", False), ("auth processes", True)):
+            metrics = Metrics()
+            executor: AuthExecutor | None = None
+            if processes is not None:
+                executor = AuthExecutor(data, metrics, workers, processes, logins, logins, logins)
+            latencies: list[float] = []
+
+            def login() -> None:
+                start: float = time.perf_counter()
+                if executor is None:
+                    assert data.get_token("user", "pass")
+                else:
+                    assert executor.login("user", "pass", "127.0.0.1")[0] == ResCode.OK
+                latencies.append(time.perf_counter() - start)
+
+            stop = threading.Event()
+            counted: list[int] = []
+            counter = threading.Thread(target=lambda: counted.append(count(3600, stop)))
+            threads: list[threading.Thread] = [threading.Thread(target=login) for _ in range(logins)]
+            start: float = time.perf_counter()
+            counter.start()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed: float = time.perf_counter() - start
+            stop.set()
+            counter.join()
+
+            latencies.sort()
+            checks: float = metrics.get("auth_checks") or 1
+            rows.append([name, f"{elapsed * 1000:.0f} ms", f"{latencies[len(latencies) // 2] * 1000:.0f} ms",
+                         f"{latencies[-1] * 1000:.0f} ms",
+                         f"{metrics.get('auth_queue_ms') / checks:.0f} ms" if executor else "",
+                         f"{metrics.get('auth_check_ms') / checks:.0f} ms" if executor else "",
+                         f"{counted[0] / elapsed / baseline:.0%}"])
+            if executor is not None:
+                executor.pool.shutdown()
+
+    print(f"{logins} logins at once on {os.cpu_count()} cores, {workers or 'default'} auth workers")
+    print(format_table(rows, ["Checked", "Burst", "Median login", "Slowest login", "Queue", "bcrypt",
+                              "Other thread's CPU"]))
+
+
+def bench_tokens(clients: int, verifications: int) -> None:
+    """VERIFY_AUTH of tokens of clients that come back again and again, with and without the token cache"""
+    with tempfile.TemporaryDirectory() as temp:
+        rows: list[list[str]] = []
+        for name, cache in (("decoded every time", 0), ("token cache", clients)):
+            metrics = Metrics()
+            data = DataStorage("benchmark", str(Path(temp) / f"{cache}.db"), metrics, cache)
+            data.create_user("user", "pass")
+            user_id: int = data.credentials("user")[0]
+            # tokens issued in the same second are the same, these differ by exp
+            tokens: list[str] = [jwt.encode({'user_id': user_id, 'username': "user", 'exp': time.time() + 3600 + i},
+                                            "benchmark", algorithm='HS256') for i in range(clients)]
+
+            start: float = time.perf_counter()
+            for i in range(verifications):
+                assert data.verify_token(tokens[i % clients])
+            elapsed: float = time.perf_counter() - start
+            rows.append([name, f"{verifications:,}", f"{elapsed * 1000:.0f} ms",
+                         f"{elapsed / verifications * 1e6:.1f} us", f"{metrics.get('token_cache_hits'):,.0f}"])
+
+    print(f"{verifications:,} verifications of {clients:,} tokens")
+    print(format_table(rows, ["verify_token", "Calls", "Time", "Per call", "Cache hits"]))
+
+
+def bench_recorder(records: int, threads: int) -> None:
+    """
+    Threads store the statistics of commands, like the server's handler threads, with a
+    set_statistics call each or through a StatsRecorder that writes them in batches.
+    The time is until every row is in data.db, for the recorder that includes its last flush.
+    """
+    with tempfile.TemporaryDirectory() as temp:
+        rows: list[list[str]] = []
+        for name in ("set_statistics", "StatsRecorder"):
+            data = DataStorage("benchmark", str(Path(temp) / f"{name}.db"))
+            data.create_user("user", "pass")
+            recorder: StatsRecorder | None = StatsRecorder(data, Metrics(), records * threads, 3600) \
+                if name == "StatsRecorder" else None
+            calls: list[float] = []
+
+            def worker() -> None:
+                start: float = time.perf_counter()
+                for _ in range(records):
+                    if recorder is None:
+                        data.set_statistics("user", 1.0, 2.0, 3.0, 4.0)
+                    else:
+                        recorder.record("user", Command.DOWNLOAD, 1_000_000, 0.5)
+                calls.append(time.perf_counter() - start)
+
+            workers: list[threading.Thread] = [threading.Thread(target=worker) for _ in range(threads)]
+            start: float = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            if recorder is not None:
+                recorder.flush()
+            elapsed: float = time.perf_counter() - start
+
+            with data.connection() as conn:
+                stored: int = conn.execute("SELECT COUNT(*) FROM statistics").fetchone()[0]
+            rows.append([name, f"{stored:,}", f"{elapsed * 1000:.0f} ms", f"{stored / elapsed:,.0f}",
+                         f"{sum(calls) / (records * threads) * 1e6:.1f} us"])
+
+    print(f"{records:,} records on each of {threads} threads")
+    print(format_table(rows, ["Written by", "Rows", "Time", "Rows/s", "Per call in a thread"]))
+
+
+def bench_stats(sizes: list[int]) -> None:
+    """
+    The percentiles STATS shows, the response times of the last hour, day and 30 days, for a history
+    of rows spread over 30 days: merged from the rollups, or sorted from the raw rows.
+    """
+    with tempfile.TemporaryDirectory() as temp:
+        rows: list[list[str]] = []
+        for size in sizes:
+            data = DataStorage("benchmark", str(Path(temp) / f"{size}.db"))
+            now: float = time.time()
+            history: list[tuple] = sorted(((None, "DIR", 0, None, None, None, random.expovariate(1000),
+                                            now - random.uniform(0, 30 * 86400)) for _ in range(size)),
+                                          key=lambda row: row[7])
+            start: float = time.perf_counter()
+            for offset in range(0, size, 10_000):
+                data.add_statistics(history[offset:offset + 10_000])
+            written: float = time.perf_counter() - start
+
+            # a window without any row has no p99, None, a small history leaves the last hour empty
+            def from_rollups() -> list[float | None]:
+                p99: list[float | None] = []
+                for _, seconds, period in WINDOWS:
+                    sketches: dict[str, Sketch] = data.rollup_sketches(SERVER, period, time.time() - seconds)
+                    sketch: Sketch | None = sketches.get("response_time")
+                    p99.append(sketch.quantile(0.99) if sketch is not None and sketch.count else None)
+                return p99
+
+            def from_rows() -> list[float | None]:
+                p99: list[float | None] = []
+                with data.connection() as conn:
+                    for _, seconds, _ in WINDOWS:
+                        values: list[float] = [value for value, in conn.execute(
+                            "SELECT response_time FROM statistics WHERE timestamp >= ? ORDER BY response_time",
+                            (database.timestamp(time.time() - seconds),))]
+                        p99.append(values[int(0.99 * (len(values) - 1))] if values else None)
+                return p99
+
+            rollup_time, estimated = timed(from_rollups, 5)
+            rows_time, exact = timed(from_rows, 1)
+            errors: list[float] = [abs(e - x) / x for e, x in zip(estimated, exact) if e is not None and x]
+            rows.append([f"{size:,}", f"{written * 1000:.0f} ms", f"{rollup_time * 1000:.1f} ms",
+                         f"{rows_time * 1000:.1f} ms", f"{max(errors):.2%}" if errors else "-"])
+
+    print("p99 response time of the last hour, day and 30 days")
+    print(format_table(rows, ["History", "Written with rollups", "From rollups", "From rows", "Largest p99 error"]))
+
+
+if __name__ == "__main__":
+    match sys.argv[1:2]:
+        case ["codec"]:
+            bench_codec([int(arg) for arg in sys.argv[2:]] or [10, 10_000, 1_000_000])
+        case ["download"]:
+            bench_download(int(sys.argv[2]) if len(sys.argv) > 2 else 512)
+        case ["stripes"]:
+            bench_stripes(int(sys.argv[2]) if len(sys.argv) > 2 else 512,
+                          [int(arg) for arg in sys.argv[3:]] or [1, 2, 4, 8])
+        case ["paths"]:
+            bench_paths(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000)
+        case ["walk"]:
+            bench_walk(int(sys.argv[2]) if len(sys.argv) > 2 else 100_000,
+                       int(sys.argv[3]) if len(sys.argv) > 3 else 1000,
+                       int(sys.argv[4]) if len(sys.argv) > 4 else 8,
+                       float(sys.argv[5]) / 1000 if len(sys.argv) > 5 else 0.0)
+        case ["database"]:
+            bench_database(int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+                           [int(arg) for arg in sys.argv[3:]] or [1, 4, 16])
+        case ["logins"]:
+            bench_logins(int(sys.argv[2]) if len(sys.argv) > 2 else 16,
+                         int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+        case ["tokens"]:
+            bench_tokens(int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+                         int(sys.argv[3]) if len(sys.argv) > 3 else 100_000)
+        case ["recorder"]:
+            bench_recorder(int(sys.argv[2]) if len(sys.argv) > 2 else 5000,
+                           int(sys.argv[3]) if len(sys.argv) > 3 else 8)
+        case ["stats"]:
+            bench_stats([int(arg) for arg in sys.argv[2:]] or [10_000, 100_000, 500_000])
+        case ["index"]:
+            bench_index(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000,
+                        int(sys.argv[3]) if len(sys.argv) > 3 else 1000)
+        case _:
+            print(__doc__)
@@ -0,0 +1,181 @@
+"""
+Content addressed storage that keeps one copy of every uploaded file no matter how many
+directories it was uploaded to. A blob is named after the SHA-256 of its content and the
+files in SERVER_DIR are hardlinks to it, so the link count of a blob minus its own name is
+the number of files using it. A blob no file links to anymore is removed.
+Files are only ever replaced, never written in place, so the shared content can not change.
+"""
+import hashlib
+import os
+import secrets
+import string
+import threading
+from pathlib import Path
+
+from metrics import Metrics
+
+DEDUP_MIN_SIZE = 1024 * 1024  # smaller files are not worth hashing on the client before an upload
+
+
+class BlobStore:
+    """
+    Blobs live in root/<first 2 hex digits>/<sha256>.
+    An index from inode to digest, built at startup, finds the blob behind a file that is deleted.
+    """
+
+    def __init__(self, root: Path, metrics: Metrics):
+        self.root: Path = root
+        self.metrics: Metrics = metrics
+        self.lock = threading.Lock()
+        self._inodes: dict[tuple[int, int], str] = {}
+
+        root.mkdir(parents=True, exist_ok=True)
+        for blob in root.glob("*/*"):
+            stat = blob.stat()
+            if stat.st_nlink <= 1:
+                blob.unlink()  # the last file using it was removed while the server was down
+            else:
+                self._inodes[(stat.st_dev, stat.st_ino)] = blob.name
+        metrics.set("blobs", len(self._inodes))
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def refcount(self, digest: str) -> int:
+        """Number of files in SERVER_DIR that share the blob"""
+        try:
+            return self.blob_path(digest).stat().st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def add(self, file_path: Path, digest: str) -> None:
+        """
+        Stores a file that was just written. If the content is already stored the file is
+        replaced by a link to the blob, otherwise the file becomes the blob.
+        A file system without hardlinks simply keeps the copy.
+        """
+        if not digest:
+            return
+        blob: Path = self.blob_path(digest)
+        with self.lock:
+            try:
+                if file_path.stat().st_size < DEDUP_MIN_SIZE:
+                    return  # never offered by a client, a blob would only cost an inode
+                if blob.exists():
+                    if not os.path.samefile(blob, file_path):
+                        size: int = file_path.stat().st_size
+                        self._replace_with_link(blob, file_path)
+                        self.metrics.incr("dedup_bytes_saved", size)
+                    return
+
+                blob.parent.mkdir(exist_ok=True)
+                os.link(file_path, blob)
+                stat = blob.stat()
+                self._inodes[(stat.st_dev, stat.st_ino)] = digest
+                self.metrics.set("blobs", len(self._inodes))
+            except OSError as e:
+                print(f"Could not deduplicate {file_path}: {e}")
+
+    def link(self, digest: str, size: int, target: Path) -> bool:
+        """
+        Creates target from a stored blob, used when the client offers a digest instead of the bytes.
+        Returns: False if no blob of that digest and size exists
+        """
+        if len(digest) != 64 or not all(char in string.hexdigits for char in digest):
+            return False  # comes from the client, it must not name a path outside the store
+        blob: Path = self.blob_path(digest.lower())
+        with self.lock:
+            try:
+                if blob.stat().st_size != size or target.is_dir():
+                    return False
+                replaced: list[tuple[int, int]] = self.inodes(target)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                self._replace_with_link(blob, target)
+                self._release(replaced)
+            except OSError:
+                return False
+        self.metrics.incr("dedup_bytes_saved", size)
+        return True
+
+    @staticmethod
+    def _replace_with_link(blob: Path, target: Path) -> None:
+        """Points target at the blob in one step, a reader sees either the old or the new file"""
+        temp_path: Path = target.with_name(f".{target.name}.{secrets.token_hex(4)}.link")
+        os.link(blob, temp_path)
+        try:
+            os.replace(temp_path, target)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def inodes(path: Path) -> list[tuple[int, int]]:
+        """
+        Inodes of the linked files at or below path, taken before they are deleted or replaced
+        and handed to release() afterward.
+        """
+        inodes: list[tuple[int, int]] = []
+        try:
+            if not path.is_dir():
+                stat = path.stat()
+                if stat.st_nlink > 1:
+                    inodes.append((stat.st_dev, stat.st_ino))
+                return inodes
+        except OSError:
+            return inodes
+
+        for directory, _, files in os.walk(path):
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                if stat.st_nlink > 1:
+                    inodes.append((stat.st_dev, stat.st_ino))
+        return inodes
+
+    def release(self, inodes: list[tuple[int, int]]) -> None:
+        """Removes the blobs behind inodes that no file links to anymore"""
+        if inodes:
+            with self.lock:
+                self._release(inodes)
+
+    def _release(self, inodes: list[tuple[int, int]]) -> None:
+        for key in set(inodes):
+            digest: str | None = self._inodes.get(key)
+            if digest is None:
+                continue
+            blob: Path = self.blob_path(digest)
+            try:
+                if blob.stat().st_nlink > 1:
+                    continue
+                blob.unlink()
+            except FileNotFoundError:
+                pass
+            del self._inodes[key]
+        self.metrics.set("blobs", len(self._inodes))
+
+    @staticmethod
+    def file_digest(file_path: Path) -> str:
+        """Streaming SHA-256 of a file as hex"""
+        with open(file_path, "rb") as file:
+            return hashlib.file_digest(file, "sha256").hexdigest()
+
+    @staticmethod
+    def candidates(path: Path, arcname: str) -> list[tuple[Path, str]]:
+        """
+        Files at or below path that are large enough to offer by digest, with their name in
+        the upload. Names are built the same way as Compression.add_path builds them.
+        """
+        if not path.is_dir():
+            try:
+                return [(path, arcname)] if path.stat().st_size >= DEDUP_MIN_SIZE else []
+            except OSError:
+                return []
+
+        found: list[tuple[Path, str]] = []
+        with os.scandir(path) as entries:
+            children: list[str] = sorted(entry.name for entry in entries)
+        for child in children:
+            found += BlobStore.candidates(path / child, f"{arcname}/{child}")
+        return found
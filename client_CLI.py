@@ -75,7 +75,7 @@ class ClientCli(ClientInterface):
         print("\033c", end="")
 
     def rename_file_error(self, file_name: str) -> str:
-        self.app_error_print(f"{file_name} already exists: choose a new filename default override file")
+        self.app_error_print(f"{file_name} already exists: choose a new filename or enter nothing to update it")
         return input(f"\t{self.current_dir.location} > Type in new name:")
 
     def rename_file(self, file_name: str) -> str:
@@ -140,56 +140,70 @@ class ClientCli(ClientInterface):
             else:
                 return cmd
 
-    def show_dir(self, rel_paths: list[RelativePath]) -> None:
+    def show_dir(self, rel_paths: list[RelativePath], first_page: bool = True) -> None:
         """
         Prints the directory when received, executed when DIR/TREE cmd is executed
+        Every page is printed as it arrives, only the first one with the header
         """
         path_table: list[list[str]] = []
         for path in rel_paths:
-            path_table.append(["📁" if path.isdir else "📄",path.true_name, path.str_bytes ,path.time_str])
+            # the location is the path below the current directory, TREE and SEARCH entries may be further down
+            path_table.append(["📁" if path.isdir else "📄",path.location, path.str_bytes ,path.time_str])
 
-        print(format_table(path_table,["📁", "Name", "Bytes", "Modified Time"]))
+        if path_table or first_page:
+            print(format_table(path_table,["📁", "Name", "Bytes", "Modified Time"] if first_page else []))
 
 
 
+    def get_search_query(self) -> str | None:
+        """
+        Takes the query of a SEARCH as one line
+        Returns None when input is empty
+        """
+        print("Search below the current directory: a name or *.glob, >10MB <1GB, since:7d or since:2026-01-31, "
+              "limit:100. Return nothing to exit")
+        return input(f"\t{self.current_dir.location} ?| ").strip() or None
+
     def select_server_files(self) -> list[RelativePath]:
 
         """
         Takes input as a string converts it to RelativePath
-        Verifies each file exists and is a file (not directory)
-        Returns when input is empty
+        Verifies each file or directory exists once input is empty, in one request
+        Returns the ones that exist
         """
         print("Select multiple files/directories on the server, selection is relative to your current directory: Return nothing to exit")
         paths: list[RelativePath] = []
         while True:
             in_files = input(f"\t{self.current_dir.location} <-|").strip('"')
             if in_files == '':
-                return paths
+                break
 
-            path_file = copy.deepcopy(self.current_dir) / in_files
+            paths.append(self.current_dir / in_files)
 
-            # Verify file exists and is a file (not directory)
-            valid_file: ResCode = self.verify_resource(None, True, path_file)
+        # Verify every file or directory exists
+        results: list[ResCode] = self.verify_resources([(path_file, None, True) for path_file in paths])
+        for path_file, valid_file in zip(paths, results):
             if valid_file != ResCode.OK:
-                self.app_error(valid_file)
-                continue
+                self.app_error_print(f"{path_file.location}: {valid_file.desc}")
 
-            paths.append(path_file)
+        return [path_file for path_file, valid_file in zip(paths, results) if valid_file == ResCode.OK]
 
     def select_client_files(self) -> list[tuple[Path, str]]:
         """
         Takes string input from user in a while loop, casts it to Path object and checks if it exists
-        Allows user to rename file if it would override an existing file on server
+        Allows user to rename file if it would override an existing file on server,
+        the server checks the whole selection in one request once input is empty
         Program returns list when input is empty
         """
         print("Select multiple files on your machine (relative or absolute paths): Return nothing to exit")
         current_directory: str = os.getcwd()
         paths: list[tuple[Path, str]] = []
+        selected: list[tuple[Path, str]] = []
 
         while True:
             in_files = input(f"\t{current_directory} <-| ").strip('"')
             if in_files == '':
-                return paths
+                break
 
             path_file = Path(in_files)
 
@@ -198,28 +212,31 @@ class ClientCli(ClientInterface):
                 self.app_error(ResCode.FILE_NOT_FOUND)
                 continue
 
-            # Check server-side if file would override existing file
-            new_name = self.rename_file(path_file.name)
-            server_path = self.current_dir / new_name
+            selected.append((path_file, self.rename_file(path_file.name)))
 
-            while True:
-                valid_check: ResCode = self.verify_resource(None, False, server_path)
+        # Check server-side if files would override existing files, renamed files are checked again
+        while selected:
+            results: list[ResCode] = self.verify_resources(
+                [(self.current_dir / new_name, None, False) for _, new_name in selected])
+            renamed_files: list[tuple[Path, str]] = []
 
+            for (path_file, new_name), valid_check in zip(selected, results):
                 if valid_check == ResCode.OK:
                     # File doesn't exist on server, good to go
-                    break
+                    paths.append((path_file, new_name))
                 elif valid_check == ResCode.EXISTS:
-                    # File exists on server, ask user to rename
-                    new_name = self.rename_file_error(new_name)
-                    server_path = self.current_dir / new_name
+                    # File exists on server, ask user to rename or keep the name to update it
+                    renamed: str = self.rename_file_error(new_name)
+                    if not renamed:
+                        paths.append((path_file, new_name))  # only the changed blocks are sent (upload_deltas)
+                    else:
+                        renamed_files.append((path_file, renamed))
                 else:
                     # Some other error
-                    self.app_error(valid_check)
-                    break
+                    self.app_error_print(f"{new_name}: {valid_check.desc}")
+            selected = renamed_files
 
-            # Only add if verification passed
-            if valid_check == ResCode.OK:
-                paths.append((path_file, new_name))
+        return paths
 
     def select_client_dir(self) -> Path:
         """
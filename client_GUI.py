@@ -184,9 +184,29 @@ class ClientGui(ClientInterface):
 
         return copy.deepcopy(temp)
 
-    def show_dir(self, rel_paths: list[RelativePath]) -> None:
-        self.paths = copy.deepcopy(rel_paths)
-        self.refresh_treeview()
+    def show_dir(self, rel_paths: list[RelativePath], first_page: bool = True) -> None:
+        if first_page:
+            self.paths = copy.deepcopy(rel_paths)
+            self.refresh_treeview()
+        else:
+            # later pages of a large listing are appended without redrawing the rows already shown
+            start: int = len(self.paths) - (1 if self.current_dir.path() != Path('.') else 0)
+            self.paths.extend(copy.deepcopy(rel_paths))
+            self.insert_rows(rel_paths, start)
+
+    def get_search_query(self) -> str | None:
+        # the naming screen takes the query, the results replace the listing
+        self.rename_msg.set("Search below the current directory")
+        self.rename_initial.set("name or *.glob, >10MB <1GB, since:7d, limit:100")
+        self.rename_show()
+        while self.chosen_dir is None:
+            time.sleep(.1)
+
+        query, self.chosen_dir = self.chosen_dir, None
+        self.rename_msg.set("Name your file/directory")
+        self.rename_initial.set("")
+        self.rename_hide()
+        return query
 
     def select_server_dir(self, exists: bool, skip_verification: bool = False) -> RelativePath | None:
         self.rename_show()
@@ -226,9 +246,18 @@ class ClientGui(ClientInterface):
             if path.isdir:
                 temp_paths.append(copy.deepcopy(current_dir) / path)
             else:
-                temp_paths.append(copy.deepcopy(current_dir) / path.name)
+                # a search result may be in a subdirectory, its location is the path below current_dir
+                temp_paths.append(copy.deepcopy(current_dir) / path.location)
+
+        # the listing may be older than the server's files, the whole selection is checked in one request
+        results: list[ResCode] = self.verify_resources([(path, None, True) for path in temp_paths])
+        missing: list[str] = [path.location for path, result in zip(temp_paths, results) if result == ResCode.EXISTS]
+        if missing:
+            self.app_error_print(f"No longer on the server: {', '.join(missing)}")
+        for result in set(results) - {ResCode.OK, ResCode.EXISTS}:
+            self.app_error(result)
 
-        return temp_paths
+        return [path for path, result in zip(temp_paths, results) if result == ResCode.OK]
 
     def select_client_files(self) -> list[tuple[Path, str]]:
         file_paths = filedialog.askopenfilenames(
@@ -468,18 +497,22 @@ class ClientGui(ClientInterface):
             )
 
         # Insert current directory content
-        for i, p in enumerate(self.paths[1:] if self.current_dir.path() != Path('.') else self.paths):
+        self.insert_rows(self.paths[1:] if self.current_dir.path() != Path('.') else self.paths, 0)
+
+        self.path_label.config(text=f"Current Directory: {self.current_dir.location}\\")
+
+    def insert_rows(self, rel_paths: list[RelativePath], start: int) -> None:
+        """Adds rows to the treeview, the iid of a row is its index in the listing without the parent entry"""
+        for i, p in enumerate(rel_paths, start):
             prefix = "📁" if p.isdir else "📄"
             self.treeview.insert(
                 "",
                 "end",
                 iid=str(i),
-                text=f"{prefix} {p.true_name}",
+                text=f"{prefix} {p.location}",
                 values=(f"{p.str_bytes}", p.time_str)
             )
 
-        self.path_label.config(text=f"Current Directory: {self.current_dir.location}\\")
-
     def create_context_menu(self):
         """Create the right-click context menu"""
         context_menu = tk.Menu(self.root, tearoff=0)
@@ -489,6 +522,7 @@ class ClientGui(ClientInterface):
         context_menu.add_command(label="Delete", command=self.menu_delete)
         context_menu.add_separator()
         context_menu.add_command(label="Create Directory", command=self.menu_mkdir)
+        context_menu.add_command(label="Search", command=self.menu_search)
         context_menu.add_separator()
         context_menu.add_command(label="Refresh", command=self.set_dir)
         context_menu.add_separator()
@@ -529,6 +563,10 @@ class ClientGui(ClientInterface):
         """Handle mkdir cmd from context menu"""
         self.stored_command = Command.MKDIR
 
+    def menu_search(self):
+        """Handle search cmd from context menu"""
+        self.stored_command = Command.SEARCH
+
     def show_context_menu(self, event):
         """Display context menu at cursor position"""
         try:
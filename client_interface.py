@@ -1,24 +1,39 @@
 import copy
 import socket
+import threading
+import time
+from collections import deque
 from pathlib import Path
-from zipfile import ZIP_DEFLATED
 
 from zipstream import ZipStream
 
+from blobstore import BlobStore
+from compression import Compression
+from delta import DELTA_MIN_SIZE, Delta
 from file_transfer import Transfer
+from listing import PAGE_SIZE
 from relativepath import RelativePath
 from settings import Settings
-from type import Command, ResCode, KeyData, SIZE, format_bytes, format_time
-from encoder import Encoder
+from resume import PART_SUFFIX, Checkpoint
+from search import SearchQuery
+from striping import STRIPE_MIN_SIZE, RangeQueue, StripeProgress, StripeTuner
+from type import MAX_CHECKS, Command, ResCode, KeyData, format_bytes, format_time, receive_msg, send_msg
+from encoder import Encoder, Codec, DecodeError
 
 from abc import ABC, abstractmethod
 
+PIPELINE_DEPTH = 32  # requests sent ahead of their replies, the replies wait in the socket buffers meanwhile
+LOGIN_RETRIES = 5  # a login the server is too busy to check is sent again this often
+LOGIN_RETRY_DELAY = 1.0  # seconds before it is, doubled every time
+
 
 class ClientInterface(ABC):
     def __init__(self):
         self.sett = Settings()
         self.current_dir: RelativePath = RelativePath.from_base()
         self.conn = None
+        self.encoder: Encoder = Encoder()
+        self.tuner = StripeTuner(self.sett.STRIPES)
         self.PLATFORM: str = ""
 
     def run(self):
@@ -26,11 +41,17 @@ class ClientInterface(ABC):
         self.connect_helper()
 
         # receive initial message
-        out_data: bytes = Encoder.encode({KeyData.PLATFORM: self.PLATFORM}, Command.STARTING_MSG)
-        self.conn.send(out_data)
+        out_dict: dict = {KeyData.PLATFORM: self.PLATFORM, KeyData.CODECS: self.encoder.accepted()}
+        out_data: bytes = self.encoder.encode(out_dict, Command.STARTING_MSG)
+        send_msg(self.conn, out_data)
+
+        encoded_data: bytes = receive_msg(self.conn)
+        response: dict = self.encoder.decode(encoded_data)
 
-        encoded_data: bytes = self.conn.recv(SIZE)
-        response: dict = Encoder.decode(encoded_data)
+        codec: int | None = response.get(KeyData.CODEC)
+        if codec:
+            self.encoder.codec = Codec(codec)
+        self.encoder.tag_requests = KeyData.REQ_ID in response
 
         msg: str | None = response.get(KeyData.MSG)
         if msg:
@@ -48,22 +69,19 @@ class ClientInterface(ABC):
                     self.app_exit()
 
                 case Command.TREE | Command.DIR:
-                    out_data: bytes = Encoder.encode({KeyData.REL_PATH: copy.deepcopy(self.current_dir)}, in_cmd)
-                    self.conn.send(out_data)
-
-                    encoded_data: bytes = self.conn.recv(SIZE)
-                    response: dict = Encoder.decode(encoded_data)
+                    self.list_pages(in_cmd)
 
-                    response_cmd: ResCode = response[KeyData.CMD]
-                    if response_cmd != ResCode.OK:
-                        self.app_error(response_cmd)
+                case Command.SEARCH:
+                    text: str | None = self.get_search_query()
+                    if not text:
+                        self.app_print("Exited out of SEARCH")
                         continue
-
-                    in_paths: list[RelativePath] | None = response.get(KeyData.REL_PATHS)
-                    if not in_paths:
-                        self.app_print("Directory is Empty")
-                        in_paths = []
-                    self.show_dir(in_paths)
+                    try:
+                        query: SearchQuery = SearchQuery.parse(text)
+                    except ValueError as e:
+                        self.app_error_print(str(e))
+                        continue
+                    self.list_pages(Command.SEARCH, query.to_dict(), query.limit)
 
                 case Command.HELP:
                     self.app_print(Command.cmd_str())
@@ -71,7 +89,18 @@ class ClientInterface(ABC):
                 case Command.UPLOAD:
                     client_paths: list[tuple[Path, str]] = self.select_client_files()
 
-                    zs = ZipStream(compress_type=ZIP_DEFLATED, compress_level=self.sett.COMPRESS_LVL) # high compression level, 1-7
+                    # large files the server already stores are linked there instead of sent
+                    linked: set[str] = self.link_stored(client_paths)
+                    # files the server has an older version of only send the blocks that changed
+                    linked |= self.upload_deltas(client_paths, linked)
+
+                    # one large already compressed file goes raw over several connections
+                    if (len(client_paths) == 1 and client_paths[0][1] not in linked
+                            and self.is_striped(client_paths[0][0])):
+                        self.upload_striped(*client_paths[0])
+                        continue
+
+                    zs = ZipStream()  # the codec is chosen per file by Compression.add_path
 
                     num_bytes: int = 0  # approximated size
 
@@ -81,10 +110,11 @@ class ClientInterface(ABC):
 
                         num_bytes += int(client_path.stat().st_size) # approximation not perfectly accurate
 
-                        zs.add_path(client_path, file_name)
+                        Compression.add_path(zs, client_path, file_name, self.sett.COMPRESS_LVL, linked)
 
                     if zs.is_empty():
-                        self.app_error(ResCode.NO_FIlES_SELECTED)
+                        if not linked:  # otherwise every file was linked or updated already
+                            self.app_error(ResCode.NO_FIlES_SELECTED)
                         continue
 
 
@@ -93,12 +123,12 @@ class ClientInterface(ABC):
                         KeyData.BYTES: num_bytes,
                     }
 
-                    out_data: bytes = Encoder.encode(out_dict, Command.UPLOAD)
-                    self.conn.send(out_data)
+                    out_data: bytes = self.encoder.encode(out_dict, Command.UPLOAD)
+                    send_msg(self.conn, out_data)
 
                     # receives an OK to send the file
-                    in_data_2 = self.conn.recv(SIZE)
-                    response_2: dict = Encoder.decode(in_data_2)
+                    in_data_2 = receive_msg(self.conn)
+                    response_2: dict = self.encoder.decode(in_data_2)
                     response_cmd_2: ResCode = response_2[KeyData.CMD]
                     if response_cmd_2 != ResCode.OK:
                         self.app_error(response_cmd_2)
@@ -107,18 +137,21 @@ class ClientInterface(ABC):
                     # sending the file
                     self.app_print("Uploading ...")
 
+                    start_cpu: float = time.thread_time()
                     succeeded: bool = Transfer.send_file(self.conn, zs, num_bytes, self.progress_bar)
                     if not succeeded:
                         self.app_error_print("File failed to be transferred")
                         continue
+                    stats: dict[str, float] = Compression.stats(zs, time.thread_time() - start_cpu)
 
                     # handle the server response after upload
-                    in_data_3 = self.conn.recv(SIZE)
+                    in_data_3 = receive_msg(self.conn)
                     self.progress_bar(100,0,0)
-                    response_3: dict = Encoder.decode(in_data_3)
+                    response_3: dict = self.encoder.decode(in_data_3)
                     response_cmd_3: ResCode = response_3[KeyData.CMD]
                     if response_cmd_3 == ResCode.OK:
                         self.app_print("File  uploaded successfully.")
+                        self.app_print(Compression.stats_str(stats))
                     else:
                         self.app_error(response_cmd_3)
 
@@ -130,15 +163,16 @@ class ClientInterface(ABC):
 
                     if local_dir is None:
                         self.app_print("Canceled Download")
+                        continue
 
                     # Request download from server
-                    out_dict: dict = {KeyData.REL_PATHS: server_files}
-                    out_data: bytes = Encoder.encode(out_dict, Command.DOWNLOAD)
-                    self.conn.send(out_data)
+                    out_dict: dict = {KeyData.REL_PATHS: server_files, KeyData.STRIPES: self.tuner.count()}
+                    out_data: bytes = self.encoder.encode(out_dict, Command.DOWNLOAD)
+                    send_msg(self.conn, out_data)
 
                     # Receive server response with file info
-                    in_data_1 = self.conn.recv(SIZE)
-                    response_1: dict = Encoder.decode(in_data_1)
+                    in_data_1 = receive_msg(self.conn)
+                    response_1: dict = self.encoder.decode(in_data_1)
                     response_cmd_1: ResCode = response_1[KeyData.CMD]
 
                     if response_cmd_1 != ResCode.OK:
@@ -149,14 +183,25 @@ class ClientInterface(ABC):
                     # Get file info from response
                     byte_file: int = response_1[KeyData.BYTES]
 
+                    if response_1.get(KeyData.TRANSFER_ID):
+                        # a large file sent as ranges over this and extra data connections, resumable
+                        self.app_print("Downloading")
+                        file_path: Path = local_dir / Path(response_1[KeyData.FILE_NAME]).name
+                        succeeded: bool = self.download_striped(file_path, byte_file, response_1)
+                    else:
                         # Send OK to start receiving file
-                    ok_data: bytes = Encoder.encode({}, ResCode.OK)
-                    self.conn.send(ok_data)
+                        ok_data: bytes = self.encoder.encode({}, ResCode.OK)
+                        send_msg(self.conn, ok_data)
 
-                    # Receive the file
-                    self.app_print("Downloading")
+                        # Receive the file
+                        self.app_print("Downloading")
 
-                    succeeded: bool = Transfer.recv_file(self.conn, local_dir, byte_file, self.progress_bar)
+                        if response_1.get(KeyData.RAW):
+                            # a single file sent as is, written into a preallocated file
+                            file_path: Path = local_dir / Path(response_1[KeyData.FILE_NAME]).name
+                            succeeded: bool = Transfer.recv_raw(self.conn, file_path, byte_file, self.progress_bar)
+                        else:
+                            succeeded: bool = Transfer.recv_file(self.conn, local_dir, byte_file, self.progress_bar)
 
                     if succeeded:
                         self.app_print(f"File downloaded successfully to {local_dir}")
@@ -170,13 +215,13 @@ class ClientInterface(ABC):
                         self.app_print("Exited out of CD")
                         continue
 
-                    out_data: bytes = Encoder.encode({KeyData.REL_PATH: selected_path}, Command.CD)
+                    out_data: bytes = self.encoder.encode({KeyData.REL_PATH: selected_path}, Command.CD)
                     # send to data to the server
-                    self.conn.send(out_data)
+                    send_msg(self.conn, out_data)
 
                     # receive server response if it is a valid directory
-                    in_data = self.conn.recv(SIZE)
-                    response: dict = Encoder.decode(in_data)
+                    in_data = receive_msg(self.conn)
+                    response: dict = self.encoder.decode(in_data)
                     response_cmd: ResCode = response[KeyData.CMD]
                     if response_cmd == ResCode.OK:
                         self.current_dir = selected_path
@@ -191,13 +236,13 @@ class ClientInterface(ABC):
                         self.app_print("Exited out of MKDIR")
                         continue
 
-                    out_data: bytes = Encoder.encode({KeyData.REL_PATH: selected_path}, Command.MKDIR)
+                    out_data: bytes = self.encoder.encode({KeyData.REL_PATH: selected_path}, Command.MKDIR)
                     # send to data to the server
-                    self.conn.send(out_data)
+                    send_msg(self.conn, out_data)
 
                     # receive server response if it is a valid directory
-                    in_data = self.conn.recv(SIZE)
-                    response: dict = Encoder.decode(in_data)
+                    in_data = receive_msg(self.conn)
+                    response: dict = self.encoder.decode(in_data)
                     response_cmd: ResCode = response[KeyData.CMD]
                     if response_cmd == ResCode.OK:
                         self.app_print(f"Added directory {selected_path}")
@@ -210,15 +255,14 @@ class ClientInterface(ABC):
                     else:
                         selected_paths = [self.select_server_dir(True)]
 
-                    for selected_path in selected_paths:
-                        if selected_path is None:
-                            self.app_print(f"Exited out of {in_cmd.name}")
-                            continue
-                        out_data: bytes = Encoder.encode({KeyData.REL_PATH:selected_path}, Command.DELETE)
-                        self.conn.send(out_data)
+                    if None in selected_paths:
+                        self.app_print(f"Exited out of {in_cmd.name}")
+                    selected_paths = [selected_path for selected_path in selected_paths if selected_path is not None]
 
-                        in_data = self.conn.recv(SIZE)
-                        response: dict = Encoder.decode(in_data)
+                    # every delete is sent before the replies are read, a selection costs one round trip
+                    responses: list[dict] = self.pipeline(
+                        [({KeyData.REL_PATH: selected_path}, Command.DELETE) for selected_path in selected_paths])
+                    for selected_path, response in zip(selected_paths, responses):
                         response_cmd: ResCode = response[KeyData.CMD]
                         if response_cmd == ResCode.OK:
                             self.app_print(f"Deleted resource {selected_path}")
@@ -226,11 +270,11 @@ class ClientInterface(ABC):
                             self.app_error(response_cmd)
 
                 case Command.STATS:
-                    out_data: bytes = Encoder.encode({}, Command.STATS)
-                    self.conn.send(out_data)
+                    out_data: bytes = self.encoder.encode({}, Command.STATS)
+                    send_msg(self.conn, out_data)
 
-                    in_data_2 = self.conn.recv(SIZE)
-                    response_2: dict = Encoder.decode(in_data_2)
+                    in_data_2 = receive_msg(self.conn)
+                    response_2: dict = self.encoder.decode(in_data_2)
                     response_cmd_2: ResCode = response_2[KeyData.CMD]
                     if response_cmd_2 != ResCode.OK:
                         self.app_error(response_cmd_2)
@@ -252,44 +296,375 @@ class ClientInterface(ABC):
         self.conn.close()  ## close the connection
         self.app_exit()
 
+    def list_pages(self, cmd: Command, filters: dict | None = None, limit: int = 0) -> None:
+        """
+        Requests the DIR/TREE listing or the SEARCH results a page at a time and shows every page as it arrives.
+        Stops after limit entries or LISTING_LIMIT if limit is 0, the cursor of the last page would continue from there.
+        """
+        cursor: str = ""
+        shown: int = 0
+        limit = limit or self.sett.LISTING_LIMIT
+        while True:
+            out_dict: dict = {
+                KeyData.REL_PATH: copy.deepcopy(self.current_dir),
+                KeyData.CURSOR: cursor,
+                KeyData.LIMIT: min(PAGE_SIZE, limit - shown) if limit else PAGE_SIZE,
+                **(filters or {}),
+            }
+            send_msg(self.conn, self.encoder.encode(out_dict, cmd))
+
+            encoded_data: bytes = receive_msg(self.conn)
+            response: dict = self.encoder.decode(encoded_data)
+
+            response_cmd: ResCode = response[KeyData.CMD]
+            if response_cmd != ResCode.OK:
+                self.app_error(response_cmd)
+                return
+
+            in_paths: list[RelativePath] = response.get(KeyData.REL_PATHS) or []
+            if not in_paths and not cursor:
+                self.app_print("No matching files" if cmd == Command.SEARCH else "Directory is Empty")
+            self.show_dir(in_paths, not cursor)
+            shown += len(in_paths)
+
+            cursor = response.get(KeyData.CURSOR, "")
+            if not cursor:
+                return
+            if limit and shown >= limit:
+                self.app_print(f"Showing the first {shown} entries, raise "
+                               f"{'the limit' if cmd == Command.SEARCH else 'LISTING_LIMIT'} to see the rest")
+                return
+
     def verify_resource(self, is_dir: bool|None, exists: bool, rel_path: RelativePath) -> ResCode:
         out_dict = {KeyData.IS_DIR: is_dir, KeyData.EXISTS: exists, KeyData.REL_PATH: rel_path}
-        out_data: bytes = Encoder.encode(out_dict, Command.VERIFY_RES)
-        self.conn.send(out_data)
+        out_data: bytes = self.encoder.encode(out_dict, Command.VERIFY_RES)
+        send_msg(self.conn, out_data)
 
-        in_data = self.conn.recv(SIZE)
-        response: dict = Encoder.decode(in_data)
+        in_data = receive_msg(self.conn)
+        response: dict = self.encoder.decode(in_data)
         response_cmd: ResCode = response[KeyData.CMD]
 
         return response_cmd
 
-    def connect_helper(self) -> None:
-        self.welcome_connection()
-        while True:
-            ip, port = self.get_connection()
-            if port.isdigit() and self.sett.set_client_addr(ip, int(port) & 0xFFFF):
-                break
+    def verify_resources(self, checks: list[tuple[RelativePath, bool | None, bool]]) -> list[ResCode]:
+        """
+        Checks a whole selection like verify_resource, one round trip for up to MAX_CHECKS paths.
+
+        Args:
+            checks: (rel_path, is_dir, exists) of every path, is_dir None accepts a file or a directory
+
+        Returns:
+            The result of every check in order, every check of a request the server refused gets its error
+        """
+        batches: list[list[tuple[RelativePath, bool | None, bool]]] = [
+            checks[start:start + MAX_CHECKS] for start in range(0, len(checks), MAX_CHECKS)]
+        responses: list[dict] = self.pipeline(
+            [({KeyData.CHECKS: [[rel_path, is_dir, exists] for rel_path, is_dir, exists in batch]}, Command.VERIFY_RES)
+             for batch in batches])
+
+        results: list[ResCode] = []
+        for batch, response in zip(batches, responses):
+            if response[KeyData.CMD] != ResCode.OK:
+                results += [response[KeyData.CMD]] * len(batch)
+            else:
+                results += [ResCode(code) for code in response[KeyData.RESULTS]]
+        return results
+
+    def pipeline(self, requests: list[tuple[dict, Command]]) -> list[dict]:
+        """
+        Sends requests that get a single reply without waiting for each reply, up to PIPELINE_DEPTH
+        ahead, so they cost about one round trip together. The server answers in order, a server that
+        echoes request IDs has every reply checked against its request.
+
+        Args:
+            requests: (out_dict, command) of every request
+
+        Returns:
+            The responses in the order of the requests
+        """
+        responses: list[dict] = []
+        in_flight: deque[int | None] = deque()
+
+        def receive() -> None:
+            response: dict = self.encoder.decode(receive_msg(self.conn))
+            req_id: int | None = in_flight.popleft()
+            if req_id is not None and response.get(KeyData.REQ_ID) != req_id:
+                raise DecodeError(f"reply to request {response.get(KeyData.REQ_ID)} instead of {req_id}")
+            responses.append(response)
+
+        for out_dict, cmd in requests:
+            if len(in_flight) == PIPELINE_DEPTH:
+                receive()
+            req_id: int | None = self.encoder.new_request_id()
+            if req_id is not None:
+                out_dict = {**out_dict, KeyData.REQ_ID: req_id}
+            send_msg(self.conn, self.encoder.encode(out_dict, cmd))
+            in_flight.append(req_id)
+        while in_flight:
+            receive()
+        return responses
+
+    def link_stored(self, client_paths: list[tuple[Path, str]]) -> set[str]:
+        """
+        Offers the SHA-256 of every large file of the upload, the server links the ones
+        it already stores into the current directory.
+        Returns: Names of the files that do not have to be sent
+        """
+        offers: list[list] = []
+        for client_path, file_name in client_paths:
+            for file_path, arcname in BlobStore.candidates(client_path, file_name):
+                offers.append([arcname, BlobStore.file_digest(file_path), file_path.stat().st_size])
+        if not offers:
+            return set()
+
+        out_dict: dict = {KeyData.REL_PATH: self.current_dir, KeyData.DIGESTS: offers}
+        send_msg(self.conn, self.encoder.encode(out_dict, Command.DEDUP))
+        response: dict = self.encoder.decode(receive_msg(self.conn))
+        if response[KeyData.CMD] != ResCode.OK:
+            return set()  # the upload itself reports the problem
+
+        linked: set[str] = set(response.get(KeyData.DIGESTS, []))
+        if linked:
+            self.app_print(f"{len(linked)} file(s) already on the server, linked instead of sent")
+        return linked
+
+    def upload_deltas(self, client_paths: list[tuple[Path, str]], skip: set[str]) -> set[str]:
+        """
+        Sends the selected files that already exist on the server as deltas against the server's copy.
+        Returns: Names of the files that were updated and do not have to be sent whole
+        """
+        updated: set[str] = set()
+        if not self.sett.DELTA_SYNC:
+            return updated
+
+        candidates: list[tuple[Path, str]] = [
+            (client_path, file_name) for client_path, file_name in client_paths
+            if file_name not in skip and client_path.is_file() and client_path.stat().st_size >= DELTA_MIN_SIZE]
+        # the same check that asks to rename an existing file, here an existing file is wanted
+        results: list[ResCode] = self.verify_resources(
+            [(self.current_dir / file_name, False, True) for _, file_name in candidates])
+
+        for (client_path, file_name), result in zip(candidates, results):
+            if result == ResCode.OK and self.upload_delta(client_path, file_name):
+                updated.add(file_name)
+        return updated
+
+    def upload_delta(self, client_path: Path, file_name: str) -> bool:
+        """
+        Updates the server's copy of file_name to client_path by sending only what changed.
+        Returns: False if the file has to be uploaded whole instead
+        """
+        num_bytes: int = client_path.stat().st_size
+        out_dict: dict = {
+            KeyData.REL_PATH: self.current_dir,
+            KeyData.BYTES: num_bytes,
+            KeyData.FILE_NAME: file_name,
+            KeyData.DELTA: True,
+        }
+        send_msg(self.conn, self.encoder.encode(out_dict, Command.UPLOAD))
+
+        # receives an OK with the block signatures of the server's copy
+        response: dict = self.encoder.decode(receive_msg(self.conn))
+        if response[KeyData.CMD] != ResCode.OK:
+            return False
 
-        self.sett.save_changes()
+        ops: list | None = Delta.diff(client_path, response[KeyData.SIGNATURES], response[KeyData.BLOCK_SIZE])
+        if ops is None:
+            send_msg(self.conn, self.encoder.encode({}, ResCode.CANCEL))
+            return False
+        send_msg(self.conn, self.encoder.encode({}, ResCode.OK))
+
+        self.app_print(f"Updating {file_name}, sending {format_bytes(Delta.literal_bytes(ops))} "
+                       f"of {format_bytes(num_bytes)} ...")
+        Transfer.send_delta(self.conn, client_path, ops, num_bytes, self.progress_bar)
+
+        # the server answers once the new version replaced the old one
+        response_2: dict = self.encoder.decode(receive_msg(self.conn))
+        self.progress_bar(100, 0, num_bytes)
+        if response_2[KeyData.CMD] != ResCode.OK:
+            self.app_error_print(f"Updating {file_name} failed, sending the whole file")
+            return False
+        self.app_print("File  uploaded successfully.")
+        return True
 
-        self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.conn.connect(self.sett.CLIENT_ADDR)
-        self.print_connection_success()
+    @staticmethod
+    def is_striped(client_path: Path) -> bool:
+        """True if an upload of client_path alone is sent raw as ranges, striped and resumable"""
+        return (client_path.is_file() and client_path.stat().st_size >= STRIPE_MIN_SIZE
+                and Compression.is_incompressible(client_path))
+
+    def open_stripe(self, transfer_id: str) -> socket.socket | None:
+        """Opens a data connection and attaches it to a striped transfer, None if the server refused it"""
+        try:
+            conn = socket.create_connection(self.sett.CLIENT_ADDR)
+        except OSError:
+            return None
+
+        try:
+            encoder = Encoder()  # a data connection only exchanges the attach message, no handshake
+            out_dict: dict = {KeyData.AUTH_TOKEN: self.sett.AUTH_KEY, KeyData.TRANSFER_ID: transfer_id}
+            send_msg(conn, encoder.encode(out_dict, Command.STRIPE))
+            response: dict = encoder.decode(receive_msg(conn))
+            if response[KeyData.CMD] == ResCode.OK:
+                return conn
+        except (OSError, DecodeError):
+            pass
+        conn.close()
+        return None
+
+    def run_stripes(self, transfer_id: str, stripes: int, work, progress: StripeProgress) -> list:
+        """
+        Runs work(conn) on the control connection and on stripes - 1 data connections in parallel.
+        A data connection that can not be opened is left out, the others take over its ranges.
+        Returns: The results of work, the control connection first and None for missing data connections
+        """
+        results: list = [None] * stripes
+
+        def data_connection(num: int) -> None:
+            conn: socket.socket | None = self.open_stripe(transfer_id)
+            if conn is None:
+                return
+            with conn:
+                results[num] = work(conn)
+
+        threads: list[threading.Thread] = [threading.Thread(target=data_connection, args=(num,), daemon=True)
+                                           for num in range(1, stripes)]
+        for thread in threads:
+            thread.start()
+
+        results[0] = work(self.conn)
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.2)
+                progress.report()
+        return results
+
+    def upload_striped(self, client_path: Path, file_name: str) -> None:
+        stat = client_path.stat()
+        num_bytes: int = stat.st_size
+        out_dict: dict = {
+            KeyData.REL_PATH: self.current_dir,
+            KeyData.BYTES: num_bytes,
+            KeyData.FILE_NAME: file_name,
+            KeyData.RAW: True,
+            KeyData.STRIPES: self.tuner.count(),
+            KeyData.VERSION: stat.st_mtime_ns,
+        }
+        send_msg(self.conn, self.encoder.encode(out_dict, Command.UPLOAD))
+
+        # receives an OK with the id the data connections attach with and the ranges the server kept
+        response: dict = self.encoder.decode(receive_msg(self.conn))
+        if response[KeyData.CMD] != ResCode.OK:
+            self.app_error(response[KeyData.CMD])
+            return
 
-        # go to verify user
-        self.verify_userpass()
+        # only ranges that match this file are skipped, the server drops the others
+        verified: list[list[int]] = Checkpoint.verify(client_path, response.get(KeyData.RANGES, []))
+        send_msg(self.conn, self.encoder.encode({KeyData.RANGES: verified}, ResCode.OK))
+        kept: int = Checkpoint.covered_bytes(verified)
+
+        stripes: int = response[KeyData.STRIPES]
+        if kept:
+            self.app_print(f"Resuming upload at {format_bytes(kept)} of {format_bytes(num_bytes)}")
+        self.app_print(f"Uploading over {stripes} connections ...")
+        start_time: float = time.perf_counter()
+        queue = RangeQueue(num_bytes, verified)
+        progress = StripeProgress(num_bytes, self.progress_bar)
+        progress.add(kept)
+        self.run_stripes(response[KeyData.TRANSFER_ID], stripes,
+                         lambda conn: Transfer.send_ranges(conn, client_path, queue, progress), progress)
+
+        # the server answers once every range arrived
+        response_2: dict = self.encoder.decode(receive_msg(self.conn))
+        self.progress_bar(100, 0, num_bytes)
+        if response_2[KeyData.CMD] == ResCode.OK:
+            self.tuner.record(stripes, num_bytes - kept, time.perf_counter() - start_time)
+            self.app_print("File  uploaded successfully.")
+        else:
+            self.app_error(response_2[KeyData.CMD])
+
+    def download_striped(self, file_path: Path, num_bytes: int, info: dict) -> bool:
+        """
+        Receives a download sent as ranges into a partial file next to file_path.
+        A checkpoint of the partial file is kept when the transfer breaks, downloading the
+        same version of the file again only receives the missing ranges.
+        """
+        Checkpoint.collect_stale(file_path.parent, self.sett.PARTIAL_TTL_HOURS * 3600)
+        try:
+            checkpoint: Checkpoint = Checkpoint.load(file_path.with_name(file_path.name + PART_SUFFIX),
+                                                     num_bytes, info[KeyData.VERSION])
+        except OSError as e:
+            send_msg(self.conn, self.encoder.encode({}, ResCode.CANCEL))
+            self.app_error_print(f"Could not create {file_path}: {e}")
+            return False
+
+        # Send OK to start receiving file, with the ranges already on disk
+        send_msg(self.conn, self.encoder.encode({KeyData.RANGES: checkpoint.committed()}, ResCode.OK))
+
+        # the server answers with the ranges that match its copy, the rest is sent again
+        response: dict = self.encoder.decode(receive_msg(self.conn))
+        kept: int = checkpoint.keep(response.get(KeyData.RANGES, []))
+        if kept:
+            self.app_print(f"Resuming download at {format_bytes(kept)} of {format_bytes(num_bytes)}")
+
+        start_time: float = time.perf_counter()
+        stripes: int = info[KeyData.STRIPES]
+        progress = StripeProgress(num_bytes, self.progress_bar)
+        progress.add(kept)
+        self.run_stripes(info[KeyData.TRANSFER_ID], stripes,
+                         lambda conn: Transfer.recv_ranges(conn, checkpoint.part_path, num_bytes, progress,
+                                                           checkpoint.commit),
+                         progress)
+        self.progress_bar(100, 0, num_bytes)
+
+        if not checkpoint.complete():
+            return False
+        checkpoint.finish(file_path)
+        self.tuner.record(stripes, num_bytes - kept, time.perf_counter() - start_time)
+        return True
+
+    def connect_helper(self) -> None:
+        while True:
+            self.welcome_connection()
+            while True:
+                ip, port = self.get_connection()
+                if port.isdigit() and self.sett.set_client_addr(ip, int(port) & 0xFFFF):
+                    break
+
+            self.sett.save_changes()
+
+            self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.conn.connect(self.sett.CLIENT_ADDR)
+            self.encoder = Encoder()  # a new connection starts on the default codec until the handshake
+            self.print_connection_success()
+
+            try:
+                # go to verify user
+                self.verify_userpass()
+                return
+            except ConnectionRefusedError:
+                # the server is saturated and answered the first request with SERVER_NOT_READY
+                self.conn.close()
+                self.app_error(ResCode.SERVER_NOT_READY)
+
+    @staticmethod
+    def check_admitted(response_cmd: ResCode) -> None:
+        """Raises ConnectionRefusedError if the server turned the connection away"""
+        if response_cmd == ResCode.SERVER_NOT_READY:
+            raise ConnectionRefusedError(ResCode.SERVER_NOT_READY.desc)
 
     def verify_token(self) -> bool:
         if self.sett.AUTH_KEY == "":
             return False
 
         out_dict = {KeyData.AUTH_TOKEN: self.sett.AUTH_KEY}
-        out_data: bytes = Encoder.encode(out_dict, Command.VERIFY_AUTH)
-        self.conn.send(out_data)
+        out_data: bytes = self.encoder.encode(out_dict, Command.VERIFY_AUTH)
+        send_msg(self.conn, out_data)
 
-        in_data = self.conn.recv(SIZE)
-        response: dict = Encoder.decode(in_data)
+        in_data = receive_msg(self.conn)
+        response: dict = self.encoder.decode(in_data)
         response_cmd: ResCode = response[KeyData.CMD]
+        self.check_admitted(response_cmd)
 
         return response_cmd == ResCode.OK
 
@@ -305,12 +680,18 @@ class ClientInterface(ABC):
             username, password = self.get_login()
 
             out_dict = {KeyData.USER_NAME: username, KeyData.PASSWORD: password}
-            out_data: bytes = Encoder.encode(out_dict, Command.VERIFY_PAS)
-            self.conn.send(out_data)
-
-            in_data = self.conn.recv(SIZE)
-            response: dict = Encoder.decode(in_data)
-            response_cmd: ResCode = response[KeyData.CMD]
+            # too many logins are checked on the server, it answers SERVER_NOT_READY until one is free
+            for retry in range(LOGIN_RETRIES + 1):
+                out_data: bytes = self.encoder.encode(out_dict, Command.VERIFY_PAS)
+                send_msg(self.conn, out_data)
+
+                in_data = receive_msg(self.conn)
+                response: dict = self.encoder.decode(in_data)
+                response_cmd: ResCode = response[KeyData.CMD]
+                if response_cmd != ResCode.SERVER_NOT_READY or retry == LOGIN_RETRIES:
+                    break
+                time.sleep(LOGIN_RETRY_DELAY * 2 ** retry)
+            self.check_admitted(response_cmd)
 
             if response_cmd == ResCode.OK:
                 self.sett.AUTH_KEY = str(response[KeyData.AUTH_TOKEN])
@@ -378,7 +759,13 @@ class ClientInterface(ABC):
         pass
 
     @abstractmethod
-    def show_dir(self, rel_paths: list[RelativePath]) -> None:
+    def show_dir(self, rel_paths: list[RelativePath], first_page: bool = True) -> None:
+        """Shows a page of a listing, later pages are added to the first one"""
+        pass
+
+    @abstractmethod
+    def get_search_query(self) -> str | None:
+        """Returns the query of a SEARCH as typed (search.py), None or empty to cancel"""
         pass
 
     @abstractmethod
@@ -0,0 +1,136 @@
+"""
+Chooses the zip codec of every file in an upload or download. Media and archives are
+already compressed, deflating them again burns CPU for no gain, so each file is checked
+by extension, then by magic bytes and finally by trial compressing a small sample.
+Incompressible files are stored, the rest deflated at a level that suits the sample.
+"""
+import os
+import zlib
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+
+from zipstream import ZipStream
+
+from type import format_bytes
+
+COMPRESSED_SUFFIXES = frozenset({
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".zst",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp3", ".aac", ".m4a", ".ogg", ".opus", ".flac",
+    ".mp4", ".m4v", ".mkv", ".mov", ".avi", ".webm",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".jar", ".apk",
+})
+
+# (offset, signature) of compressed formats, for files with a missing or misleading extension
+MAGIC_NUMBERS: tuple[tuple[int, bytes], ...] = (
+    (0, b"PK\x03\x04"),  # zip, docx, jar
+    (0, b"\x1f\x8b"),  # gzip
+    (0, b"BZh"),  # bzip2
+    (0, b"\xfd7zXZ\x00"),  # xz
+    (0, b"7z\xbc\xaf\x27\x1c"),  # 7z
+    (0, b"Rar!"),  # rar
+    (0, b"\x28\xb5\x2f\xfd"),  # zstd
+    (0, b"\x89PNG"),  # png
+    (0, b"\xff\xd8\xff"),  # jpeg
+    (0, b"GIF8"),  # gif
+    (0, b"ID3"),  # mp3 with tags
+    (0, b"\xff\xfb"),  # mp3 frame
+    (0, b"OggS"),  # ogg, opus
+    (0, b"fLaC"),  # flac
+    (0, b"\x1a\x45\xdf\xa3"),  # mkv, webm
+    (4, b"ftyp"),  # mp4, mov, m4a, heic
+    (8, b"WEBP"),  # webp
+    (8, b"AVI "),  # avi
+)
+
+MAGIC_SIZE = 16  # bytes read to match MAGIC_NUMBERS
+SAMPLE_SIZE = 64 * 1024  # bytes trial compressed, taken from the middle of the file
+STORE_RATIO = 0.9  # a sample that does not shrink below this ratio is stored
+FAST_RATIO = 0.6  # above this ratio a higher level gains little, deflate at level 1
+SMALL_FILE = 4 * 1024  # not worth sniffing, compressed at the requested level
+
+
+class Compression:
+    @staticmethod
+    def choose(file_path: Path, level: int) -> tuple[int, int | None]:
+        """
+        Picks the codec for one file.
+
+        Args:
+            file_path: The file that will be added to the zip
+            level: Deflate level to use for well compressible data
+
+        Returns:
+            (compress_type, compress_level) to pass to ZipStream.add_path
+        """
+        if file_path.suffix.lower() in COMPRESSED_SUFFIXES:
+            return ZIP_STORED, None
+
+        try:
+            size: int = file_path.stat().st_size
+            if size <= SMALL_FILE:
+                return ZIP_DEFLATED, level
+
+            with open(file_path, "rb") as file:
+                head: bytes = file.read(MAGIC_SIZE)
+                if any(head[offset:offset + len(magic)] == magic for offset, magic in MAGIC_NUMBERS):
+                    return ZIP_STORED, None
+
+                file.seek(max(0, size // 2 - SAMPLE_SIZE // 2))
+                sample: bytes = file.read(SAMPLE_SIZE)
+        except OSError:
+            return ZIP_DEFLATED, level  # let the zip stream report the error
+
+        ratio: float = len(zlib.compress(sample, 1)) / max(len(sample), 1)
+        if ratio >= STORE_RATIO:
+            return ZIP_STORED, None
+        if ratio >= FAST_RATIO:
+            return ZIP_DEFLATED, 1
+        return ZIP_DEFLATED, level
+
+    @staticmethod
+    def is_incompressible(file_path: Path) -> bool:
+        """True for files that would be stored, zipping them only costs CPU"""
+        return Compression.choose(file_path, 1)[0] == ZIP_STORED
+
+    @staticmethod
+    def add_path(zs: ZipStream, path: Path, arcname: str, level: int, skip: set[str] = frozenset()) -> None:
+        """
+        Adds a file or a whole directory to the zip stream with a codec chosen per file.
+        Directories are walked here instead of by ZipStream so every file gets its own codec,
+        empty directories are kept. Files whose arcname is in skip are left out.
+        """
+        if arcname in skip:
+            return
+        if not path.is_dir():
+            compress_type, compress_level = Compression.choose(path, level)
+            zs.add_path(path, arcname, recurse=False, compress_type=compress_type, compress_level=compress_level)
+            return
+
+        zs.add_path(path, arcname, recurse=False)
+        with os.scandir(path) as entries:
+            children: list[str] = sorted(entry.name for entry in entries)
+        for child in children:
+            Compression.add_path(zs, path / child, f"{arcname}/{child}", level, skip)
+
+    @staticmethod
+    def stats(zs: ZipStream, cpu_time: float) -> dict[str, float]:
+        """Totals of a finished zip stream: files, stored files, bytes before and after and CPU seconds"""
+        files: list[dict] = [info for info in zs.info_list() if not info["is_dir"]]
+        size: int = sum(info["size"] or 0 for info in files)
+        compressed: int = sum(info["compressed_size"] or 0 for info in files)
+        return {
+            "files": len(files),
+            "stored": sum(1 for info in files if info["compress_type"] == ZIP_STORED),
+            "bytes": size,
+            "bytes_saved": size - compressed,
+            "cpu_time": cpu_time,
+        }
+
+    @staticmethod
+    def stats_str(stats: dict[str, float]) -> str:
+        saved_pct: float = 100 * stats["bytes_saved"] / stats["bytes"] if stats["bytes"] else 0.0
+        return (f"{stats['files']} files ({stats['stored']} stored as is) | "
+                f"{format_bytes(stats['bytes_saved'])} saved ({saved_pct:.1f}%) | "
+                f"{stats['cpu_time']:.2f} s CPU")
+
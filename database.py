@@ -1,7 +1,45 @@
+import queue
 import sqlite3
+import time
 import bcrypt  # 72-character limit
 import jwt
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+from metrics import Metrics
+from rollup import DAY, HOUR, KEEP, QUANTILES, rollups
+from sketch import Sketch
+from tokens import TOKEN_CACHE, TokenCache, token_digest
+
+POOL_SIZE = 8  # idle connections kept open, a busy server opens more and closes them again
+BUSY_TIMEOUT = 10.0  # seconds a write waits for another connection's write to finish
+STATEMENT_CACHE = 256  # compiled statements kept per connection, looked up by their SQL text
+FILES_BATCH = 500  # paths looked up by one query of get_files, below SQLite's limit of 999 parameters
+
+# the SQL is constant text so every connection compiles it once and finds it in its statement cache
+USER_LOGIN = "SELECT ID, password_hash FROM users WHERE username = ?"
+ADD_STATISTICS = """
+                 INSERT INTO statistics (user_id, command, bytes, upload_rate, download_rate, transfer_time,
+                                         response_time, timestamp)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                 """
+GET_ROLLUP = """
+             SELECT count, total, sketch
+             FROM statistics_rollup
+             WHERE period = ? AND user_id = ? AND start = ? AND metric = ?
+             """
+PUT_ROLLUP = "INSERT OR REPLACE INTO statistics_rollup VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+
+def timestamp(seconds: float) -> str:
+    """A time of the statistics table, written like CURRENT_TIMESTAMP in UTC, with milliseconds, so both sort together"""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds)) + f".{int(seconds % 1 * 1000):03d}"
+
+
+def check_password(password: str, stored_hash: bytes) -> bool:
+    """bcrypt check of a password, a module function so a process pool can run it (auth.py)"""
+    return bcrypt.checkpw(password.encode('utf-8'), stored_hash)
 
 
 class DataStorage():
@@ -10,64 +48,154 @@ class DataStorage():
     store username and passwords, be able to verify users
     Store/retrieve network statistics, such as upload/download data rates, file transfer times
     and system response times
+    Keep an index of the files in the server directory (fileindex.py)
+
+    Every handler thread of the server uses it at the same time, so each call borrows a
+    connection of its own from a pool. The database is in WAL mode: readers never wait and
+    do not block the one writer, writers wait up to BUSY_TIMEOUT for each other.
+    No connection is held while bcrypt runs, the server runs it in a pool of its own (auth.py).
+    Verified tokens are cached (tokens.py), only a token seen for the first time is decoded.
     """
 
-    def __init__(self, jwt_secret_key: str):
+    def __init__(self, jwt_secret_key: str, db_path: str = 'data.db', metrics: Metrics | None = None,
+                 token_cache: int = TOKEN_CACHE):
         self.jwt_secret_key = jwt_secret_key
-        self.conn = sqlite3.connect('data.db', check_same_thread=False)
-        self.cursor = self.conn.cursor()
-        self.cursor.execute("""
-                            CREATE TABLE IF NOT EXISTS users
-                            (
-                                ID            integer PRIMARY KEY AUTOINCREMENT,
-                                username      TEXT UNIQUE,
-                                password_hash BLOB
-                            )
-                            """
-                            )
-        self.conn.commit()
-
-        self.cursor.execute("""
-                            CREATE TABLE IF NOT EXISTS statistics
-                            (
-                                ID            INTEGER PRIMARY KEY AUTOINCREMENT,
-                                user_id       INTEGER,
-                                upload_rate   REAL,
-                                download_rate REAL,
-                                transfer_time REAL,
-                                response_time REAL,
-                                timestamp     DATETIME DEFAULT CURRENT_TIMESTAMP,
-                                FOREIGN KEY (user_id) REFERENCES users (ID)
-                            )
-                            """)
-        self.conn.commit()
-
-    def _verify_credentials(self, username: str, password: str) -> bool:
-        """Internal method to verify username and password."""
-        self.cursor.execute("SELECT password_hash FROM users WHERE username = ?", (username,))
-        row = self.cursor.fetchone()
-
-        if row:
-            stored_hash = row[0]
-            if isinstance(stored_hash, str):
-                stored_hash = stored_hash.encode('utf-8')
-            return bcrypt.checkpw(password.encode('utf-8'), stored_hash)
-
-        # if no user is found
-        else:
-            return False
+        self.db_path: str = db_path
+        self.pool: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue(POOL_SIZE)
+        self.tokens = TokenCache(token_cache, metrics)
+        self.user_ids: dict[str, int] = {}  # username -> ID, cleared by delete_user
+
+        with self.connection() as conn, conn:
+            # persistent, every later connection to the file uses it
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                         CREATE TABLE IF NOT EXISTS users
+                         (
+                             ID            integer PRIMARY KEY AUTOINCREMENT,
+                             username      TEXT UNIQUE,
+                             password_hash BLOB
+                         )
+                         """
+                         )
+
+            conn.execute("""
+                         CREATE TABLE IF NOT EXISTS statistics
+                         (
+                             ID            INTEGER PRIMARY KEY AUTOINCREMENT,
+                             user_id       INTEGER,
+                             upload_rate   REAL,
+                             download_rate REAL,
+                             transfer_time REAL,
+                             response_time REAL,
+                             timestamp     DATETIME DEFAULT CURRENT_TIMESTAMP,
+                             FOREIGN KEY (user_id) REFERENCES users (ID)
+                         )
+                         """)
+
+            # statistics of every command the server runs (recorder.py), older databases get the columns added
+            columns: set[str] = {row[1] for row in conn.execute("PRAGMA table_info(statistics)")}
+            if "command" not in columns:
+                conn.execute("ALTER TABLE statistics ADD COLUMN command TEXT")
+            if "bytes" not in columns:
+                conn.execute("ALTER TABLE statistics ADD COLUMN bytes INTEGER")
+
+            # the latest rows of a user for get_statistics, the oldest rows for pruning
+            conn.execute("CREATE INDEX IF NOT EXISTS statistics_user ON statistics (user_id, timestamp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS statistics_time ON statistics (timestamp)")
+
+            # minute, hour and day rollups of the statistics (rollup.py), user_id 0 for the whole server
+            conn.execute("""
+                         CREATE TABLE IF NOT EXISTS statistics_rollup
+                         (
+                             period  INTEGER NOT NULL,
+                             user_id INTEGER NOT NULL,
+                             start   INTEGER NOT NULL,
+                             metric  TEXT    NOT NULL,
+                             count   INTEGER NOT NULL,
+                             total   REAL    NOT NULL,
+                             sketch  BLOB    NOT NULL,
+                             PRIMARY KEY (period, user_id, start, metric)
+                         ) WITHOUT ROWID
+                         """)
+
+            # path is relative to the server directory, the parent of a top level entry is ""
+            conn.execute("""
+                         CREATE TABLE IF NOT EXISTS files
+                         (
+                             path   TEXT PRIMARY KEY,
+                             parent TEXT    NOT NULL,
+                             name   TEXT    NOT NULL,
+                             size   INTEGER NOT NULL,
+                             mtime  REAL    NOT NULL,
+                             is_dir INTEGER NOT NULL
+                         ) WITHOUT ROWID
+                         """)
+            conn.execute("CREATE INDEX IF NOT EXISTS files_parent ON files (parent, name)")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_name ON files (name)")
+
+            # tokens refused before their exp, by SHA-256 digest
+            conn.execute("""
+                         CREATE TABLE IF NOT EXISTS revoked_tokens
+                         (
+                             digest BLOB PRIMARY KEY,
+                             exp    REAL NOT NULL
+                         ) WITHOUT ROWID
+                         """)
+            now: float = datetime.now(timezone.utc).timestamp()
+            conn.execute("DELETE FROM revoked_tokens WHERE exp <= ?", (now,))
+            for digest, exp in conn.execute("SELECT digest, exp FROM revoked_tokens"):
+                self.tokens.revoke(digest, exp)
+
+    def _connect(self) -> sqlite3.Connection:
+        # a pooled connection moves between threads, but only one uses it at a time
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE)
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent, a power loss may drop the last commits
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrows a connection for one call, "with self.connection() as conn, conn:" also runs a transaction"""
+        try:
+            conn: sqlite3.Connection = self.pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self.pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def credentials(self, username: str) -> tuple[int, bytes] | None:
+        """The user's ID and password hash to check a login against, None for an unknown user"""
+        with self.connection() as conn:
+            row = conn.execute(USER_LOGIN, (username,)).fetchone()
+        if not row:
+            return None
+
+        user_id, stored_hash = row
+        if isinstance(stored_hash, str):
+            stored_hash = stored_hash.encode('utf-8')
+        return user_id, stored_hash
+
+    def _verify_credentials(self, username: str, password: str) -> int | None:
+        """Internal method to verify username and password, returns the user's ID if they match."""
+        found: tuple[int, bytes] | None = self.credentials(username)
+        if found is None:
+            return None  # if no user is found
+        return found[0] if check_password(password, found[1]) else None
 
     def get_token(self, username: str, password: str):
         """Verify user credentials and return JWT token if successful, False otherwise."""
-        if not self._verify_credentials(username, password):
+        user_id: int | None = self._verify_credentials(username, password)
+        if user_id is None:
             return False
+        return self.issue_token(user_id, username)
 
-        # Get user ID
-        self.cursor.execute("SELECT ID FROM users WHERE username = ?", (username,))
-        row = self.cursor.fetchone()
-        user_id = row[0]
-
-        # Create JWT token
+    def issue_token(self, user_id: int, username: str) -> str:
+        """JWT token of a user whose password was checked"""
         payload = {
             'user_id': user_id,
             'username': username,
@@ -79,84 +207,297 @@ class DataStorage():
 
     def verify_token(self, token: str):
         """Verify JWT token and return payload if valid, False otherwise."""
+        digest: bytes = token_digest(token)
+        cached: dict | None | bool = self.tokens.get(digest)
+        if cached is not None:
+            return cached  # the payload, or False for a revoked token
+        generation: int = self.tokens.generation
+
         try:
             payload = jwt.decode(token, self.jwt_secret_key, algorithms=['HS256'])
-            return payload
         except jwt.ExpiredSignatureError:
             return False  # Token has expired
         except jwt.InvalidTokenError:
             return False  # Invalid token
 
+        # the token of a deleted user is refused, the cache is cleared by delete_user so it is checked again
+        with self.connection() as conn:
+            row = conn.execute("SELECT 1 FROM users WHERE ID = ? AND username = ?",
+                               (payload.get('user_id'), payload.get('username'))).fetchone()
+        if not row:
+            return False
+
+        self.tokens.put(digest, payload, generation)
+        return payload
+
+    def revoke_token(self, token: str) -> bool:
+        """Refuse a token before its exp, False if it was not valid anyway."""
+        payload = self.verify_token(token)
+        if not payload:
+            return False
+
+        digest: bytes = token_digest(token)
+        with self.connection() as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO revoked_tokens VALUES (?, ?)", (digest, payload['exp']))
+        self.tokens.revoke(digest, payload['exp'])
+        return True
+
+    def rotate_secret(self, jwt_secret_key: str) -> None:
+        """Sign tokens with a new secret, every token signed with the old one is refused from now on."""
+        self.jwt_secret_key = jwt_secret_key
+        self.tokens.clear()
+
     def create_user(self, username: str, password: str) -> bool:
 
         salt = bcrypt.gensalt()
         hashed_pw = bcrypt.hashpw(password.encode('utf-8'), salt)
 
         try:
-            self.cursor.execute("""
-                                INSERT INTO users (username, password_hash)
-                                VALUES (?, ?)
-                                """, (username, hashed_pw))
-            self.conn.commit()
+            with self.connection() as conn, conn:
+                conn.execute("""
+                             INSERT INTO users (username, password_hash)
+                             VALUES (?, ?)
+                             """, (username, hashed_pw))
             return True
         except sqlite3.IntegrityError:
             return False
 
     def delete_user(self, username: str) -> bool:
         """Delete a user by username."""
-        self.cursor.execute("DELETE FROM users WHERE username = ?", (username,))
-        self.conn.commit()
+        with self.connection() as conn, conn:
+            cursor = conn.execute("DELETE FROM users WHERE username = ?", (username,))
+        if cursor.rowcount > 0:
+            self.tokens.clear()  # their cached tokens are verified again, and refused
+            self.user_ids.pop(username, None)
 
         # how many affected rows
-        return self.cursor.rowcount > 0
+        return cursor.rowcount > 0
 
     def set_statistics(self, username: str, upload_rate: float, download_rate: float,
                        transfer_time: float, response_time: float) -> bool:
         """Store network performance metrics for a given user."""
-        # Get user ID
-        self.cursor.execute("SELECT ID FROM users WHERE username = ?", (username,))
-        row = self.cursor.fetchone()
-
-        if not row:
-            return False  # user not found
+        user_id: int | None = self.user_id(username)
+        if user_id is None:
+            return False  # nothing is stored for an unknown user
 
-        user_id = row[0]
-
-        self.cursor.execute("""
-                            INSERT INTO statistics (user_id, upload_rate, download_rate, transfer_time, response_time)
-                            VALUES (?, ?, ?, ?, ?)
-                            """, (user_id, upload_rate, download_rate, transfer_time, response_time))
-        self.conn.commit()
+        self.add_statistics([(user_id, None, 0, upload_rate, download_rate, transfer_time, response_time,
+                              time.time())])
         return True
 
-    def get_statistics(self, username: str, password: str) -> dict:
-        """Return the most recent network statistics for a verified user."""
-        if not self._verify_credentials(username, password):
-            return {"error": "Invalid username or password"}
-
-        self.cursor.execute("""
-                            SELECT s.upload_rate, s.download_rate, s.transfer_time, s.response_time, s.timestamp
-                            FROM statistics s
-                                     JOIN users u ON s.user_id = u.ID
-                            WHERE u.username = ?
-                            ORDER BY s.timestamp DESC
-                            LIMIT 1
-                            """, (username,))
-        row = self.cursor.fetchone()
+    def user_id(self, username: str) -> int | None:
+        """ID of a user, looked up once and kept until the user is deleted"""
+        user_id: int | None = self.user_ids.get(username)
+        if user_id is None:
+            with self.connection() as conn:
+                row = conn.execute("SELECT ID FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return None
+            user_id = self.user_ids[username] = row[0]
+        return user_id
+
+    def add_statistics(self, rows: list[tuple[int | None, str, int, float | None, float | None, float | None,
+                                              float | None, float]]) -> None:
+        """
+        Stores the statistics of many commands in one transaction.
+
+        Args:
+            rows: (user_id, command, bytes, upload_rate, download_rate, transfer_time, response_time, timestamp)
+                  of every command, timestamp in seconds since the epoch, user_id None before a login
+        """
+        sketches: dict[tuple[int, int, int, str], Sketch] = rollups(rows)
+        with self.connection() as conn, conn:
+            # the insert takes the write lock first, no other writer changes the rollups until the commit
+            conn.executemany(ADD_STATISTICS, [(*row[:7], timestamp(row[7])) for row in rows])
+            for (period, start, user_id, metric), sketch in sketches.items():
+                row = conn.execute(GET_ROLLUP, (period, user_id, start, metric)).fetchone()
+                if row:
+                    sketch.merge(Sketch.from_bytes(row[2], row[0], row[1]))
+                conn.execute(PUT_ROLLUP, (period, user_id, start, metric, sketch.count, sketch.total,
+                                          sketch.to_bytes()))
+
+    def rollup_sketches(self, user_id: int, period: int, since: float) -> dict[str, Sketch]:
+        """
+        The rollups of a period from since on merged into one Sketch per metric.
+        Reads one row per period and metric of the window, however long the history is.
+
+        Args:
+            user_id: The user's ID, 0 for the whole server (rollup.SERVER)
+            period: Seconds covered by a rollup row, one of rollup.PERIODS
+            since: Seconds since the epoch, the rollup that holds it is the first one read
+        """
+        sketches: dict[str, Sketch] = {}
+        with self.connection() as conn:
+            rows = conn.execute("""
+                                SELECT metric, count, total, sketch
+                                FROM statistics_rollup
+                                WHERE period = ? AND user_id = ? AND start >= ?
+                                """, (period, user_id, int(since // period * period))).fetchall()
+        for metric, count, total, data in rows:
+            sketch: Sketch = Sketch.from_bytes(data, count, total)
+            if metric in sketches:
+                sketches[metric].merge(sketch)
+            else:
+                sketches[metric] = sketch
+        return sketches
+
+    def prune_statistics(self, keep_seconds: float) -> int:
+        """
+        Deletes the statistics rows older than keep_seconds and the rollups past their rollup.KEEP,
+        returns how many rows were deleted. The day rollups are kept.
+        """
+        now: float = time.time()
+        with self.connection() as conn, conn:
+            deleted: int = conn.execute("DELETE FROM statistics WHERE timestamp < ?",
+                                        (timestamp(now - keep_seconds),)).rowcount
+            for period, keep in KEEP.items():
+                if keep is not None:
+                    conn.execute("DELETE FROM statistics_rollup WHERE period = ? AND start < ?",
+                                 (period, int(now - keep)))
+        return deleted
+
+    def get_statistics(self, token: str) -> dict:
+        """
+        Return the most recent network statistics for the user of a token, without another bcrypt check,
+        and the p50/p95/p99 of the last day by metric.
+        """
+        payload = self.verify_token(token)
+        if not payload:
+            return {"error": "Invalid or expired token"}
+
+        with self.connection() as conn:
+            # the newest row of the user is the last entry of the user in statistics_user
+            row = conn.execute("""
+                               SELECT upload_rate, download_rate, transfer_time, response_time, timestamp
+                               FROM statistics
+                               WHERE user_id = ?
+                               ORDER BY timestamp DESC
+                               LIMIT 1
+                               """, (payload['user_id'],)).fetchone()
 
         if not row:
             return {"message": "No statistics found for this user"}
 
+        sketches: dict[str, Sketch] = self.rollup_sketches(payload['user_id'], HOUR, time.time() - DAY)
         return {
             "upload_rate": row[0],
             "download_rate": row[1],
             "transfer_time": row[2],
             "response_time": row[3],
-            "timestamp": row[4]
+            "timestamp": row[4],
+            "percentiles": {metric: {f"p{round(q * 100)}": sketch.quantile(q) for q in QUANTILES}
+                            for metric, sketch in sketches.items()}
         }
 
+    def set_files(self, removed: list[str], rows: list[tuple[str, str, str, int, float, bool]]) -> None:
+        """
+        Removes the entries at and below every path in removed, then adds or replaces rows, in one transaction.
+
+        Args:
+            removed: Paths whose entries and every entry below them are deleted, "" deletes everything
+            rows: (path, parent, name, size, mtime, is_dir) of the entries to store
+        """
+        with self.connection() as conn, conn:
+            for path in removed:
+                if not path:
+                    conn.execute("DELETE FROM files")
+                    continue
+                conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                # '0' follows '/', the range holds exactly the paths below path
+                conn.execute("DELETE FROM files WHERE path >= ? AND path < ?", (path + "/", path + "0"))
+            conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def list_files(self, parent: str) -> list[tuple[str, bool, int, float]]:
+        """(name, is_dir, size, mtime) of the entries directly in parent, sorted by name"""
+        with self.connection() as conn:
+            rows = conn.execute("""
+                                     SELECT name, is_dir, size, mtime
+                                     FROM files
+                                     WHERE parent = ?
+                                     ORDER BY name
+                                     """, (parent,)).fetchall()
+        return [(name, bool(is_dir), size, mtime) for name, is_dir, size, mtime in rows]
+
+    def get_file(self, path: str) -> tuple[int, float, bool] | None:
+        """(size, mtime, is_dir) of the entry at path, None if there is none"""
+        with self.connection() as conn:
+            row = conn.execute("SELECT size, mtime, is_dir FROM files WHERE path = ?", (path,)).fetchone()
+        return (row[0], row[1], bool(row[2])) if row else None
+
+    def get_files(self, paths: list[str]) -> dict[str, tuple[int, float, bool]]:
+        """get_file of many paths on one connection, FILES_BATCH of them per query, paths without an entry are left out"""
+        found: dict[str, tuple[int, float, bool]] = {}
+        with self.connection() as conn:
+            for offset in range(0, len(paths), FILES_BATCH):
+                batch: list[str] = paths[offset:offset + FILES_BATCH]
+                for path, size, mtime, is_dir in conn.execute(
+                        f"SELECT path, size, mtime, is_dir FROM files WHERE path IN ({', '.join('?' * len(batch))})",
+                        batch):
+                    found[path] = (size, mtime, bool(is_dir))
+        return found
+
+    def files_size(self, path: str) -> int:
+        """Total bytes of the files at and below path, "" for the whole server directory"""
+        with self.connection() as conn:
+            if not path:
+                row = conn.execute("SELECT TOTAL(size) FROM files").fetchone()
+            else:
+                row = conn.execute("""
+                                        SELECT TOTAL(size)
+                                        FROM files
+                                        WHERE path = ? OR (path >= ? AND path < ?)
+                                        """, (path, path + "/", path + "0")).fetchone()
+        return int(row[0])
+
+    def search_files(self, path: str, after: str, limit: int, pattern: str, glob: bool, min_size: int,
+                     max_size: int | None, since: int) -> list[tuple[str, str, int, float, bool]]:
+        """
+        Finds entries below path, the matching rows in order of their path.
+
+        Args:
+            path: Directory searched, "" for the whole server directory
+            after: Path of the last result of the previous page, "" from the start
+            limit: Most rows returned
+            pattern: Matched against the name as a glob if glob is set, as a substring otherwise, ignoring case
+            min_size, max_size, since: When any is set only files of that size modified since then match
+
+        Returns:
+            (path, name, size, mtime, is_dir) of every match
+        """
+        conditions: list[str] = ["path > ?"]
+        params: list = [max(after, path + "/") if path else after]
+        if path:
+            conditions.append("path < ?")
+            params.append(path + "0")
+        if pattern and glob:
+            conditions.append("lower(name) GLOB lower(?)")
+            params.append(pattern)
+        elif pattern:
+            conditions.append("instr(lower(name), lower(?)) > 0")
+            params.append(pattern)
+        if min_size or max_size is not None or since:
+            conditions.append("is_dir = 0 AND size >= ? AND mtime >= ?")
+            params += [min_size, since]
+        if max_size is not None:
+            conditions.append("size <= ?")
+            params.append(max_size)
+
+        with self.connection() as conn:
+            rows = conn.execute(f"""
+                                     SELECT path, name, size, mtime, is_dir
+                                     FROM files
+                                     WHERE {" AND ".join(conditions)}
+                                     ORDER BY path
+                                     LIMIT ?
+                                     """, (*params, limit)).fetchall()
+        return [(path, name, size, mtime, bool(is_dir)) for path, name, size, mtime, is_dir in rows]
+
+    def count_files(self) -> int:
+        with self.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
     def __del__(self):
-        self.conn.close()
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
 
 
 if __name__ == "__main__":
@@ -192,5 +533,10 @@ if __name__ == "__main__":
     # Test statistics
     print("\nTesting statistics:")
     print(data.set_statistics("alice1", 1.2, 2.3, 54.6, 3.9))
-    print(data.get_statistics("alice1", "pass1"))
+    print(data.get_statistics(token))
+
+    # Revoke the token
+    print("\nRevoking token:")
+    print(data.revoke_token(token))  # True
+    print(f"Revoked token result: {data.verify_token(token)}")  # False
     print(data.delete_user("bob2"))
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+Delta uploads in the style of rsync: a file the server already has an older copy of is
+updated by sending only what changed.
+The server cuts its copy into blocks and sends a signature per block, a weak checksum that
+can be rolled forward one byte at a time and a strong hash. The client slides a block sized
+window over its file, where the weak checksum and then the strong hash match it tells the
+server to copy that block from the old file, everything in between is sent as literal bytes.
+The server writes the new file next to the old one and replaces it in one step.
+"""
+import hashlib
+import mmap
+import math
+import struct
+import zlib
+from pathlib import Path
+
+from file_transfer import Frame
+
+DELTA_MIN_SIZE = 1024 * 1024  # smaller files are uploaded whole, a round trip costs more than the bytes
+DELTA_MIN_BLOCK = 2 * 1024
+DELTA_MAX_BLOCK = 128 * 1024
+DELTA_MAX_LITERAL = 0.5  # share of the file that may be literal before a whole upload is cheaper
+DELTA_MAX_SCAN = 16 * 1024 * 1024  # literal bytes searched byte by byte in Python before giving up
+DELTA_PROBE = 2 * 1024 * 1024  # without a single matching block in this many bytes the files are unrelated
+SIGNATURE = struct.Struct("<I16s")  # adler32 and 16 byte blake2b of a block
+ADLER_MOD = 65521
+
+
+class Delta:
+    @staticmethod
+    def block_size(num_bytes: int) -> int:
+        """Block size for a file, the square root of its size like rsync, in 1 KB steps"""
+        size: int = (math.isqrt(num_bytes) + 1023) & ~1023
+        return max(DELTA_MIN_BLOCK, min(size, DELTA_MAX_BLOCK))
+
+    @staticmethod
+    def strong(block) -> bytes:
+        return hashlib.blake2b(block, digest_size=16).digest()
+
+    @staticmethod
+    def signatures(file_path: Path, block_size: int) -> bytes:
+        """
+        Signatures of every full block of file_path, run by the server on its copy.
+        A shorter last block is left out, the client sends those bytes as literal.
+        """
+        signatures = bytearray()
+        with open(file_path, "rb") as file:
+            while len(block := file.read(block_size)) == block_size:
+                signatures += SIGNATURE.pack(zlib.adler32(block), Delta.strong(block))
+        return bytes(signatures)
+
+    @staticmethod
+    def diff(file_path: Path, signatures: bytes, block_size: int) -> list[tuple[Frame, int, int]] | None:
+        """
+        Computes the instructions that rebuild file_path from the file the signatures were taken of.
+
+        Args:
+            file_path: The new version of the file, on the client
+            signatures: Block signatures of the old version sent by the server
+            block_size: Size of the blocks the signatures were taken of
+
+        Returns:
+            (Frame.COPY, old offset, length) and (Frame.DATA, new offset, length) in file order,
+            None if so much differs that the whole file is cheaper to send
+        """
+        table: dict[int, dict[bytes, int]] = {}
+        for index, (weak, strong) in enumerate(SIGNATURE.iter_unpack(signatures)):
+            table.setdefault(weak, {}).setdefault(strong, index)
+
+        num_bytes: int = file_path.stat().st_size
+        max_literal: int = min(int(num_bytes * DELTA_MAX_LITERAL), DELTA_MAX_SCAN)
+        ops: list[tuple[Frame, int, int]] = []
+        literal: int = 0  # bytes already turned into DATA instructions
+        if not table or not num_bytes:
+            return None
+
+        with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            position: int = 0
+            literal_start: int = 0
+            weak: int | None = None
+            last: int = num_bytes - block_size  # last offset a whole block starts at
+            while position <= last:
+                if weak is None:
+                    weak = zlib.adler32(data[position:position + block_size])
+
+                strongs: dict[bytes, int] | None = table.get(weak)
+                if strongs is not None:
+                    index: int | None = strongs.get(Delta.strong(data[position:position + block_size]))
+                    if index is not None:
+                        if literal_start < position:
+                            ops.append((Frame.DATA, literal_start, position - literal_start))
+                            literal += position - literal_start
+                        Delta._add_copy(ops, index * block_size, block_size)
+                        position += block_size
+                        literal_start = position
+                        weak = None
+                        continue
+
+                stop: int = min(last, position + max_literal - literal - (position - literal_start))
+                if not ops:
+                    stop = min(stop, DELTA_PROBE)  # nothing in common near the start, most likely another file
+                if position >= stop:
+                    if position == last:
+                        break
+                    return None
+                position, weak = Delta._roll(data, position, stop, block_size, weak, table)
+
+        if literal_start < num_bytes:
+            ops.append((Frame.DATA, literal_start, num_bytes - literal_start))
+            literal += num_bytes - literal_start
+        if literal > max_literal:
+            return None
+        return ops
+
+    @staticmethod
+    def _roll(data: mmap.mmap, position: int, stop: int, block_size: int, weak: int,
+              table: dict[int, dict[bytes, int]]) -> tuple[int, int]:
+        """
+        Slides the window a byte at a time until its weak checksum is in table or it reaches stop.
+        This is the only per byte work and only runs where the files differ.
+        Returns: The new position and the weak checksum of the window there
+        """
+        low: int = weak & 0xFFFF
+        high: int = weak >> 16
+        while position < stop:
+            out_byte: int = data[position]
+            low = (low - out_byte + data[position + block_size]) % ADLER_MOD
+            high = (high - block_size * out_byte + low - 1) % ADLER_MOD
+            position += 1
+            if high << 16 | low in table:
+                break
+        return position, high << 16 | low
+
+    @staticmethod
+    def _add_copy(ops: list[tuple[Frame, int, int]], offset: int, length: int) -> None:
+        """Appends a copy, merged into the previous one if it continues it so unchanged runs are a single instruction"""
+        if ops and ops[-1][0] == Frame.COPY and ops[-1][1] + ops[-1][2] == offset:
+            ops[-1] = (Frame.COPY, ops[-1][1], ops[-1][2] + length)
+        else:
+            ops.append((Frame.COPY, offset, length))
+
+    @staticmethod
+    def literal_bytes(ops: list[tuple[Frame, int, int]]) -> int:
+        return sum(length for frame, _, length in ops if frame == Frame.DATA)
@@ -0,0 +1,109 @@
+"""
+Reads directories with os.scandir for DIR, TREE and SEARCH without the file index, and for the index itself.
+A DirEntry knows from the directory listing whether it is a directory, so a directory costs
+no system call of its own and a file a single stat for its size and time, where
+RelativePath.from_path pays Path.is_file() and two Path.stat() calls, three for every entry.
+
+On slow or network mounted storage most of a walk is spent waiting for the storage, so a
+Scanner with threads reads the directories ahead of the walk in a thread pool, in the order
+the walk asks for them, with a few always on their way.
+"""
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from relativepath import RelativePath
+
+READ_AHEAD = 4  # directories read ahead of a walk per thread
+
+
+def scan(directory: str | Path) -> list[tuple[str, bool, bool, int, float]]:
+    """
+    Reads the entries directly in directory, sorted by name, [] if it can not be read.
+    Entries are described like RelativePath.from_path does, symlinks followed and directories
+    without size or time. Symlinked directories are not descended into, like Path.rglob,
+    and broken symlinks are left out.
+
+    Returns:
+        (name, descend, is_dir, size, mtime) of every entry
+    """
+    rows: list[tuple[str, bool, bool, int, float]] = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        rows.append((entry.name, not entry.is_symlink(), True, 0, 0.0))
+                    else:
+                        entry_stat: os.stat_result = entry.stat()
+                        rows.append((entry.name, False, False, entry_stat.st_size, entry_stat.st_mtime))
+                except OSError:
+                    continue  # a broken symlink or gone already
+    except OSError:
+        return []
+    rows.sort()
+    return rows
+
+
+def entry(parts: tuple[str, ...], row: tuple[str, bool, bool, int, float]) -> RelativePath:
+    """The RelativePath of a row of scan() given its path parts, built without another system call"""
+    if row[2]:
+        return RelativePath("/".join(parts))
+    return RelativePath("/".join(parts), row[0], row[3], row[4])
+
+
+class Scanner:
+    """Reads directories for the walks of ListingCache, ahead of them in a thread pool when threads is set"""
+
+    def __init__(self, threads: int = 0):
+        self.threads: int = threads
+        self.pool: ThreadPoolExecutor | None = ThreadPoolExecutor(threads, "scan") if threads > 0 else None
+
+    def children(self, directory: Path, recursive: bool = True, after: tuple[str, ...] = (),
+                 mtimes: dict[str, int] | None = None) -> Callable[[tuple[str, ...]], list[tuple]]:
+        """
+        Children for ListingCache.walk that read the disk below directory.
+
+        Args:
+            directory: Directory the walk lists
+            recursive: The walk descends into directories, only then is there anything to read ahead
+            after: Parts of the cursor the walk starts after, subtrees before it are not read ahead
+            mtimes: Collects the modification time of every directory read, taken before it is read
+        """
+        def read(parts: tuple[str, ...]) -> list[tuple[str, bool, bool, int, float]]:
+            path: Path = directory.joinpath(*parts)
+            if mtimes is not None:
+                try:
+                    mtimes[str(path)] = os.stat(path).st_mtime_ns
+                except OSError:
+                    return []
+            return scan(path)
+
+        if self.pool is None or not recursive:
+            return read
+
+        # directories found but not read yet, the last one is the next the walk asks for, and the ones being read
+        waiting: list[tuple[str, ...]] = []
+        reading: dict[tuple[str, ...], Future] = {}
+        window: int = self.threads * READ_AHEAD
+
+        def children(parts: tuple[str, ...]) -> list[tuple[str, bool, bool, int, float]]:
+            # the walk asks in the order of the parts, what comes before parts was skipped and never will be
+            while waiting and waiting[-1] < parts:
+                waiting.pop()
+            for skipped in [key for key in reading if key < parts]:
+                reading.pop(skipped).cancel()
+            if waiting and waiting[-1] == parts:
+                waiting.pop()
+            future: Future | None = reading.pop(parts, None)
+            rows: list[tuple[str, bool, bool, int, float]] = future.result() if future is not None else read(parts)
+
+            # the subdirectories come next in the walk, before everything that was already waiting
+            waiting.extend(child for child in (parts + (row[0],) for row in reversed(rows) if row[1])
+                           if child >= after[:len(child)])
+            while waiting and len(reading) < window:
+                next_parts: tuple[str, ...] = waiting.pop()
+                reading[next_parts] = self.pool.submit(read, next_parts)
+            return rows
+        return children
@@ -1,22 +1,453 @@
+"""
+Encodes the data dictionaries sent between the client and the server.
+Two codecs exist and one is picked per connection during the STARTING_MSG handshake:
+BINARY, a schema driven format that only ever builds known types, and PICKLE which
+is kept for older peers and is refused by the server unless ALLOW_PICKLE is set.
+"""
 import pickle
-from type import Command, ResCode, KeyData
+import struct
+import sys
+from array import array
+from enum import IntEnum
+
+from relativepath import RelativePath
+from type import MAX_LOGIN_MSG_SIZE, MAX_MSG_SIZE, Command, ResCode, KeyData
+
+
+class Codec(IntEnum):
+    """Wire formats, listed in order of preference"""
+    BINARY = 1
+    PICKLE = 2
+
+
+class Field(IntEnum):
+    """Value types used in the schema"""
+    UINT = 1
+    BOOL = 2
+    OPT_BOOL = 3
+    STR = 4
+    PATH = 5
+    PATHS = 6
+    UINTS = 7
+    VALUE = 8
+
+
+class DecodeError(ValueError):
+    """Raised when a message can not be decoded, the connection should be dropped"""
+
+
+# Every key that may appear in a data dictionary and how its value is stored
+SCHEMA: dict[KeyData, Field] = {
+    KeyData.MSG: Field.STR,
+    KeyData.REL_PATH: Field.PATH,
+    KeyData.REL_PATHS: Field.PATHS,
+    KeyData.FILE_NAME: Field.STR,
+    KeyData.BYTES: Field.UINT,
+    KeyData.USER_NAME: Field.STR,
+    KeyData.PASSWORD: Field.STR,
+    KeyData.STATS: Field.VALUE,
+    KeyData.PLATFORM: Field.STR,
+    KeyData.AUTH_TOKEN: Field.STR,
+    KeyData.EXISTS: Field.BOOL,
+    KeyData.IS_DIR: Field.OPT_BOOL,
+    KeyData.CODECS: Field.UINTS,
+    KeyData.CODEC: Field.UINT,
+    KeyData.RAW: Field.BOOL,
+    KeyData.TRANSFER_ID: Field.STR,
+    KeyData.STRIPES: Field.UINT,
+    KeyData.RANGES: Field.VALUE,
+    KeyData.VERSION: Field.UINT,
+    KeyData.DIGESTS: Field.VALUE,
+    KeyData.DELTA: Field.BOOL,
+    KeyData.BLOCK_SIZE: Field.UINT,
+    KeyData.SIGNATURES: Field.VALUE,
+    KeyData.CURSOR: Field.STR,
+    KeyData.LIMIT: Field.UINT,
+    KeyData.PATTERN: Field.STR,
+    KeyData.MIN_SIZE: Field.UINT,
+    KeyData.MAX_SIZE: Field.UINT,
+    KeyData.SINCE: Field.UINT,
+    KeyData.CHECKS: Field.VALUE,
+    KeyData.RESULTS: Field.UINTS,
+    KeyData.REQ_ID: Field.UINT,
+}
+
+BINARY_MAGIC = 0xB1  # first byte of a binary message, pickles start with 0x80
+BINARY_VERSION = 1
+HEADER = struct.Struct("<BBH")  # magic, version, command/response code
+FLOAT = struct.Struct("<d")
+
+# Command and ResCode share one auto() counter so their values never collide
+CODES: dict[int, Command | ResCode] = {code.value: code for code in (*Command, *ResCode)}
+KEYS: dict[int, KeyData] = {key.value: key for key in KeyData}
+
+# array typecodes by item size, used for the columns of a path list
+ARRAY_CODES: dict[int, str] = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+# tags of the self describing VALUE type
+TAG_NONE, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STR, TAG_BYTES, TAG_LIST, TAG_DICT, TAG_PATH = range(10)
+
+
+def write_varint(out: bytearray, num: int) -> None:
+    """Appends an unsigned LEB128 varint, 7 bits per byte"""
+    if num < 0:
+        raise ValueError(f"varint can not be negative: {num}")
+    while num > 0x7F:
+        out.append((num & 0x7F) | 0x80)
+        num >>= 7
+    out.append(num)
+
+
+def read_varint(view: memoryview, pos: int) -> tuple[int, int]:
+    """Returns the varint starting at pos and the position after it"""
+    num: int = 0
+    shift: int = 0
+    while True:
+        byte: int = view[pos]
+        pos += 1
+        num |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return num, pos
+        shift += 7
+        if shift > 70:
+            raise DecodeError("varint is too long")
+
+
+def write_str(out: bytearray, text: str) -> None:
+    data: bytes = text.encode("utf-8", "surrogateescape")
+    write_varint(out, len(data))
+    out += data
+
+
+def read_str(view: memoryview, pos: int) -> tuple[str, int]:
+    size, pos = read_varint(view, pos)
+    end: int = pos + size
+    if end > len(view):
+        raise DecodeError("string runs past the end of the message")
+    return bytes(view[pos:end]).decode("utf-8", "surrogateescape"), end
+
+
+def write_column(out: bytearray, values: array) -> None:
+    """Appends a fixed width little endian column, prefixed by its item size"""
+    if sys.byteorder == "big":
+        values.byteswap()
+    out.append(values.itemsize)
+    out += values.tobytes()
+
+
+def read_column(view: memoryview, pos: int, count: int, typecode: str | None = None) -> tuple[array, int]:
+    if typecode is None:
+        typecode = ARRAY_CODES.get(view[pos])
+        if typecode is None:
+            raise DecodeError(f"unknown column width {view[pos]}")
+    elif view[pos] != array(typecode).itemsize:
+        raise DecodeError("column width does not match its type")
+    pos += 1
+    values = array(typecode)
+    end: int = pos + count * values.itemsize
+    if end > len(view):
+        raise DecodeError("column runs past the end of the message")
+    values.frombytes(view[pos:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, end
+
+
+def narrowest_array(values: list[int]) -> array:
+    """Packs non-negative ints into the smallest unsigned array type that holds the maximum"""
+    largest: int = max(values, default=0)
+    for typecode in ARRAY_CODES.values():
+        if largest < 1 << (8 * array(typecode).itemsize):
+            return array(typecode, values)
+    raise ValueError(f"{largest} does not fit in 64 bits")
+
+
+def write_path(out: bytearray, rel_path: RelativePath) -> None:
+    write_str(out, rel_path.location)
+    write_str(out, rel_path.name)
+    write_varint(out, rel_path.bytes)
+    out += FLOAT.pack(rel_path.time)
+
+
+def read_path(view: memoryview, pos: int) -> tuple[RelativePath, int]:
+    location, pos = read_str(view, pos)
+    name, pos = read_str(view, pos)
+    bytes_size, pos = read_varint(view, pos)
+    (mtime,) = FLOAT.unpack_from(view, pos)
+    return RelativePath(location, name, bytes_size, mtime), pos + FLOAT.size
+
+
+def write_paths(out: bytearray, rel_paths: list[RelativePath]) -> None:
+    """
+    Stores a path list column wise: a table of the distinct locations, then one column
+    each for the location index, size and modification time, and all names joined by NUL
+    which can not appear in a file name. Listings share few locations, so each entry
+    costs its name plus a handful of bytes.
+    """
+    locations: dict[str, int] = {}
+    indexes: list[int] = [locations.setdefault(p.location, len(locations)) for p in rel_paths]
+
+    write_varint(out, len(rel_paths))
+    write_varint(out, len(locations))
+    write_str(out, "\0".join(locations))
+    write_str(out, "\0".join([p.name for p in rel_paths]))
+    write_column(out, narrowest_array(indexes))
+    write_column(out, narrowest_array([p.bytes for p in rel_paths]))
+    write_column(out, array("d", [p.time for p in rel_paths]))
+
+
+def read_paths(view: memoryview, pos: int) -> tuple[list[RelativePath], int]:
+    count, pos = read_varint(view, pos)
+    num_locations, pos = read_varint(view, pos)
+    joined_locations, pos = read_str(view, pos)
+    joined_names, pos = read_str(view, pos)
+    indexes, pos = read_column(view, pos, count)
+    sizes, pos = read_column(view, pos, count)
+    mtimes, pos = read_column(view, pos, count, "d")
+
+    locations: list[str] = joined_locations.split("\0") if num_locations else []
+    names: list[str] = joined_names.split("\0") if count else []
+    if len(locations) != num_locations or len(names) != count:
+        raise DecodeError("path list counts do not match its contents")
+
+    return [RelativePath(locations[i], name, size, mtime)
+            for i, name, size, mtime in zip(indexes, names, sizes, mtimes)], pos
+
+
+def write_uints(out: bytearray, values: list[int]) -> None:
+    write_varint(out, len(values))
+    for value in values:
+        write_varint(out, int(value))
+
+
+def read_uints(view: memoryview, pos: int) -> tuple[list[int], int]:
+    count, pos = read_varint(view, pos)
+    values: list[int] = []
+    for _ in range(count):
+        value, pos = read_varint(view, pos)
+        values.append(value)
+    return values, pos
+
+
+def write_value(out: bytearray, value) -> None:
+    """Self describing encoding for free form values (statistics), one tag byte then the data"""
+    if value is None:
+        out.append(TAG_NONE)
+    elif value is True or value is False:
+        out.append(TAG_TRUE if value else TAG_FALSE)
+    elif isinstance(value, int):
+        out.append(TAG_INT)
+        write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)  # zigzag
+    elif isinstance(value, float):
+        out.append(TAG_FLOAT)
+        out += FLOAT.pack(value)
+    elif isinstance(value, str):
+        out.append(TAG_STR)
+        write_str(out, value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out.append(TAG_BYTES)
+        write_varint(out, len(value))
+        out += value
+    elif isinstance(value, RelativePath):
+        out.append(TAG_PATH)
+        write_path(out, value)
+    elif isinstance(value, (list, tuple)):
+        out.append(TAG_LIST)
+        write_varint(out, len(value))
+        for item in value:
+            write_value(out, item)
+    elif isinstance(value, dict):
+        out.append(TAG_DICT)
+        write_varint(out, len(value))
+        for key, item in value.items():
+            write_value(out, key)
+            write_value(out, item)
+    else:
+        raise TypeError(f"Can not encode value of type {type(value).__name__}")
+
+
+def read_value(view: memoryview, pos: int, depth: int = 0):
+    if depth > 32:
+        raise DecodeError("value is nested too deep")
+    tag: int = view[pos]
+    pos += 1
+    if tag == TAG_NONE:
+        return None, pos
+    if tag in (TAG_FALSE, TAG_TRUE):
+        return tag == TAG_TRUE, pos
+    if tag == TAG_INT:
+        num, pos = read_varint(view, pos)
+        return (num >> 1) ^ -(num & 1), pos
+    if tag == TAG_FLOAT:
+        return FLOAT.unpack_from(view, pos)[0], pos + FLOAT.size
+    if tag == TAG_STR:
+        return read_str(view, pos)
+    if tag == TAG_BYTES:
+        size, pos = read_varint(view, pos)
+        return bytes(view[pos:pos + size]), pos + size
+    if tag == TAG_PATH:
+        return read_path(view, pos)
+    if tag == TAG_LIST:
+        count, pos = read_varint(view, pos)
+        items: list = []
+        for _ in range(count):
+            item, pos = read_value(view, pos, depth + 1)
+            items.append(item)
+        return items, pos
+    if tag == TAG_DICT:
+        count, pos = read_varint(view, pos)
+        mapping: dict = {}
+        for _ in range(count):
+            key, pos = read_value(view, pos, depth + 1)
+            mapping[key], pos = read_value(view, pos, depth + 1)
+        return mapping, pos
+    raise DecodeError(f"unknown value tag {tag}")
+
+
+def write_bool(out: bytearray, value: bool) -> None:
+    out.append(1 if value else 0)
+
+
+def read_bool(view: memoryview, pos: int) -> tuple[bool, int]:
+    return view[pos] == 1, pos + 1
+
+
+def write_opt_bool(out: bytearray, value: bool | None) -> None:
+    out.append(2 if value is None else int(bool(value)))
+
+
+def read_opt_bool(view: memoryview, pos: int) -> tuple[bool | None, int]:
+    return (None if view[pos] == 2 else view[pos] == 1), pos + 1
+
+
+WRITERS = {
+    Field.UINT: write_varint,
+    Field.BOOL: write_bool,
+    Field.OPT_BOOL: write_opt_bool,
+    Field.STR: write_str,
+    Field.PATH: write_path,
+    Field.PATHS: write_paths,
+    Field.UINTS: write_uints,
+    Field.VALUE: write_value,
+}
+
+READERS = {
+    Field.UINT: read_varint,
+    Field.BOOL: read_bool,
+    Field.OPT_BOOL: read_opt_bool,
+    Field.STR: read_str,
+    Field.PATH: read_path,
+    Field.PATHS: read_paths,
+    Field.UINTS: read_uints,
+    Field.VALUE: read_value,
+}
+
+
+def peek_code(data: bytes) -> Command | ResCode | None:
+    """The command or response code from the first HEADER.size bytes of a message, None for a pickle"""
+    if len(data) < HEADER.size or data[0] != BINARY_MAGIC:
+        return None
+    return CODES.get(HEADER.unpack_from(data, 0)[2])
 
 
 class Encoder:
-    @staticmethod
-    def encode(dict_items: dict, cmd: Command | ResCode) -> bytes:
-        dict_items[KeyData.CMD] = cmd
-        return pickle.dumps(dict_items)
-
-    @staticmethod
-    def decode(en_items) -> dict:
-        dict_items: dict = pickle.loads(en_items)
+    """
+    Encodes/decodes the data dictionaries of one connection.
+    Messages are always encoded with self.codec, decoding detects the codec from the first byte.
+
+    Once tag_requests is set every request gets the next request ID, and the side that decodes a
+    request echoes its ID in every reply until the next request, so a client can send requests
+    without waiting for each reply and match the replies up. It is only set after the handshake
+    showed the server knows REQ_ID, older servers refuse messages with keys they do not know.
+    """
+
+    def __init__(self, codec: Codec = Codec.BINARY, allow_pickle: bool = True):
+        self.codec: Codec = codec
+        self.allow_pickle: bool = allow_pickle
+        self.tag_requests: bool = False
+        self.next_id: int = 1  # ID of the next request sent
+        self.reply_id: int | None = None  # ID of the request being answered
+        self.user: str = ""  # server side, the username the connection logged in as
+
+    @property
+    def max_msg_size(self) -> int:
+        """Server side, the largest message received from the peer, small until it logged in"""
+        return MAX_MSG_SIZE if self.user else MAX_LOGIN_MSG_SIZE
+
+    def accepted(self) -> list[Codec]:
+        """Codecs this side can decode, in order of preference"""
+        return [codec for codec in Codec if codec != Codec.PICKLE or self.allow_pickle]
+
+    def negotiate(self, offered: list[int]) -> Codec:
+        """
+        Server side of the handshake: picks the preferred codec the peer also offered.
+        BINARY is understood by every peer, so it is the fallback.
+        """
+        self.codec = next((codec for codec in self.accepted() if codec in offered), Codec.BINARY)
+        return self.codec
+
+    def new_request_id(self) -> int | None:
+        """ID for the next request, None while requests are not tagged"""
+        if not self.tag_requests:
+            return None
+        self.next_id += 1
+        return self.next_id - 1
+
+    def encode(self, dict_items: dict, cmd: Command | ResCode) -> bytes:
+        if KeyData.REQ_ID not in dict_items:
+            req_id: int | None = self.new_request_id() if isinstance(cmd, Command) else self.reply_id
+            if req_id is not None:
+                dict_items = {**dict_items, KeyData.REQ_ID: req_id}
+
+        if self.codec == Codec.PICKLE:
+            dict_items[KeyData.CMD] = cmd
+            return pickle.dumps(dict_items)
+
+        fields: list = [(key, value) for key, value in dict_items.items() if key != KeyData.CMD]
+        out = bytearray(HEADER.pack(BINARY_MAGIC, BINARY_VERSION, cmd.value))
+        write_varint(out, len(fields))
+        for key, value in fields:
+            write_varint(out, key.value)
+            WRITERS[SCHEMA[key]](out, value)
+        return bytes(out)
+
+    def decode(self, en_items) -> dict:
+        view = memoryview(en_items)
+        if not view:
+            raise DecodeError("empty message")
+
+        if view[0] != BINARY_MAGIC:
+            if not self.allow_pickle:
+                raise DecodeError("pickled messages are not accepted")
+            dict_items: dict = pickle.loads(view)
+            if isinstance(dict_items.get(KeyData.CMD), Command):
+                self.reply_id = dict_items.get(KeyData.REQ_ID)
+            return dict_items
+
+        try:
+            magic, version, code = HEADER.unpack_from(view, 0)
+            if version != BINARY_VERSION:
+                raise DecodeError(f"unsupported binary version {version}")
+
+            dict_items: dict = {KeyData.CMD: CODES[code]}
+            count, pos = read_varint(view, HEADER.size)
+            for _ in range(count):
+                key_value, pos = read_varint(view, pos)
+                key: KeyData = KEYS[key_value]
+                dict_items[key], pos = READERS[SCHEMA[key]](view, pos)
+        except (struct.error, IndexError, KeyError, UnicodeDecodeError) as e:
+            raise DecodeError(f"malformed message: {e!r}") from e
+
+        if pos != len(view):
+            raise DecodeError("trailing bytes after the message")
+        if isinstance(dict_items[KeyData.CMD], Command):
+            self.reply_id = dict_items.get(KeyData.REQ_ID)
         return dict_items
 
 
 if __name__ == "__main__":
     # create a dictionary
-    items: dict = {"message": "Delete a file", "arg1": "testing", "arg2": 12345}
+    items: dict = {KeyData.MSG: "Delete a file", KeyData.REL_PATH: RelativePath(".", "testing", 12345)}
     encoder = Encoder()
     # pass the dictionary and the cmd to be decoded
     encoded_items: bytes = encoder.encode(items, Command.DELETE)
@@ -24,7 +455,7 @@ if __name__ == "__main__":
     print("en_items:\n", encoded_items)
 
     # pass the encoded message into the decoder
-    decoded_items: dict = Encoder.decode(encoded_items)
+    decoded_items: dict = encoder.decode(encoded_items)
 
     print("\ndecoded_items:\n")
     for key, value in decoded_items.items():
@@ -1,23 +1,55 @@
-import io
+import hashlib
+import mmap
+import os
+import struct
 import time
-import zipfile
+import zlib
+from enum import IntEnum
 from pathlib import Path
 import shutil
 from typing import Callable
 
 from zipstream import ZipStream
 
-from type import SIZE
+from blobstore import BlobStore
+from striping import RangeQueue, StripeProgress
+from type import recv_exact
+from zip_extractor import ZipExtractor
 
-DELIMITER = b'\x00\x00EOF\x00\x00'
+CHUNK_HEADER = struct.Struct("<BI")  # frame type, payload length
+CHUNK_SIZE = 256 * 1024  # payload of the data frames that are sent
+MAX_CHUNK_SIZE = 16 * 1024 * 1024  # larger payload lengths are treated as a broken stream
+RAW_SEGMENT = 8 * 1024 * 1024  # bytes per sendfile call of a raw transfer
+RAW_WINDOW = 64 * 1024 * 1024  # bytes of the received file mapped at once, a multiple of mmap.ALLOCATIONGRANULARITY
+RANGE_HEADER = struct.Struct("<QQ")  # offset and length of a range of a striped transfer, length 0 ends it
+RANGE_BUFFER = 1024 * 1024  # bytes received per positional write
+DELTA_COPY = struct.Struct("<QQ")  # offset and length in the old file of a COPY frame
+
+class Frame(IntEnum):
+    """Types of the frames a bulk transfer is split into"""
+    DATA = 0
+    END = 1  # the sender finished, everything was sent
+    ABORT = 2  # the sender gave up, discard what was received
+    COPY = 3  # delta upload, bytes the receiver copies from its old version of the file
 
 
 class Transfer:
+    @staticmethod
+    def send_frame(conn, frame: Frame, payload: bytearray) -> None:
+        """
+        Sends payload as one frame. The first CHUNK_HEADER.size bytes of payload are
+        reserved for the header so header and data leave in one write without a copy.
+        """
+        CHUNK_HEADER.pack_into(payload, 0, frame, len(payload) - CHUNK_HEADER.size)
+        conn.sendall(payload)
+
     @staticmethod
     def send_file(conn, zip_file: ZipStream, num_bytes: int,
                   progress_func: Callable[[int, int, int], None] = lambda num, num2, num3: None) -> bool:
         """
-        Upload a file by reading from file_path and sending num_bytes
+        Upload a file by reading from file_path and sending num_bytes.
+        The zip stream is sent as length prefixed DATA frames of up to CHUNK_SIZE bytes and
+        closed with an END frame, or an ABORT frame if the stream could not be produced.
 
         Args:
             conn: Socket connection
@@ -32,6 +64,7 @@ class Transfer:
         progress_func(0, 0, num_bytes)
         start_time: float = time.perf_counter()
         elapsed_bytes: int = 0
+        chunk_buffer = bytearray(CHUNK_HEADER.size)
 
         try:
             bytes_sent = 0
@@ -40,36 +73,78 @@ class Transfer:
 
                 # Update progress every 0.2 seconds
                 if elapsed_time >= 0.2:
-                    progress_func(bytes_sent * 100 // num_bytes, int(elapsed_bytes / elapsed_time), num_bytes)
+                    progress_func(bytes_sent * 100 // max(num_bytes, 1), int(elapsed_bytes / elapsed_time), num_bytes)
                     start_time = time.perf_counter()
                     elapsed_bytes = 0
 
-                conn.send(chunk)
+                # ZipStream yields many small pieces, batch them into full frames
+                chunk_buffer += chunk
+                if len(chunk_buffer) - CHUNK_HEADER.size >= CHUNK_SIZE:
+                    Transfer.send_frame(conn, Frame.DATA, chunk_buffer)
+                    del chunk_buffer[CHUNK_HEADER.size:]
+
                 bytes_sent += len(chunk)
                 elapsed_bytes += len(chunk)
 
-            # Send delimiter to signal end
-            conn.send(DELIMITER)
+            if len(chunk_buffer) > CHUNK_HEADER.size:
+                Transfer.send_frame(conn, Frame.DATA, chunk_buffer)
+
+            # Send the end frame to signal a clean finish
+            Transfer.send_frame(conn, Frame.END, bytearray(CHUNK_HEADER.size))
             print("sent file")
             return True
 
         except Exception as e:
             print(f"Error sending file: {e}")
+            Transfer.abort_stream(conn)
             return False
         finally:
             progress_func(99, 0, num_bytes)
 
+    @staticmethod
+    def abort_stream(conn) -> None:
+        """Tells the receiver to discard the transfer, ignored if the connection is already gone"""
+        try:
+            Transfer.send_frame(conn, Frame.ABORT, bytearray(CHUNK_HEADER.size))
+        except OSError:
+            pass
+
+    @staticmethod
+    def recv_frame(conn, header: bytearray, chunk_buffer: bytearray) -> tuple[Frame, memoryview]:
+        """
+        Receives one frame of a bulk transfer into chunk_buffer, growing it if needed.
+        Returns: The frame type and a view of its payload, valid until the next frame is received
+        """
+        if recv_exact(conn, memoryview(header)) < CHUNK_HEADER.size:
+            raise ConnectionError("Connection closed before the end of the transfer")
+
+        frame, length = CHUNK_HEADER.unpack(header)
+        if length > MAX_CHUNK_SIZE:
+            raise ConnectionError(f"Frame of {length} bytes exceeds the {MAX_CHUNK_SIZE} byte limit")
+        if length > len(chunk_buffer):
+            chunk_buffer.extend(bytes(length - len(chunk_buffer)))
+
+        payload = memoryview(chunk_buffer)[:length]
+        if recv_exact(conn, payload) < length:
+            raise ConnectionError("Connection closed before the end of the transfer")
+        return Frame(frame), payload
+
     @staticmethod
     def recv_file(conn, directory_path: Path, num_bytes: int,
-                  progress_func: Callable[[int, int, int], None] = lambda num, num2, num3: None) -> bool:
+                  progress_func: Callable[[int, int, int], None] = lambda num, num2, num3: None,
+                  extractor: ZipExtractor | None = None) -> bool:
         """
-        Downloads a file by receiving num_bytes into an in-memory buffer and extracting it.
+        Downloads a file by extracting the zip stream straight to disk as it arrives,
+        so memory use does not grow with the size of the transfer.
+        The stream arrives as DATA frames and ends with an END frame, an ABORT frame
+        means the sender cancelled and the partially extracted files are discarded.
 
         Args:
             conn: Socket connection
             directory_path: Directory where file contents should be extracted
             num_bytes: Number of bytes to receive, used for the progress bar
             progress_func: Callable to display transfer progress: progress_func(percentage, speed, total_size)
+            extractor: Extractor for directory_path set up by the caller, a plain one by default
 
         Returns:
             bool: True if successful, False otherwise
@@ -77,70 +152,409 @@ class Transfer:
         assert directory_path.is_dir(), f"Invalid input: '{directory_path}' is not a directory."
         assert directory_path.exists(), f"Invalid input: '{directory_path}' does not exist."
 
-        # create an in-memory bytes buffer instead of a file on disk.
-        in_memory_zip = io.BytesIO()
+        # members are written to their final path while the rest of the archive is still arriving
+        if extractor is None:
+            extractor = ZipExtractor(directory_path)
+        header = bytearray(CHUNK_HEADER.size)
+        chunk_buffer = bytearray(CHUNK_SIZE)  # reused for every frame
 
         try:
             bytes_received = 0
             progress_func(0, 0, num_bytes)
             start_time: float = time.perf_counter()
             elapsed_bytes: int = 0
-            buffer = b''
 
-            # Loop to receive data from the socket
+            # Loop to receive frames from the socket
             while True:
                 elapsed_time = time.perf_counter() - start_time
 
                 # Update progress every 0.2 seconds
                 if elapsed_time >= 0.2:
                     speed = int(elapsed_bytes / elapsed_time) if elapsed_time > 0 else 0
-                    progress_func(bytes_received * 100 // num_bytes, speed, num_bytes)
+                    progress_func(bytes_received * 100 // max(num_bytes, 1), speed, num_bytes)
                     start_time = time.perf_counter()
                     elapsed_bytes = 0
 
-                # Receive data
-                filedata = conn.recv(SIZE)
+                frame, payload = Transfer.recv_frame(conn, header, chunk_buffer)
 
-                if not filedata:
-                    # Connection closed unexpectedly
-                    raise ConnectionError("Connection closed before delimiter received")
-
-                buffer += filedata
-
-                # Check if delimiter is in buffer
-                if DELIMITER in buffer:
-                    # Split at delimiter and write only the data before it
-                    data, _ = buffer.split(DELIMITER, 1)
-                    in_memory_zip.write(data)
-                    bytes_received += len(data)
+                if frame == Frame.END:
                     break
+                if frame == Frame.ABORT:
+                    print("Transfer cancelled by the sender")
+                    extractor.abort()
+                    return False
 
-                # Write all but the last few bytes (in case delimiter is split across packets)
-                if len(buffer) > len(DELIMITER):
-                    write_size = len(buffer) - len(DELIMITER)
-                    in_memory_zip.write(buffer[:write_size])
-                    buffer = buffer[write_size:]
-                    bytes_received += write_size
-                    elapsed_bytes += write_size
+                extractor.feed(payload)
+                bytes_received += len(payload)
+                elapsed_bytes += len(payload)
+                payload.release()
 
             # Final progress update
             progress_func(99, 0, num_bytes)
 
-            # Rewind the buffer to the beginning
-            in_memory_zip.seek(0)
+            extractor.finish()
+            return True
 
-            with zipfile.ZipFile(in_memory_zip, 'r') as zip_ref:
-                zip_ref.extractall(directory_path)
+        except Exception as e:
+            print(f"Error receiving file: {e}")
+            extractor.abort()
+            return False
+        finally:
+            progress_func(100, 0, num_bytes)
 
+    @staticmethod
+    def send_raw(conn, file_path: Path, num_bytes: int,
+                 progress_func: Callable[[int, int, int], None] = lambda num, num2, num3: None) -> bool:
+        """
+        Sends one file as raw bytes with socket.sendfile, which lets the kernel copy it from
+        the page cache to the socket (os.sendfile) where the platform supports it.
+        The receiver was told num_bytes beforehand so no framing is needed, which also means
+        a short send can not be signalled: the caller has to close the connection on failure.
+
+        Args:
+            conn: Socket connection, must be in blocking mode
+            file_path: File to send
+            num_bytes: Exact number of bytes announced to the receiver
+            progress_func: Callable to display transfer progress: progress_func(percentage, speed, total_size)
+
+        Returns:
+            bool: True if all num_bytes were sent, False otherwise
+        """
+        progress_func(0, 0, num_bytes)
+        start_time: float = time.perf_counter()
+        elapsed_bytes: int = 0
+
+        try:
+            with open(file_path, 'rb') as file:
+                offset: int = 0
+                while offset < num_bytes:
+                    # send in segments so the progress can be updated in between
+                    sent: int = conn.sendfile(file, offset, min(RAW_SEGMENT, num_bytes - offset))
+                    if sent == 0:
+                        raise EOFError(f"{file_path} is shorter than the {num_bytes} bytes announced")
+                    offset += sent
+                    elapsed_bytes += sent
+
+                    elapsed_time = time.perf_counter() - start_time
+                    if elapsed_time >= 0.2:
+                        progress_func(offset * 100 // num_bytes, int(elapsed_bytes / elapsed_time), num_bytes)
+                        start_time = time.perf_counter()
+                        elapsed_bytes = 0
+            return True
+
+        except Exception as e:
+            print(f"Error sending file: {e}")
+            return False
+        finally:
+            progress_func(99, 0, num_bytes)
+
+    @staticmethod
+    def preallocate(file, num_bytes: int) -> None:
+        """Reserves num_bytes on disk for the file, falls back to a sparse file where fallocate is missing"""
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(file.fileno(), 0, num_bytes)
+                return
+            except OSError:
+                pass  # not supported by this file system
+        file.truncate(num_bytes)
+
+    @staticmethod
+    def recv_raw(conn, file_path: Path, num_bytes: int,
+                 progress_func: Callable[[int, int, int], None] = lambda num, num2, num3: None) -> bool:
+        """
+        Receives exactly num_bytes sent by send_raw into file_path. The file is preallocated
+        and mapped into memory a window at a time so recv_into writes straight into the page cache.
+        A partially received file is removed.
+
+        Args:
+            conn: Socket connection
+            file_path: File to create, an existing file is overwritten
+            num_bytes: Exact number of bytes that will arrive
+            progress_func: Callable to display transfer progress: progress_func(percentage, speed, total_size)
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        progress_func(0, 0, num_bytes)
+        start_time: float = time.perf_counter()
+        elapsed_bytes: int = 0
+
+        try:
+            with open(file_path, 'wb+') as file:
+                Transfer.preallocate(file, num_bytes)
+
+                received: int = 0
+                while received < num_bytes:
+                    window_size: int = min(RAW_WINDOW, num_bytes - received)
+                    with (mmap.mmap(file.fileno(), window_size, offset=received) as window,
+                          memoryview(window) as view):
+                        position: int = 0
+                        while position < window_size:
+                            count: int = conn.recv_into(view[position:])
+                            if not count:
+                                raise ConnectionError("Connection closed before the file was received")
+                            position += count
+                            elapsed_bytes += count
+
+                            elapsed_time = time.perf_counter() - start_time
+                            if elapsed_time >= 0.2:
+                                progress_func((received + position) * 100 // num_bytes,
+                                              int(elapsed_bytes / elapsed_time), num_bytes)
+                                start_time = time.perf_counter()
+                                elapsed_bytes = 0
+                    received += window_size
+
+            progress_func(99, 0, num_bytes)
             return True
 
         except Exception as e:
             print(f"Error receiving file: {e}")
+            file_path.unlink(missing_ok=True)
+            return False
+        finally:
+            progress_func(100, 0, num_bytes)
+
+    @staticmethod
+    def send_ranges(conn, file_path: Path, queue: RangeQueue, progress: StripeProgress | None = None) -> bool:
+        """
+        Sends ranges of file_path taken from queue until it is empty, one connection of a striped transfer.
+        Every range is a RANGE_HEADER followed by its bytes sent with sendfile, a header
+        with length 0 tells the receiver that this connection is done.
+        A range that failed is put back into the queue for the other connections.
+
+        Args:
+            conn: Socket connection, must be in blocking mode
+            file_path: File to send, opened separately by every connection
+            queue: Ranges shared by all connections of the transfer
+            progress: Counts the bytes sent
+
+        Returns:
+            bool: True if the connection sent its ranges and the end header, False otherwise
+        """
+        try:
+            with open(file_path, 'rb') as file:
+                while (byte_range := queue.next()) is not None:
+                    offset, length = byte_range
+                    sent_all: bool = False
+                    try:
+                        conn.sendall(RANGE_HEADER.pack(offset, length))
+                        end: int = offset + length
+                        while offset < end:
+                            sent: int = conn.sendfile(file, offset, min(RAW_SEGMENT, end - offset))
+                            if sent == 0:
+                                raise EOFError(f"{file_path} is shorter than the {end} bytes announced")
+                            offset += sent
+                            if progress:
+                                progress.add(sent)
+                        sent_all = True
+                    finally:
+                        queue.done(byte_range, sent_all)
+
+            conn.sendall(RANGE_HEADER.pack(0, 0))
+            return True
+
+        except Exception as e:
+            print(f"Error sending file ranges: {e}")
+            return False
+
+    @staticmethod
+    def pwrite(fd: int, data: memoryview, offset: int) -> None:
+        """Writes all of data at offset without moving a shared file position"""
+        written: int = 0
+        while written < len(data):
+            if hasattr(os, "pwrite"):
+                written += os.pwrite(fd, data[written:], offset + written)
+            else:  # Windows, the descriptor belongs to this connection alone so seek and write is safe
+                os.lseek(fd, offset + written, os.SEEK_SET)
+                written += os.write(fd, data[written:])
+
+    @staticmethod
+    def recv_ranges(conn, file_path: Path, num_bytes: int, progress: StripeProgress | None = None,
+                    commit: Callable[[int, int, int, int], None] | None = None) -> int:
+        """
+        Receives the ranges sent by send_ranges on one connection and writes each at its offset
+        into file_path, which must already exist with its final size.
+
+        Args:
+            conn: Socket connection
+            file_path: File being received, opened separately by every connection
+            num_bytes: Size of the file, ranges past its end are refused
+            progress: Counts the bytes received
+            commit: Called as commit(fd, offset, length, crc32) after each complete range, Checkpoint.commit
+
+        Returns:
+            int: Bytes of the ranges received completely, a broken connection stops early
+        """
+        header = bytearray(RANGE_HEADER.size)
+        buffer = bytearray(RANGE_BUFFER)
+        received: int = 0
+
+        try:
+            with open(file_path, 'r+b', buffering=0) as file, memoryview(buffer) as view:
+                fd: int = file.fileno()
+                while True:
+                    if recv_exact(conn, memoryview(header)) < RANGE_HEADER.size:
+                        raise ConnectionError("Connection closed before the end of the transfer")
+                    offset, length = RANGE_HEADER.unpack(header)
+                    if length == 0:
+                        return received
+                    if offset + length > num_bytes:
+                        raise ConnectionError(f"Range {offset}+{length} is outside the {num_bytes} byte file")
+
+                    start: int = offset
+                    end: int = offset + length
+                    crc: int = 0
+                    while offset < end:
+                        count: int = conn.recv_into(view[:min(RANGE_BUFFER, end - offset)])
+                        if not count:
+                            raise ConnectionError("Connection closed before the end of the transfer")
+                        Transfer.pwrite(fd, view[:count], offset)
+                        if commit:
+                            crc = zlib.crc32(view[:count], crc)
+                        offset += count
+                        if progress:
+                            progress.add(count)
+                    if commit:
+                        commit(fd, start, length, crc)
+                    received += length
+
+        except Exception as e:
+            print(f"Error receiving file ranges: {e}")
+            return received
+
+    @staticmethod
+    def send_delta(conn, file_path: Path, ops: list[tuple[Frame, int, int]], num_bytes: int,
+                   progress_func: Callable[[int, int, int], None] = lambda num, num2, num3: None) -> bool:
+        """
+        Sends the instructions computed by Delta.diff: a COPY frame for every run of blocks the
+        receiver already has and DATA frames with the bytes of file_path in between.
+        The END frame carries the SHA-256 of the whole file so the receiver can check the result.
+
+        Args:
+            conn: Socket connection
+            file_path: The new version of the file
+            ops: (Frame.COPY, old offset, length) and (Frame.DATA, offset, length) in file order
+            num_bytes: Size of file_path, used for the progress bar
+            progress_func: Callable to display transfer progress: progress_func(percentage, speed, total_size)
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        progress_func(0, 0, num_bytes)
+        start_time: float = time.perf_counter()
+        elapsed_bytes: int = 0
+        chunk_buffer = bytearray(CHUNK_HEADER.size + CHUNK_SIZE)
+        copy_buffer = bytearray(CHUNK_HEADER.size + DELTA_COPY.size)
+
+        try:
+            with open(file_path, 'rb') as file:
+                position: int = 0  # bytes of the new file described so far
+                for frame, offset, length in ops:
+                    if frame == Frame.COPY:
+                        DELTA_COPY.pack_into(copy_buffer, CHUNK_HEADER.size, offset, length)
+                        Transfer.send_frame(conn, Frame.COPY, copy_buffer)
+                    else:
+                        file.seek(offset)
+                        end: int = offset + length
+                        while offset < end:
+                            size: int = min(CHUNK_SIZE, end - offset)
+                            view = memoryview(chunk_buffer)[:CHUNK_HEADER.size + size]
+                            if file.readinto(view[CHUNK_HEADER.size:]) < size:
+                                raise EOFError(f"{file_path} changed while it was sent")
+                            Transfer.send_frame(conn, Frame.DATA, view)
+                            view.release()
+                            offset += size
+                            elapsed_bytes += size
+                    position += length
+
+                    elapsed_time = time.perf_counter() - start_time
+                    if elapsed_time >= 0.2:
+                        progress_func(position * 100 // max(num_bytes, 1), int(elapsed_bytes / elapsed_time), num_bytes)
+                        start_time = time.perf_counter()
+                        elapsed_bytes = 0
+
+                file.seek(0)
+                digest: bytes = hashlib.file_digest(file, "sha256").digest()
+
+            Transfer.send_frame(conn, Frame.END, bytearray(CHUNK_HEADER.size) + digest)
+            return True
+
+        except Exception as e:
+            print(f"Error sending delta: {e}")
+            Transfer.abort_stream(conn)
             return False
         finally:
-            #  close the buffer to release memory immediately
+            progress_func(99, 0, num_bytes)
+
+    @staticmethod
+    def recv_delta(conn, base_path: Path, file_path: Path, num_bytes: int,
+                   progress_func: Callable[[int, int, int], None] = lambda num, num2, num3: None) -> str | None:
+        """
+        Builds file_path from the frames sent by send_delta, copying blocks out of base_path.
+        The result is kept only if it has num_bytes and the SHA-256 the sender announced,
+        otherwise it is removed and base_path stays as it was.
+
+        Args:
+            conn: Socket connection
+            base_path: The old version of the file
+            file_path: Where the new version is written, a temporary file next to base_path
+            num_bytes: Size of the new version
+            progress_func: Callable to display transfer progress: progress_func(percentage, speed, total_size)
+
+        Returns:
+            str | None: SHA-256 of the new file as hex, None if it was not received completely
+        """
+        header = bytearray(CHUNK_HEADER.size)
+        chunk_buffer = bytearray(CHUNK_SIZE)  # reused for every frame
+        file_hash = hashlib.sha256()
+        progress_func(0, 0, num_bytes)
+
+        try:
+            with open(base_path, 'rb') as base, open(file_path, 'wb') as file:
+                base_size: int = os.fstat(base.fileno()).st_size
+                written: int = 0
+                while True:
+                    frame, payload = Transfer.recv_frame(conn, header, chunk_buffer)
+                    if frame == Frame.END:
+                        break
+                    if frame == Frame.ABORT:
+                        raise ConnectionError("Transfer cancelled by the sender")
+
+                    if frame == Frame.COPY:
+                        offset, length = DELTA_COPY.unpack(payload)
+                        if offset + length > base_size:
+                            raise ConnectionError(f"Copy of {offset}+{length} is outside the {base_size} byte file")
+                        base.seek(offset)
+                        end: int = offset + length
+                        while offset < end:
+                            data: bytes = base.read(min(RANGE_BUFFER, end - offset))
+                            if not data:
+                                raise EOFError(f"{base_path} changed while it was rebuilt")
+                            file.write(data)
+                            file_hash.update(data)
+                            offset += len(data)
+                        written += length
+                    else:
+                        file.write(payload)
+                        file_hash.update(payload)
+                        written += len(payload)
+                    payload.release()
+
+                    if written > num_bytes:
+                        raise ConnectionError(f"Delta is longer than the {num_bytes} bytes announced")
+                    progress_func(written * 100 // max(num_bytes, 1), 0, num_bytes)
+
+            if written != num_bytes or bytes(payload) != file_hash.digest():
+                raise ValueError("Rebuilt file does not match the file that was sent")
+            return file_hash.hexdigest()
+
+        except Exception as e:
+            print(f"Error receiving delta: {e}")
+            file_path.unlink(missing_ok=True)
+            return None
+        finally:
             progress_func(100, 0, num_bytes)
-            in_memory_zip.close()
 
     @staticmethod
     def file_traversal(base_path: Path, start_path: Path) -> Path:
@@ -158,13 +572,15 @@ class Transfer:
             return base_path
 
     @staticmethod
-    def recursively_remove_dir(base_path: Path, server_dir: Path) -> bool:
+    def recursively_remove_dir(base_path: Path, server_dir: Path, blobs: BlobStore | None = None) -> bool:
 
         del_path: Path = Transfer.file_traversal(base_path, server_dir)
 
         if base_path.resolve() == del_path:
             return False
 
+        # files that share their content with a stored blob, checked once they are gone
+        linked: list[tuple[int, int]] = BlobStore.inodes(del_path) if blobs else []
         try:
             if del_path.is_dir():
                 shutil.rmtree(del_path)
@@ -175,6 +591,9 @@ class Transfer:
         except Exception as e:
             print(f"Error: {del_path} : {e}")
             return False
+        finally:
+            if blobs:
+                blobs.release(linked)
 
 
     @staticmethod
@@ -187,13 +606,16 @@ class Transfer:
             return False
 
     @staticmethod
-    def delete_file(base_path: Path, server_dir: Path) -> bool:
+    def delete_file(base_path: Path, server_dir: Path, blobs: BlobStore | None = None) -> bool:
         try:
             base_path: Path = Transfer.file_traversal(base_path, server_dir)
             if base_path.exists() and base_path.is_file():
+                linked: list[tuple[int, int]] = BlobStore.inodes(base_path) if blobs else []
                 base_path.unlink()
+                if blobs:
+                    blobs.release(linked)
                 return True
             else:
                 return False
         except Exception as e:
-            return False
\ No newline at end of file
+            return False
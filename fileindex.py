@@ -0,0 +1,181 @@
+"""
+Metadata of every entry in the server directory kept in the files table of data.db, so DIR,
+TREE, existence checks and size totals are indexed lookups instead of walks of the disk.
+Paths are relative to the server directory in posix form, the parent of a top level entry is "".
+
+The server's handlers call update() with whatever they wrote, created or deleted, which
+rereads that part of the disk. A reconciliation at startup compares every directory with
+its entries and fixes the differences, changes made while the server was down show up then.
+Changes made by another process while the server runs are not seen until the next start.
+"""
+import os
+import stat
+import time
+from pathlib import Path
+from typing import Callable, Iterator
+
+import dirscan
+from database import DataStorage
+from metrics import Metrics
+from relativepath import RelativePath
+from search import SearchQuery
+
+RECONCILE_BATCH = 10000  # rows written per transaction by reconcile()
+
+
+class FileIndex:
+    def __init__(self, data: DataStorage, root: Path, metrics: Metrics):
+        self.data: DataStorage = data
+        self.root: Path = root.resolve()
+        self.metrics: Metrics = metrics
+        self._prefix: str = os.path.join(str(self.root), "")
+
+    def key(self, path: Path) -> str | None:
+        """Path of the entry in the table, "" for the root, None for a resolved path outside of it"""
+        text: str = str(path)
+        if not text.startswith(self._prefix):
+            return "" if path == self.root else None
+        return text[len(self._prefix):].replace(os.sep, "/")
+
+    def lookup(self, path: Path) -> tuple[int, float, bool] | None:
+        """(size, mtime, is_dir) of a resolved path, None if it does not exist"""
+        key: str | None = self.key(path)
+        if key is None:
+            return None
+        if not key:
+            return 0, 0.0, True
+        return self.data.get_file(key)
+
+    def lookup_many(self, paths: list[Path]) -> list[tuple[int, float, bool] | None]:
+        """lookup of every resolved path in paths, read from the table with one query"""
+        keys: list[str | None] = [self.key(path) for path in paths]
+        found: dict[str, tuple[int, float, bool]] = self.data.get_files([key for key in keys if key])
+        return [None if key is None else found.get(key) if key else (0, 0.0, True) for key in keys]
+
+    def is_dir(self, path: Path) -> bool:
+        entry: tuple[int, float, bool] | None = self.lookup(path)
+        return entry is not None and entry[2]
+
+    def total_size(self, path: Path) -> int:
+        """Bytes of the files at and below a resolved path"""
+        key: str | None = self.key(path)
+        return 0 if key is None else self.data.files_size(key)
+
+    def children(self, directory: Path) -> Callable[[tuple[str, ...]], list[tuple[str, bool, int, float]]]:
+        """Children for ListingCache.walk that read the entries below directory from the table"""
+        key: str = self.key(directory) or ""
+
+        def children(parts: tuple[str, ...]) -> list[tuple[str, bool, int, float]]:
+            return self.data.list_files("/".join((key,) + parts) if key else "/".join(parts))
+        return children
+
+    @staticmethod
+    def entry(parts: tuple[str, ...], row: tuple[str, bool, int, float]) -> RelativePath:
+        """The RelativePath RelativePath.from_path would build for a row, without touching the disk"""
+        name, is_dir, size, mtime = row
+        if is_dir:
+            return RelativePath("/".join(parts))
+        return RelativePath("/".join(parts), name, size, mtime)
+
+    def search(self, directory: Path, query: SearchQuery, cursor: str,
+               limit: int) -> tuple[list[RelativePath], str]:
+        """
+        A page of the entries below directory that match query, in order of their path.
+        Returns: The entries with paths relative to directory like a TREE, and the cursor of the next page
+        """
+        key: str = self.key(directory) or ""
+        prefix: str = f"{key}/" if key else ""
+        rows: list[tuple[str, str, int, float, bool]] = self.data.search_files(
+            key, prefix + cursor if cursor else "", limit + 1, query.pattern, query.is_glob,
+            query.min_size, query.max_size, query.since)
+
+        paths: list[RelativePath] = [
+            RelativePath(path[len(prefix):]) if is_dir else RelativePath(path[len(prefix):], name, size, mtime)
+            for path, name, size, mtime, is_dir in rows[:limit]]
+        return paths, paths[-1].location if len(rows) > limit else ""
+
+    def update(self, path: Path) -> None:
+        """
+        Rereads path and everything below it from the disk, called by a handler after it changed path.
+        Directories above it are added as well, a new directory may have been created with its parents.
+        The root itself is only read by reconcile(), a request can not make the server walk everything.
+        """
+        path = path.resolve()
+        key: str | None = self.key(path)
+        if not key:
+            return
+
+        try:
+            path_stat: os.stat_result = os.stat(path)
+        except OSError:
+            self.data.set_files([key], [])  # deleted
+            return
+
+        rows: list[tuple[str, str, str, int, float, bool]] = [self._row(key, path.name, path_stat)]
+        parent: str = key.rpartition("/")[0]
+        while parent:
+            try:
+                rows.append(self._row(parent, parent.rpartition("/")[2], os.stat(self.root / parent)))
+            except OSError:
+                return  # removed again in the meantime, its own handler updates it
+            parent = parent.rpartition("/")[0]
+        if stat.S_ISDIR(path_stat.st_mode):
+            rows += self._rows(path, key)
+        self.data.set_files([key], rows)
+
+    def reconcile(self) -> tuple[int, int]:
+        """
+        Brings the table in line with the disk, one directory at a time so memory stays small.
+        Returns: (entries added or changed, entries removed together with everything below them)
+        """
+        start: float = time.perf_counter()
+        written: int = 0
+        removed_total: int = 0
+        removed: list[str] = []
+        rows: list[tuple[str, str, str, int, float, bool]] = []
+        pending: list[tuple[Path, str]] = [(self.root, "")]
+        while pending:
+            directory, key = pending.pop()
+            indexed: dict[str, tuple[bool, int, float]] = {
+                name: (is_dir, size, mtime) for name, is_dir, size, mtime in self.data.list_files(key)}
+            for row, descend in self._scan(directory, key):
+                old: tuple[bool, int, float] | None = indexed.pop(row[2], None)
+                if old != (row[5], row[3], row[4]):
+                    if old is not None and old[0] and not row[5]:
+                        removed.append(row[0])  # a directory became a file, its entries go
+                    rows.append(row)
+                if descend:
+                    pending.append((directory / row[2], row[0]))
+            removed += [f"{key}/{name}" if key else name for name in indexed]
+
+            if len(rows) + len(removed) >= RECONCILE_BATCH or not pending:
+                self.data.set_files(removed, rows)
+                written += len(rows)
+                removed_total += len(removed)
+                rows, removed = [], []
+        entries: int = self.data.count_files()
+        self.metrics.set("index_entries", entries)
+        print(f"Indexed {entries} entries of {self.root}: {written} written, {removed_total} removed "
+              f"in {time.perf_counter() - start:.2f} s")
+        return written, removed_total
+
+    @staticmethod
+    def _row(key: str, name: str, path_stat: os.stat_result) -> tuple[str, str, str, int, float, bool]:
+        """A directory has neither size nor time, like its RelativePath"""
+        if stat.S_ISDIR(path_stat.st_mode):
+            return key, key.rpartition("/")[0], name, 0, 0.0, True
+        return key, key.rpartition("/")[0], name, path_stat.st_size, path_stat.st_mtime, False
+
+    @staticmethod
+    def _scan(directory: Path, key: str) -> list[tuple[tuple[str, str, str, int, float, bool], bool]]:
+        """Rows of the entries directly in directory and whether to descend into them, see dirscan.scan"""
+        return [((f"{key}/{name}" if key else name, key, name, size, mtime, is_dir), descend)
+                for name, descend, is_dir, size, mtime in dirscan.scan(directory)]
+
+    @staticmethod
+    def _rows(directory: Path, key: str) -> Iterator[tuple[str, str, str, int, float, bool]]:
+        """Rows of every entry below directory"""
+        for row, descend in FileIndex._scan(directory, key):
+            yield row
+            if descend:
+                yield from FileIndex._rows(directory / row[2], row[0])
@@ -0,0 +1,231 @@
+"""
+Directory listings for DIR and TREE, sent a page at a time.
+Entries come from a walk in sorted depth first order, so every entry has a fixed place and
+a page ends with a cursor, the path of its last entry, that the next request continues after.
+The server keeps no state a cursor depends on: a walk that is still open continues where
+it stopped, otherwise a new walk skips everything up to the cursor.
+The walk reads the file index (fileindex.py) when the server keeps one, the disk with
+os.scandir otherwise (dirscan.py), optionally reading directories ahead of it in a thread pool.
+
+A listing that fits in one page is built for every double click and refresh of the GUI,
+so those are kept in memory and reused while the directories they cover are unchanged.
+The server's own handlers drop the listings a change touches. Without the index a cached
+listing is also checked against the modification time of every directory it covers, adding,
+removing or renaming an entry changes it, a file rewritten in place by another process only
+shows up once its directory changes or the listing is evicted. The index only changes through
+those handlers, and each change drops the listings of the directories at, above and below the
+changed path, so the listings built from the index need no check.
+"""
+import bisect
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterator
+
+import dirscan
+from dirscan import Scanner
+from fileindex import FileIndex
+from metrics import Metrics
+from relativepath import RelativePath
+from search import SearchQuery
+
+ENTRY_OVERHEAD = 150  # approximate bytes of a RelativePath and its name string besides the characters
+PAGE_SIZE = 5000  # entries per DIR/TREE reply unless the client asks for fewer
+MAX_PAGE_SIZE = 50000
+OPEN_WALKS = 64  # walks kept open for the next page, the oldest is dropped beyond that
+
+
+class Listing:
+    """A cached listing, the sort keys of its entries and the modification times of the directories it was built from"""
+
+    def __init__(self, paths: list[RelativePath], keys: list[tuple[str, ...]], mtimes: dict[str, int]):
+        self.paths: list[RelativePath] = paths
+        self.keys: list[tuple[str, ...]] = keys
+        self.mtimes: dict[str, int] = mtimes
+        self.size: int = sum(ENTRY_OVERHEAD + len(path.location) for path in paths)
+
+    def is_current(self) -> bool:
+        for directory, mtime in self.mtimes.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def page(self, after: tuple[str, ...], limit: int) -> tuple[list[RelativePath], str]:
+        start: int = bisect.bisect_right(self.keys, after)
+        end: int = start + limit
+        cursor: str = "/".join(self.keys[end - 1]) if end < len(self.keys) else ""
+        return self.paths[start:end], cursor
+
+
+class ListingCache:
+    """
+    Least recently used listings keyed by the resolved directory and whether it is recursive,
+    evicted once their estimated size passes max_bytes, and the walks of larger listings
+    that wait for their next page.
+    """
+
+    def __init__(self, max_bytes: int, metrics: Metrics, index: FileIndex | None = None, threads: int = 0):
+        self.max_bytes: int = max_bytes
+        self.metrics: Metrics = metrics
+        self.index: FileIndex | None = index
+        self.scanner: Scanner = Scanner(threads)  # reads the disk when there is no index
+        self.lock = threading.Lock()
+        self.listings: OrderedDict[tuple[Path, bool], Listing] = OrderedDict()
+        # the entry taken from a walk to find out whether another page follows, and the walk
+        self.walks: OrderedDict[tuple[Path, bool, str],
+                                tuple[tuple[tuple[str, ...], RelativePath], Iterator]] = OrderedDict()
+        self.size: int = 0
+        self.generation: int = 0  # counts invalidations, a listing built across one is not stored
+
+    def page(self, base_path: Path, recursive: bool, cursor: str = "",
+             limit: int = PAGE_SIZE) -> tuple[list[RelativePath], str]:
+        """
+        Lists base_path a page at a time.
+
+        Args:
+            base_path: Resolved directory to list
+            recursive: TREE lists every entry below base_path, DIR only its children
+            cursor: Cursor of the previous page, empty for the first page
+            limit: Most entries returned
+
+        Returns:
+            The entries after cursor and the cursor of the next page, empty once the listing is complete.
+            The list may be shared with later callers and must not be changed.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        after: tuple[str, ...] = tuple(cursor.split("/")) if cursor else ()
+        key: tuple[Path, bool] = (base_path, recursive)
+        with self.lock:
+            listing: Listing | None = self.listings.get(key)
+            if listing is not None:
+                self.listings.move_to_end(key)
+            open_walk = self.walks.pop((base_path, recursive, cursor), None)
+            generation: int = self.generation
+        if listing is not None and listing.is_current():
+            self.metrics.incr("listing_cache_hits")
+            return listing.page(after, limit)
+        self.metrics.incr("listing_cache_misses")
+
+        # a listing of the disk that starts at the beginning records the directory times for the cache,
+        # taken before each directory is read so a change during the walk leaves it stale instead of wrong
+        mtimes: dict[str, int] | None = None if after else {}
+        first: list[tuple[tuple[str, ...], RelativePath]] = []
+        if open_walk is not None:
+            first, walk = [open_walk[0]], open_walk[1]
+        elif self.index is not None:
+            walk = self.walk(self.index.children(base_path), FileIndex.entry, recursive, after)
+        else:
+            walk = self.walk(self.scanner.children(base_path, recursive, after, mtimes), dirscan.entry,
+                             recursive, after)
+
+        paths: list[RelativePath] = []
+        keys: list[tuple[str, ...]] = []
+        for parts, path in itertools.chain(first, walk):
+            if len(paths) == limit:
+                # there is more, the walk continues from here on the next page
+                next_cursor: str = "/".join(keys[-1])
+                with self.lock:
+                    # kept apart instead of chained back onto the walk, chains would nest one level per page
+                    self.walks[(base_path, recursive, next_cursor)] = ((parts, path), walk)
+                    while len(self.walks) > OPEN_WALKS:
+                        self.walks.popitem(last=False)
+                return paths, next_cursor
+            paths.append(path)
+            keys.append(parts)
+
+        # the empty listing of a directory that does not exist is not kept, on the disk it has no times
+        if self.index is not None:
+            if not after and self.index.is_dir(base_path):
+                self._store(key, Listing(paths, keys, {}), generation)
+        elif mtimes:
+            self._store(key, Listing(paths, keys, mtimes), generation)
+        return paths, ""
+
+    def search(self, base_path: Path, query: SearchQuery, cursor: str = "",
+               limit: int = PAGE_SIZE) -> tuple[list[RelativePath], str]:
+        """
+        Finds the entries below base_path that match query a page at a time, like page() does for a TREE.
+        Without the index every entry is read from the disk, the next page walks again from the cursor.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        if self.index is not None:
+            return self.index.search(base_path, query, cursor, limit)
+
+        after: tuple[str, ...] = tuple(cursor.split("/")) if cursor else ()
+        paths: list[RelativePath] = []
+        for parts, path in self.walk(self.scanner.children(base_path, True, after), dirscan.entry, True, after):
+            if query.matches(parts[-1], path.isdir, path.bytes, path.time):
+                if len(paths) == limit:
+                    return paths, paths[-1].location
+                paths.append(path)
+        return paths, ""
+
+    def _store(self, key: tuple[Path, bool], listing: Listing, generation: int) -> None:
+        if listing.size > self.max_bytes:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self._remove(key)
+            self.listings[key] = listing
+            self.size += listing.size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.listings)))
+            self.metrics.set("listing_cache_bytes", self.size)
+
+    def invalidate(self, changed: Path) -> None:
+        """
+        Drops the listings of changed, of every directory above it and of every directory below it,
+        called after a handler wrote there: a removed or renamed directory takes the ones below with it.
+        Open walks of those directories are closed too, the next page starts a new walk from its cursor.
+        """
+        changed = changed.resolve()
+        with self.lock:
+            self.generation += 1
+            for key in [key for key in self.listings
+                        if changed.is_relative_to(key[0]) or key[0].is_relative_to(changed)]:
+                self._remove(key)
+            for key in [key for key in self.walks
+                        if changed.is_relative_to(key[0]) or key[0].is_relative_to(changed)]:
+                del self.walks[key]
+            self.metrics.set("listing_cache_bytes", self.size)
+
+    def _remove(self, key: tuple[Path, bool]) -> None:
+        listing: Listing | None = self.listings.pop(key, None)
+        if listing is not None:
+            self.size -= listing.size
+
+    @staticmethod
+    def walk(children: Callable[[tuple[str, ...]], list[tuple]], entry: Callable[[tuple[str, ...], tuple], RelativePath],
+             recursive: bool, after: tuple[str, ...] = (),
+             parts: tuple[str, ...] = ()) -> Iterator[tuple[tuple[str, ...], RelativePath]]:
+        """
+        Yields (path parts relative to the listed directory, entry) of the entries below it
+        that come after the entry after. Children are sorted by name and every directory comes
+        right before its children, which is the order of the parts tuples.
+
+        Args:
+            children: Returns the rows of a directory given its parts, sorted by name,
+                each starting with the name and whether the walk descends into it
+            entry: Builds the RelativePath of a row given its parts, only called for rows that are yielded
+            recursive: Descends into directories, a DIR only lists the children
+            after: Parts of the cursor, () from the beginning
+            parts: Parts of the directory being walked
+        """
+        for row in children(parts):
+            child_parts: tuple[str, ...] = parts + (row[0],)
+            prefix: tuple[str, ...] = after[:len(child_parts)]
+            if child_parts < prefix:
+                continue  # the whole subtree was on earlier pages
+            child_after: tuple[str, ...] = ()
+            if child_parts == prefix:
+                child_after = after  # the cursor or a directory above it, already sent
+            else:
+                yield child_parts, entry(child_parts, row)
+            if recursive and row[1]:
+                yield from ListingCache.walk(children, entry, recursive, child_after, child_parts)
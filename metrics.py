@@ -0,0 +1,39 @@
+"""
+Counters and gauges describing the running server (queue depth, rejections, cache hits...).
+Any module records into SERVER_METRICS, the STATS command reports a snapshot of it.
+"""
+import threading
+
+from type import format_table
+
+
+class Metrics:
+    """Thread safe named numbers, counters only go up while gauges are overwritten"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: dict[str, float] = {}
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def set(self, name: str, value: float) -> None:
+        with self._lock:
+            self._values[name] = value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def table(self) -> str:
+        """Formats the snapshot as a table sorted by name"""
+        rows: list[list[str]] = [[name, f"{value:g}"] for name, value in sorted(self.snapshot().items())]
+        return format_table(rows, ["Metric", "Value"])
+
+
+SERVER_METRICS = Metrics()
@@ -0,0 +1,143 @@
+"""
+Statistics of every command the server runs, kept in the statistics table of data.db:
+the bytes moved, how long the transfer took and its rate, and the time to answer a command.
+record() only appends to a ring buffer in memory, a background thread writes what piled up
+every FLUSH_INTERVAL seconds in one executemany transaction, so no command waits for the
+database, and once more when the server exits. A batch that could not be written goes back
+into the buffer for the next try. When the writer falls behind the oldest records are
+overwritten, counted in stats_dropped.
+The same thread prunes the rows older than the retention once every PRUNE_INTERVAL, their
+percentiles live on in the rollups (rollup.py).
+"""
+import atexit
+import threading
+import time
+from collections import deque
+
+from database import DataStorage
+from metrics import Metrics
+from type import Command
+
+RING_SIZE = 65536  # records waiting to be written, past it the oldest are overwritten
+FLUSH_INTERVAL = 1.0  # seconds between writes
+PRUNE_INTERVAL = 3600.0  # seconds between deletions of old rows
+
+
+class Operation:
+    """A transfer being served, its handler fills in the bytes once they were moved"""
+
+    __slots__ = ("username", "command", "started", "num_bytes")
+
+    def __init__(self, username: str, command: Command):
+        self.username: str = username
+        self.command: Command = command
+        self.started: float = time.perf_counter()
+        self.num_bytes: int = 0  # stays 0 when the transfer did not happen or failed
+
+
+class StatsRecorder:
+    """Buffers statistics records and writes them in batches from a thread of its own"""
+
+    def __init__(self, data: DataStorage, metrics: Metrics, capacity: int = RING_SIZE,
+                 interval: float = FLUSH_INTERVAL, retention: float | None = None):
+        """
+        Args:
+            data: Database the records are written to
+            metrics: Receives the stats_ counters
+            capacity: Records buffered at most
+            interval: Seconds between writes
+            retention: Seconds the rows are kept, None keeps them
+        """
+        self.data: DataStorage = data
+        self.metrics: Metrics = metrics
+        self.interval: float = interval
+        self.retention: float | None = retention
+        self.lock = threading.Lock()
+        # (username, command, bytes, upload rate, download rate, transfer time, response time, timestamp)
+        self.ring: deque[tuple] = deque(maxlen=capacity)
+        threading.Thread(target=self._run, name="stats-recorder", daemon=True).start()
+        # the thread is a daemon and stops with the server, what it did not write yet is written at exit
+        atexit.register(self.close)
+
+    def record(self, username: str, command: Command, num_bytes: int = 0, transfer_time: float | None = None,
+               response_time: float | None = None) -> None:
+        """
+        Adds a record, rates are worked out from num_bytes and transfer_time.
+
+        Args:
+            username: User the connection logged in as, "" before a login
+            command: Command that ran
+            num_bytes: Bytes uploaded or downloaded
+            transfer_time: Seconds the transfer took, None for a command without one
+            response_time: Seconds until the command was answered, None for a transfer
+        """
+        rate: float | None = num_bytes / max(transfer_time, 1e-6) if transfer_time is not None else None
+        row: tuple = (username, command.name, num_bytes,
+                      rate if command == Command.UPLOAD else None, rate if command == Command.DOWNLOAD else None,
+                      transfer_time, response_time, time.time())
+        with self.lock:
+            if len(self.ring) == self.ring.maxlen:
+                self.metrics.incr("stats_dropped")
+            self.ring.append(row)
+
+    def finish(self, operation: Operation) -> None:
+        """Records a transfer once its handler is done, one that moved nothing is left out"""
+        if operation.num_bytes:
+            self.record(operation.username, operation.command, operation.num_bytes,
+                        time.perf_counter() - operation.started)
+
+    def flush(self) -> int:
+        """Writes every buffered record, returns how many"""
+        with self.lock:
+            rows: list[tuple] = list(self.ring)
+            self.ring.clear()
+        if not rows:
+            return 0
+
+        start: float = time.perf_counter()
+        try:
+            # the usernames are looked up in the map DataStorage keeps, not by every insert
+            self.data.add_statistics([(self.data.user_id(username) if username else None, *rest)
+                                      for username, *rest in rows])
+        except Exception:
+            self._requeue(rows)
+            raise
+        self.metrics.incr("stats_written", len(rows))
+        self.metrics.set("stats_flush_ms", (time.perf_counter() - start) * 1000)
+        return len(rows)
+
+    def close(self) -> None:
+        """Writes the records still buffered"""
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[STATS ERROR] {e}")
+
+    def _requeue(self, rows: list[tuple]) -> None:
+        """Puts a batch that failed back in front of the newer records, what no longer fits is dropped"""
+        with self.lock:
+            room: int = self.ring.maxlen - len(self.ring)
+            kept: list[tuple] = rows[len(rows) - room:] if room < len(rows) else rows
+            if len(kept) < len(rows):
+                self.metrics.incr("stats_dropped", len(rows) - len(kept))
+            self.ring.extendleft(reversed(kept))
+
+    def prune(self) -> int:
+        """Deletes the rows past the retention, returns how many"""
+        if self.retention is None:
+            return 0
+        deleted: int = self.data.prune_statistics(self.retention)
+        self.metrics.incr("stats_pruned", deleted)
+        return deleted
+
+    def _run(self) -> None:
+        next_prune: float = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+                if time.monotonic() >= next_prune:
+                    self.prune()
+                    next_prune = time.monotonic() + PRUNE_INTERVAL
+            except Exception as e:
+                print(f"[STATS ERROR] {e}")
@@ -1,8 +1,12 @@
 import os
+import sys
 import time
+from operator import attrgetter
 from pathlib import Path
 from typing import Union
 
+_intern = sys.intern
+
 
 class RelativePath:
     """
@@ -13,8 +17,8 @@ class RelativePath:
     Attributes:
         location (str): The relative location of the base_path.
         name (str): The name of the file or directory.
-        bytes_size (int): The size of the file in bytes.
-        mtime (float): The modification time of the file or directory.
+        bytes (int): The size of the file in bytes.
+        time (float): The modification time of the file or directory.
         isdir (bool): True if this represents a directory.
         isfile (bool): True if this represents a file.
 
@@ -22,14 +26,44 @@ class RelativePath:
         from_path: Creates a RelativePath from a Path object.
         from_base: Creates a RelativePath from a base folder and optional subfolder.
 
-
+    Listings hold up to hundreds of thousands of these, so they are slotted and immutable.
+    The location is kept as its directory prefix, interned and shared by every entry of that
+    directory, and its last part, which is the name object itself for a file. Being immutable
+    they are hashable, copies return the same object, and the Path and hash are built once.
     """
+    __slots__ = ("_prefix", "_tail", "_name", "_bytes", "_time", "_hash", "_path")
 
     def __init__(self, location: str, name: str = "", bytes_size: int = 0, mtime: float = 0.0) -> None:
-        self.location = location
-        self.name = name
-        self.bytes = bytes_size
-        self.time = mtime
+        head, sep, tail = location.rpartition("/")
+        self._prefix: str = _intern(head + sep) if sep else ""  # "dir/sub/", "" at the top
+        self._tail: str = name if tail == name else tail
+        self._name: str = name
+        self._bytes: int = bytes_size
+        self._time: float = mtime
+        self._hash: int | None = None  # built on first use
+        self._path: Path | None = None
+
+    # read only, a RelativePath never changes once built
+    name = property(attrgetter("_name"), doc="The name of a file, empty for a directory")
+    bytes = property(attrgetter("_bytes"), doc="The size of the file in bytes")
+    time = property(attrgetter("_time"), doc="The modification time of the file")
+
+    @property
+    def location(self) -> str:
+        """The relative location of the base_path"""
+        return self._prefix + self._tail
+
+    def __copy__(self) -> 'RelativePath':
+        return self
+
+    def __deepcopy__(self, memo: dict) -> 'RelativePath':
+        return self
+
+    def __reduce__(self) -> tuple:
+        # the shared prefix and a tail that is the name are pickled once and referenced after that
+        if self._name:
+            return _restore, (self._prefix, self._tail, self._name, self._bytes, self._time)
+        return _restore, (self._prefix, self._tail)
 
     @classmethod
     def from_base(cls, folder: str = "", base_path: Path | None = None):
@@ -83,7 +117,7 @@ class RelativePath:
     def true_name(self):
         """Returns the true name of the file or directory."""
         if self.isdir:
-            p = Path(self.location).parts
+            p = self.path().parts
             if len(p) >= 1:
                 return p[0]
             else:
@@ -186,10 +220,9 @@ class RelativePath:
 
     def path(self) -> Path:
         """Returns a pathlib Path object representing the full base_path."""
-        if self.name:
-            return Path(Path(self.location).as_posix()) / self.name
-        else:
-            return Path(Path(self.location).as_posix())
+        if self._path is None:
+            self._path = Path(self.location, self._name)
+        return self._path
 
     def __repr__(self) -> str:
         """Returns a detailed string representation of the RelativePath."""
@@ -203,10 +236,26 @@ class RelativePath:
         """Checks equality based on location, name, and bytes size."""
         if not isinstance(other, RelativePath):
             return False
-        return (self.location == other.location and
-                self.name == other.name and
-                self.bytes == other.bytes)
+        return (self._tail == other._tail and
+                self._name == other._name and
+                self._bytes == other._bytes and
+                self._prefix == other._prefix)
 
     def __hash__(self) -> int:
         """Allows RelativePath to be used in sets and as dictionary keys."""
-        return hash((self.location, self.name, self.bytes))
\ No newline at end of file
+        if self._hash is None:
+            self._hash = hash((self._prefix, self._tail, self._name, self._bytes))
+        return self._hash
+
+
+def _restore(prefix: str, tail: str, name: str = "", bytes_size: int = 0, mtime: float = 0.0) -> RelativePath:
+    """Unpickles a RelativePath from its parts, see RelativePath.__reduce__"""
+    path: RelativePath = RelativePath.__new__(RelativePath)
+    path._prefix = _intern(prefix)
+    path._tail = tail
+    path._name = name
+    path._bytes = bytes_size
+    path._time = mtime
+    path._hash = None
+    path._path = None
+    return path
@@ -0,0 +1,183 @@
+"""
+Checkpoints of large file transfers so a dropped connection does not start them over.
+The receiver writes into a partial file and records every range that reached the disk
+together with the crc32 of its bytes. On the next attempt the sender checks those crcs
+against its own copy and only sends the ranges that are missing or did not match.
+Partials that are not resumed within PARTIAL_TTL_HOURS are removed.
+"""
+import errno
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from file_transfer import Transfer
+
+PART_SUFFIX = ".part"  # partial file next to the final one
+RECORD_SUFFIX = ".ckpt"  # checkpoint record next to the partial file
+VERIFY_BUFFER = 1024 * 1024  # bytes read at a time when checking a range
+
+
+class Checkpoint:
+    """
+    A partial file and the ranges of it that are safely on disk, (offset, length, crc32) each.
+    Ranges are committed by every connection of a transfer so all methods are thread safe.
+    """
+
+    def __init__(self, part_path: Path, num_bytes: int, version: int, ranges: list[tuple[int, int, int]]):
+        self.part_path: Path = part_path
+        self.record_path: Path = part_path.with_name(part_path.name + RECORD_SUFFIX)
+        self.num_bytes: int = num_bytes
+        self.version: int = version
+        self.lock = threading.Lock()
+        self.ranges: set[tuple[int, int, int]] = set(ranges)
+        self.loaded: frozenset[tuple[int, int, int]] = frozenset(ranges)  # what a previous attempt left
+
+    @staticmethod
+    def load(part_path: Path, num_bytes: int, version: int, max_bytes: int | None = None) -> "Checkpoint":
+        """
+        Opens the checkpoint of part_path if it belongs to the same version of the same file,
+        otherwise starts over with a new preallocated partial file.
+
+        Args:
+            part_path: Partial file of the transfer
+            num_bytes: Size of the complete file, as the sender claims it
+            version: Identifies the content of the source, its modification time in ns
+            max_bytes: Largest num_bytes accepted, None for any
+
+        Raises:
+            ValueError: num_bytes is negative or above max_bytes
+            OSError: The partial file can not be created or the disk has no room for it
+        """
+        if type(num_bytes) is not int or num_bytes < 0 or (max_bytes is not None and num_bytes > max_bytes):
+            raise ValueError(f"Invalid file size {num_bytes!r}")
+        record_path: Path = part_path.with_name(part_path.name + RECORD_SUFFIX)
+        ranges: list[tuple[int, int, int]] = []
+        try:
+            record: dict = json.loads(record_path.read_text())
+            if (record["size"] == num_bytes and record["version"] == version
+                    and part_path.stat().st_size == num_bytes):
+                ranges = [(int(offset), int(length), int(crc)) for offset, length, crc in record["ranges"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # no usable checkpoint
+
+        checkpoint = Checkpoint(part_path, num_bytes, version, ranges)
+        if not ranges:
+            # a partial file of another version is replaced, its bytes are free again then
+            old_size: int = part_path.stat().st_size if part_path.exists() else 0
+            if num_bytes > shutil.disk_usage(part_path.parent).free + old_size:
+                raise OSError(errno.ENOSPC, f"No room for {num_bytes} bytes", str(part_path))
+            with open(part_path, 'wb') as file:
+                Transfer.preallocate(file, num_bytes)
+            checkpoint.save()
+        return checkpoint
+
+    def committed(self) -> list[list[int]]:
+        """The ranges on disk, sorted by offset, in the form sent to the other side"""
+        with self.lock:
+            return [list(byte_range) for byte_range in sorted(self.ranges)]
+
+    def keep(self, verified: list[list[int]]) -> int:
+        """
+        Drops the ranges of the previous attempt that the sender did not verify, they are sent again.
+        Ranges committed since the checkpoint was loaded are kept.
+        Returns: Bytes kept from the previous attempt
+        Raises:
+            ValueError: verified is not a list of (offset, length, crc32) ints inside the file, it comes from the other side
+        """
+        if not isinstance(verified, list):
+            raise ValueError("Verified ranges must be a list")
+        verified_set: set[tuple[int, int, int]] = set()
+        for byte_range in verified:
+            if (not isinstance(byte_range, (list, tuple)) or len(byte_range) != 3
+                    or not all(type(num) is int for num in byte_range)):
+                raise ValueError(f"Invalid range {byte_range!r}")
+            offset, length, crc = byte_range
+            if offset < 0 or length <= 0 or offset + length > self.num_bytes:
+                raise ValueError(f"Range {offset}+{length} is outside of {self.num_bytes} bytes")
+            verified_set.add((offset, length, crc))
+        with self.lock:
+            self.ranges -= self.loaded - verified_set
+            self._write()
+        return sum(length for _, length, _ in self.loaded & verified_set)
+
+    def commit(self, fd: int, offset: int, length: int, crc: int) -> None:
+        """Records a range written through fd once its bytes are flushed to disk"""
+        os.fsync(fd)
+        with self.lock:
+            self.ranges.add((offset, length, crc))
+            self._write()
+
+    def covered(self) -> int:
+        with self.lock:
+            return sum(length for _, length, _ in self.ranges)
+
+    def complete(self) -> bool:
+        return self.covered() == self.num_bytes
+
+    def finish(self, file_path: Path) -> None:
+        """Moves the complete partial file to file_path and removes the record"""
+        os.replace(self.part_path, file_path)
+        self.record_path.unlink(missing_ok=True)
+
+    def save(self) -> None:
+        with self.lock:
+            self._write()
+
+    def _write(self) -> None:
+        """Replaces the record atomically so a crash never leaves half of it, the lock must be held"""
+        record: dict = {"size": self.num_bytes, "version": self.version, "ranges": sorted(self.ranges)}
+        temp_path: Path = self.record_path.with_name(self.record_path.name + ".tmp")
+        temp_path.write_text(json.dumps(record))
+        os.replace(temp_path, self.record_path)
+
+    @staticmethod
+    def verify(file_path: Path, ranges: list[list[int]]) -> list[list[int]]:
+        """Returns the ranges whose crc32 matches the bytes of file_path, run by the sender"""
+        size: int = file_path.stat().st_size
+        verified: list[list[int]] = []
+        with open(file_path, 'rb') as file:
+            for byte_range in ranges:
+                try:
+                    offset, length, crc = (int(num) for num in byte_range)
+                except (TypeError, ValueError):
+                    continue  # sent by the other side, may be anything
+                if offset < 0 or length <= 0 or offset + length > size:
+                    continue
+                file.seek(offset)
+                file_crc: int = 0
+                remaining: int = length
+                while remaining:
+                    data: bytes = file.read(min(VERIFY_BUFFER, remaining))
+                    if not data:
+                        break
+                    file_crc = zlib.crc32(data, file_crc)
+                    remaining -= len(data)
+                if not remaining and file_crc == crc:
+                    verified.append([offset, length, crc])
+        return verified
+
+    @staticmethod
+    def covered_bytes(ranges: list[list[int]]) -> int:
+        return sum(length for _, length, _ in ranges)
+
+    @staticmethod
+    def collect_stale(directory: Path, max_age: float) -> None:
+        """Removes the partial files in directory whose checkpoint was not updated for max_age seconds"""
+        now: float = time.time()
+        try:
+            records: list[Path] = list(directory.glob(f"*{PART_SUFFIX}{RECORD_SUFFIX}"))
+        except OSError:
+            return
+        for record_path in records:
+            try:
+                if now - record_path.stat().st_mtime < max_age:
+                    continue
+                record_path.with_name(record_path.name.removesuffix(RECORD_SUFFIX)).unlink(missing_ok=True)
+                record_path.unlink(missing_ok=True)
+                print(f"Removed stale partial transfer {record_path.name.removesuffix(RECORD_SUFFIX)}")
+            except OSError:
+                pass
@@ -0,0 +1,74 @@
+"""
+Rollups of the statistics table: for every minute, hour and day, a Sketch of the upload rate,
+download rate and response time of each user and of the whole server (user_id 0).
+They are updated with every batch of rows that is written (DataStorage.add_statistics), so STATS
+reads at most a window's worth of rollup rows, however long the history is, and the raw rows
+can be pruned after STATS_RETENTION_DAYS without losing the percentiles.
+"""
+from sketch import Sketch
+from type import format_bytes, format_table
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+PERIODS = (MINUTE, HOUR, DAY)  # seconds covered by a rollup row
+# the rollups of a period are kept this long, STATS reads the minutes of the last hour and the hours of the last day
+KEEP = {MINUTE: 2 * DAY, HOUR: 90 * DAY, DAY: None}
+# (name, seconds, period of the rollup rows read), at most 60, 24 and 30 rows a metric
+WINDOWS = (("last hour", HOUR, MINUTE), ("last day", DAY, HOUR), ("last 30 days", 30 * DAY, DAY))
+METRICS = ("upload_rate", "download_rate", "response_time")
+QUANTILES = (0.5, 0.95, 0.99)
+SERVER = 0  # user_id of the rollups of the whole server
+
+
+def rollups(rows: list[tuple]) -> dict[tuple[int, int, int, str], Sketch]:
+    """
+    Sketches of a batch of statistics rows.
+
+    Args:
+        rows: (user_id, command, bytes, upload_rate, download_rate, transfer_time, response_time, timestamp),
+              timestamp in seconds since the epoch
+    Returns:
+        (period, start, user_id, metric) -> Sketch of the values in that rollup
+    """
+    sketches: dict[tuple[int, int, int, str], Sketch] = {}
+    for user_id, _, _, upload_rate, download_rate, _, response_time, timestamp in rows:
+        scopes: tuple[int, ...] = (SERVER, user_id) if user_id else (SERVER,)
+        for metric, value in zip(METRICS, (upload_rate, download_rate, response_time)):
+            if value is None:
+                continue
+            for period in PERIODS:
+                start: int = int(timestamp // period * period)
+                for scope in scopes:
+                    key = (period, start, scope, metric)
+                    sketch: Sketch | None = sketches.get(key)
+                    if sketch is None:
+                        sketch = sketches[key] = Sketch()
+                    sketch.add(value)
+    return sketches
+
+
+def format_value(metric: str, value: float) -> str:
+    if metric == "response_time":
+        return f"{value * 1000:.2f} ms"
+    return f"{format_bytes(int(value))}/s"
+
+
+def report(windows: list[tuple[str, str, dict[str, Sketch]]]) -> str:
+    """
+    Formats the percentiles for STATS.
+
+    Args:
+        windows: (scope, window name, metric -> Sketch) of every window shown
+    """
+    rows: list[list[str]] = []
+    for scope, window, sketches in windows:
+        for metric in METRICS:
+            sketch: Sketch | None = sketches.get(metric)
+            if sketch is None or not sketch.count:
+                continue
+            rows.append([scope, window, metric, f"{sketch.count:,}", format_value(metric, sketch.mean()),
+                         *(format_value(metric, sketch.quantile(q)) for q in QUANTILES)])
+    if not rows:
+        return "No statistics recorded yet"
+    return format_table(rows, ["Scope", "Window", "Metric", "Count", "Mean", "p50", "p95", "p99"])
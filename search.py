@@ -0,0 +1,128 @@
+"""
+Filters of the SEARCH command, which finds entries below a directory on the server so the
+client does not have to TREE everything and filter it itself.
+A query is typed as one line, for example "*.mp4 >100MB since:7d":
+    pattern       a glob when it has *, ? or [...], a substring of the name otherwise, case insensitive
+    >SIZE <SIZE   files at least / at most SIZE, in B, KB, MB, GB or TB
+    since:WHEN    files modified since a date (2026-01-31, 2026-01-31T12:00) or within 30m, 12h, 7d, 2w
+    limit:N       stop after N results
+Filters on size or time only match files, directories have neither.
+Results come a page at a time like DIR and TREE, matched by the file index (fileindex.py)
+when the server keeps one and by a walk of the disk otherwise.
+"""
+import fnmatch
+import time
+from datetime import datetime
+
+from type import KeyData
+
+SIZE_UNITS: dict[str, int] = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2,
+                              "G": 1024 ** 3, "GB": 1024 ** 3, "T": 1024 ** 4, "TB": 1024 ** 4}
+AGE_UNITS: dict[str, int] = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+GLOB_CHARS = frozenset("*?[")
+
+
+class SearchQuery:
+    def __init__(self, pattern: str = "", min_size: int = 0, max_size: int | None = None, since: int = 0,
+                 limit: int = 0):
+        self.pattern: str = pattern
+        self.min_size: int = min_size
+        self.max_size: int | None = max_size
+        self.since: int = since  # unix time in seconds, 0 for any time
+        self.limit: int = limit  # results the client shows, 0 for all, never sent
+
+    @property
+    def is_glob(self) -> bool:
+        return not GLOB_CHARS.isdisjoint(self.pattern)
+
+    @property
+    def files_only(self) -> bool:
+        return bool(self.min_size or self.max_size is not None or self.since)
+
+    @staticmethod
+    def parse(text: str) -> "SearchQuery":
+        """
+        Reads a query typed by the user, see the module docstring.
+        Raises:
+            ValueError: A size, date or limit can not be read, the message says which
+        """
+        query = SearchQuery()
+        words: list[str] = []
+        for word in text.split():
+            if word[0] in "<>" and len(word) > 1:
+                size: int = SearchQuery.parse_size(word[1:])
+                if word[0] == ">":
+                    query.min_size = size
+                else:
+                    query.max_size = size
+            elif word.lower().startswith("since:"):
+                query.since = SearchQuery.parse_since(word[6:])
+            elif word.lower().startswith("limit:"):
+                if not word[6:].isdigit():
+                    raise ValueError(f"Invalid limit: {word[6:]}")
+                query.limit = int(word[6:])
+            else:
+                words.append(word)
+        query.pattern = " ".join(words)
+        return query
+
+    @staticmethod
+    def parse_size(text: str) -> int:
+        number: str = text.rstrip("BbKkMmGgTt")
+        unit: str = text[len(number):].upper()
+        try:
+            size: int = int(float(number) * SIZE_UNITS[unit])
+        except (KeyError, ValueError, OverflowError):
+            raise ValueError(f"Invalid size: {text}, use for example 500KB or 1.5GB") from None
+        if size < 0:
+            raise ValueError(f"Invalid size: {text}, a size can not be negative")
+        return size
+
+    @staticmethod
+    def parse_since(text: str) -> int:
+        if text[-1:] in AGE_UNITS and text[:-1].isdigit():
+            since: int = int(time.time()) - int(text[:-1]) * AGE_UNITS[text[-1]]
+        else:
+            try:
+                since = int(datetime.fromisoformat(text).timestamp())
+            except (ValueError, OverflowError, OSError):
+                raise ValueError(f"Invalid time: {text}, use a date like 2026-01-31 or an age like 12h or 7d") from None
+        if since < 0:
+            raise ValueError(f"Invalid time: {text}, searches go back to 1970 at most")
+        return since
+
+    def to_dict(self) -> dict:
+        """The filters as the keys of a SEARCH request, filters that are not set are left out"""
+        out_dict: dict = {KeyData.PATTERN: self.pattern}
+        if self.min_size:
+            out_dict[KeyData.MIN_SIZE] = self.min_size
+        if self.max_size is not None:
+            out_dict[KeyData.MAX_SIZE] = self.max_size
+        if self.since:
+            out_dict[KeyData.SINCE] = self.since
+        return out_dict
+
+    @staticmethod
+    def from_dict(in_data: dict) -> "SearchQuery":
+        """
+        The query of a SEARCH request.
+        Raises:
+            ValueError: A size or time is not a non-negative int, a pickled request is not checked by the codec
+        """
+        query = SearchQuery(in_data.get(KeyData.PATTERN, ""), in_data.get(KeyData.MIN_SIZE, 0),
+                            in_data.get(KeyData.MAX_SIZE), in_data.get(KeyData.SINCE, 0))
+        for value in (query.min_size, query.max_size, query.since):
+            if value is not None and (type(value) is not int or value < 0):
+                raise ValueError(f"Invalid search filter: {value!r}")
+        if not isinstance(query.pattern, str):
+            raise ValueError(f"Invalid search pattern: {query.pattern!r}")
+        return query
+
+    def matches(self, name: str, is_dir: bool, size: int, mtime: float) -> bool:
+        """Checks one entry, used when the server has no index. The index runs the same test in SQL"""
+        if self.files_only and (is_dir or size < self.min_size or mtime < self.since
+                                or (self.max_size is not None and size > self.max_size)):
+            return False
+        if self.is_glob:
+            return fnmatch.fnmatchcase(name.lower(), self.pattern.lower())
+        return self.pattern.lower() in name.lower()
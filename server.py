@@ -1,259 +1,689 @@
+import hashlib
+import os
+import secrets
 import socket
-import threading
+import time
 from pathlib import Path
-from zipfile import ZIP_DEFLATED
 
 from zipstream import ZipStream
 
+from admission import CommandLimiter, WorkerPool
+from async_server import AsyncServer
+from auth import AuthExecutor
+from blobstore import BlobStore
+from compression import Compression
 from database import DataStorage
-from encoder import Encoder
+from delta import Delta
+from encoder import Encoder, DecodeError
 from file_transfer import Transfer
+from fileindex import FileIndex
+from listing import PAGE_SIZE, ListingCache
+from metrics import SERVER_METRICS
+from recorder import Operation, StatsRecorder
+import rollup
 from settings import Settings
-from type import Command, ResCode, KeyData, SIZE
+from striping import STRIPE_MIN_SIZE, RangeQueue, StripedTransfer, StripeRegistry
+from type import MAX_CHECKS, Command, ResCode, KeyData, receive_msg, send_msg
+from zip_extractor import ZipExtractor
 from relativepath import RelativePath
+from resume import PART_SUFFIX, Checkpoint
+from search import SearchQuery
 
 # localhost if needed
 sett = Settings()
 SERVER_DIR = RelativePath.from_base("server_location")
 SERVER_DIR.path().mkdir(parents=True, exist_ok=True)
-Data = DataStorage(sett.JWT_SECRET_KEY)
+# partial uploads live outside SERVER_DIR so they never show up in a listing
+PARTIAL_DIR = Path("server_partial")
+PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+Checkpoint.collect_stale(PARTIAL_DIR, sett.PARTIAL_TTL_HOURS * 3600)
+# one copy of every uploaded file, the files in SERVER_DIR are hardlinks to it
+BLOBS = BlobStore(Path("server_blobs"), SERVER_METRICS)
+Data = DataStorage(sett.JWT_SECRET_KEY, metrics=SERVER_METRICS, token_cache=sett.TOKEN_CACHE)
+# bcrypt checks of VERIFY_PAS, out of the way of the threads serving transfers
+AUTH = AuthExecutor(Data, SERVER_METRICS, sett.AUTH_WORKERS, sett.AUTH_PROCESSES, sett.AUTH_QUEUE,
+                    sett.AUTH_PER_USER, sett.AUTH_PER_IP)
+# metadata of every entry in SERVER_DIR, kept by the handlers below and checked against the disk at startup
+INDEX: FileIndex | None = FileIndex(Data, SERVER_DIR.path(), SERVER_METRICS) if sett.FILE_INDEX else None
+if INDEX is not None:
+    INDEX.reconcile()
+# statistics of every command, written to data.db in batches
+RECORDER = StatsRecorder(Data, SERVER_METRICS, sett.STATS_BUFFER, sett.STATS_FLUSH_SECONDS,
+                         sett.STATS_RETENTION_DAYS * 86400 or None)
+# DIR and TREE listings, dropped by the handlers below whenever they change a directory
+LISTINGS = ListingCache(sett.LISTING_CACHE_MB * 1024 * 1024, SERVER_METRICS, INDEX, sett.LISTING_THREADS)
+# bulk transfers hold disk and network bandwidth, only this many of each run at once
+LIMITER = CommandLimiter({Command.UPLOAD: sett.MAX_UPLOADS, Command.DOWNLOAD: sett.MAX_DOWNLOADS}, SERVER_METRICS)
+
+# commands that talk to the client several times and move bulk data, the rest get a single reply
+TRANSFER_COMMANDS = (Command.UPLOAD, Command.DOWNLOAD, Command.STRIPE)
+# striped transfers waiting for or served by data connections
+STRIPES = StripeRegistry()
+
 
 ### to handle the clients
 def handle_client(conn, addr):
     print(f"[NEW CONNECTION] {addr} connected.")
+    encoder = Encoder(allow_pickle=sett.ALLOW_PICKLE)
+
+    try:
+        while True:
+            # a client that sends nothing for IDLE_TIMEOUT gives its worker back to the others
+            conn.settimeout(sett.IDLE_TIMEOUT or None)
+            encoded_data = receive_msg(conn, encoder.max_msg_size)
+            conn.settimeout(None)
+            if not encoded_data:
+                # If no data is received (client closed connection), break the loop
+                break
+
+            in_data: dict = encoder.decode(encoded_data)
+
+            cmd: Command = in_data[KeyData.CMD]
+            if cmd in TRANSFER_COMMANDS:
+                if not handle_transfer(conn, addr, encoder, in_data):
+                    break
+                continue
+
+            send_msg(conn, handle_request(encoder, in_data, addr))
+            if cmd == Command.LOGOUT:
+                break  # gets out of the while(true) loop
 
+    except TimeoutError:
+        print(f"[IDLE] {addr} sent nothing in {sett.IDLE_TIMEOUT:g} s, closed")
+    except (ConnectionError, DecodeError) as e:
+        print(f"[CONNECTION ERROR] {addr}: {e}")
 
-    while True:
-        encoded_data = conn.recv(SIZE)
-        if not encoded_data:
-            # If no data is received (client closed connection), break the loop
-            break
+    print(f"{addr} disconnected")
+    conn.close()
 
-        in_data: dict = Encoder.decode(encoded_data)
 
-        cmd: Command = in_data[KeyData.CMD]
+def handle_request(encoder: Encoder, in_data: dict, addr=None) -> bytes:
+    """
+    Runs a command that is answered with a single reply and returns the encoded reply.
+    Shared by the threaded server and the asyncio server (async_server.py).
+    addr is the client's address, logins from one IP address are capped.
+    """
+    start: float = time.perf_counter()
+    out_data: bytes = run_request(encoder, in_data, addr)
+    RECORDER.record(encoder.user, in_data[KeyData.CMD], response_time=time.perf_counter() - start)
+    return out_data
+
+
+def run_request(encoder: Encoder, in_data: dict, addr) -> bytes:
+    cmd: Command = in_data[KeyData.CMD]
+    match cmd:
+        case Command.STARTING_MSG:
+            platform: str = in_data[KeyData.PLATFORM]
+            message: str = "Connection successful, welcome to the server: "
+
+            match platform:
+                case "GUI":
+                    message += "to run commands right click the menu"
+                case "CLI":
+                    message += "Type help to see a list of commands"
+
+            # the client lists the codecs it speaks, every later message uses the chosen one
+            codec = encoder.negotiate(in_data.get(KeyData.CODECS, []))
+
+            # REQ_ID tells the client its request IDs are echoed, it may then pipeline requests
+            info: dict = {KeyData.MSG: message, KeyData.CODEC: codec, KeyData.REQ_ID: 0}
+            return encoder.encode(info, ResCode.OK)
+
+        case Command.VERIFY_RES:
+            checks: list | None = in_data.get(KeyData.CHECKS)
+            if checks is None:
+                return encoder.encode({}, verify_resource(in_data[KeyData.REL_PATH], in_data[KeyData.IS_DIR],
+                                                          in_data[KeyData.EXISTS]))
+
+            # a selection checked at once, [rel_path, is_dir, exists] each, one result code each
+            if len(checks) > MAX_CHECKS or not all(
+                    isinstance(check, list) and len(check) == 3 and isinstance(check[0], RelativePath)
+                    for check in checks):
+                return encoder.encode({}, ResCode.INVALID_ARGS)
+            found: list[tuple[bool, bool]] = resources_exist([rel_path for rel_path, _, _ in checks])
+            results: list[int] = [verify_resource(rel_path, is_dir, bool(exists), entry)
+                                  for (rel_path, is_dir, exists), entry in zip(checks, found)]
+            return encoder.encode({KeyData.RESULTS: results}, ResCode.OK)
+
+        case Command.VERIFY_PAS:
+            username: str = in_data[KeyData.USER_NAME]
+            password: str = in_data[KeyData.PASSWORD]
+
+            status, token = AUTH.login(username, password, addr[0] if addr else "")
+
+            if status == ResCode.OK:
+                encoder.user = username
+                return encoder.encode({KeyData.AUTH_TOKEN: token}, ResCode.OK)
+            else:
+                return encoder.encode({}, status)
+
+        case Command.VERIFY_AUTH:
+            auth: str = in_data[KeyData.AUTH_TOKEN]
+
+            verified = Data.verify_token(auth)
+            if verified:
+                encoder.user = verified['username']
+                return encoder.encode({}, ResCode.OK)
+            else:
+                return encoder.encode({}, ResCode.AUTH_FAILED)
+
+        case Command.LOGOUT:
+            return encoder.encode({}, ResCode.DISCONNECT)
+
+        case Command.DIR | Command.TREE:
+            # one page per request, the client asks again with the cursor until it is empty
+            folder_path = in_data[KeyData.REL_PATH]
+            paths, cursor = list_directory(SERVER_DIR, folder_path, cmd == Command.TREE,
+                                           in_data.get(KeyData.CURSOR, ""), in_data.get(KeyData.LIMIT, PAGE_SIZE))
+            info: dict = {KeyData.REL_PATHS: paths, KeyData.CURSOR: cursor}
+            return encoder.encode(info, ResCode.OK)
+
+        case Command.SEARCH:
+            # matches are sent a page at a time like a TREE, the client asks again with the cursor
+            folder_path = in_data[KeyData.REL_PATH]
+            base_path: Path = Transfer.file_traversal(SERVER_DIR.path(), folder_path.path())
+            try:
+                query: SearchQuery = SearchQuery.from_dict(in_data)
+            except ValueError:
+                return encoder.encode({}, ResCode.INVALID_ARGS)
+            paths, cursor = LISTINGS.search(base_path, query, in_data.get(KeyData.CURSOR, ""),
+                                            in_data.get(KeyData.LIMIT, PAGE_SIZE))
+            info: dict = {KeyData.REL_PATHS: paths, KeyData.CURSOR: cursor}
+            return encoder.encode(info, ResCode.OK)
+
+        case Command.CD:
+            selected_path: RelativePath = in_data[KeyData.REL_PATH]
+
+            if selected_path.isdir and resource_exists(selected_path)[0]:
+                return encoder.encode({}, ResCode.OK)
+            else:
+                return encoder.encode({}, ResCode.EXISTS)
+
+        case Command.RMDIR | Command.DELETE:
+            selected_path: RelativePath = in_data[KeyData.REL_PATH]
+
+            removed: bool = Transfer.recursively_remove_dir(SERVER_DIR.path(), selected_path.path(), BLOBS)
+            changed(Transfer.file_traversal(SERVER_DIR.path(), selected_path.path()))
+            if removed:
+                return encoder.encode({}, ResCode.OK)
+            else:
+                return encoder.encode({}, ResCode.EXISTS)
+
+        case Command.MKDIR:
+            selected_path: RelativePath = in_data[KeyData.REL_PATH]
+
+            created: bool = Transfer.create_directory(SERVER_DIR.path(), selected_path.path())
+            changed(Transfer.file_traversal(SERVER_DIR.path(), selected_path.path()))
+            if created:
+                return encoder.encode({}, ResCode.OK)
+            else:
+                return encoder.encode({}, ResCode.EXISTS)
+
+        case Command.DEDUP:
+            return handle_dedup(encoder, in_data)
+
+        case Command.STATS:
+            return handle_stats(encoder)
+
+        # default case
+        case _:
+            return encoder.encode({}, ResCode.INVALID_CMD)
+
+
+def handle_dedup(encoder: Encoder, in_data: dict) -> bytes:
+    """
+    Links the offered files whose content the server already stores into the upload directory.
+    The client sends [name, sha256, size] for its large files and leaves the linked ones out of the upload.
+    """
+    directory: RelativePath = in_data[KeyData.REL_PATH]
+    target_dir = SERVER_DIR / directory
+    if not target_dir.path().is_dir():
+        return encoder.encode({}, ResCode.DIRECTORY_NEEDED)
+
+    safe_dir: Path = Transfer.file_traversal(SERVER_DIR.path(), directory.path())
+    linked: list[str] = []
+    for offer in in_data.get(KeyData.DIGESTS, []):
+        if not (isinstance(offer, list) and len(offer) == 3 and isinstance(offer[2], int)):
+            continue
+        name, digest, size = offer
+        target: Path = Transfer.file_traversal(safe_dir, Path(str(name)))
+        if target != safe_dir and BLOBS.link(str(digest), size, target):
+            linked.append(name)
+            changed(target)
+    return encoder.encode({KeyData.DIGESTS: linked}, ResCode.OK)
+
+
+def handle_stats(encoder: Encoder) -> bytes:
+    """
+    Percentiles of the connection's user and of the whole server over the windows of rollup.WINDOWS,
+    read from the rollups so the time does not grow with the history, then the server's counters
+    """
+    user_id: int | None = Data.user_id(encoder.user) if encoder.user else None
+    windows: list[tuple[str, str, dict]] = []
+    for scope, scope_id in ((encoder.user, user_id), ("server", rollup.SERVER)):
+        if scope_id is None:
+            continue
+        for window, seconds, period in rollup.WINDOWS:
+            windows.append((scope, window, Data.rollup_sketches(scope_id, period, time.time() - seconds)))
+    stats: str = rollup.report(windows) + "\n\n" + SERVER_METRICS.table()
+    return encoder.encode({KeyData.STATS: stats}, ResCode.OK)
+
+
+def handle_transfer(conn, addr, encoder: Encoder, in_data: dict) -> bool:
+    """
+    Runs UPLOAD, DOWNLOAD or the STRIPE data connection of either on a blocking connection.
+    Returns: False if the connection has to be closed afterward
+    """
+    cmd: Command = in_data[KeyData.CMD]
+    if not LIMITER.try_acquire(cmd):
+        # the client sees this instead of the OK that would start the transfer
+        send_msg(conn, encoder.encode({}, ResCode.SERVER_NOT_READY))
+        return True
+
+    # the bytes of a striped transfer are recorded with its control connection
+    operation = Operation(encoder.user, cmd)
+    try:
         match cmd:
-            case Command.STARTING_MSG:
-                platform: str = in_data[KeyData.PLATFORM]
-                message: str = "Connection successful, welcome to the server: "
-
-                match platform:
-                    case "GUI":
-                        message += "to run commands right click the menu"
-                    case "CLI":
-                        message += "Type help to see a list of commands"
-
-                info: dict = {KeyData.MSG: message}
-                out_data: bytes = Encoder.encode(info, ResCode.OK)
-                conn.send(out_data)
-
-
-            case Command.VERIFY_RES:
-                is_dir: bool = in_data[KeyData.IS_DIR]
-                exists: bool = in_data[KeyData.EXISTS]
-                rel_path: RelativePath = SERVER_DIR / in_data[KeyData.REL_PATH]
-
-                if rel_path.path().exists() ^ exists:
-                    out_data: bytes = Encoder.encode({}, ResCode.EXISTS)
-
-                elif exists and is_dir is not None and (rel_path.path().is_dir() ^ is_dir):
-                    res: ResCode = ResCode.DIRECTORY_NEEDED if is_dir else ResCode.FILE_NEEDED
-                    out_data: bytes = Encoder.encode({}, res)
-
-                else:
-                    out_data: bytes = Encoder.encode({}, ResCode.OK)
-
-                conn.send(out_data)
-
-            case Command.VERIFY_PAS:
-                username: str = in_data[KeyData.USER_NAME]
-                password: str = in_data[KeyData.PASSWORD]
-
-                verified: bool | str = Data.get_token(username, password)
-
-                if verified:
-                    out_data: bytes = Encoder.encode({KeyData.AUTH_TOKEN: verified}, ResCode.OK)
-                else:
-                    out_data: bytes = Encoder.encode({}, ResCode.AUTH_FAILED)
-                conn.send(out_data)
-
-            case Command.VERIFY_AUTH:
-                auth: str = in_data[KeyData.AUTH_TOKEN]
-
-                verified = Data.verify_token(auth)
-                if verified:
-                    out_data: bytes = Encoder.encode({}, ResCode.OK)
-                else:
-                    out_data: bytes = Encoder.encode({}, ResCode.AUTH_FAILED)
-                conn.send(out_data)
-
-            case Command.LOGOUT:
-                out_data: bytes = Encoder.encode({}, ResCode.DISCONNECT)
-                conn.send(out_data)
-                break  # gets out of the while(true) loop
-
-            case Command.DIR:
-                folder_path = in_data[KeyData.REL_PATH]
-                info: dict = {KeyData.REL_PATHS: list_directory(SERVER_DIR, folder_path, False)}
-                out_data: bytes = Encoder.encode(info, ResCode.OK)
-                conn.send(out_data)
-
-            case Command.TREE:
-                folder_path = in_data[KeyData.REL_PATH]
-                info: dict = {KeyData.REL_PATHS: list_directory(SERVER_DIR, folder_path, True)}
-                out_data: bytes = Encoder.encode(info, ResCode.OK)
-                conn.send(out_data)
-
             case Command.UPLOAD:
-                directory: RelativePath = in_data[KeyData.REL_PATH]
-                byte_files: int = in_data[KeyData.BYTES]
-
-                # Validate directory exists
-                target_dir = SERVER_DIR / directory
-                if not target_dir.path().exists() or not target_dir.path().is_dir():
-                    out_data: bytes = Encoder.encode({},ResCode.DIRECTORY_NEEDED)
-                    conn.send(out_data)
-                    continue
-
-                # Send OK to start receiving file
-                out_data: bytes = Encoder.encode({}, ResCode.OK)
-                conn.send(out_data)
-
-                # Receive the file using safe path resolution
-                safe_dir = Transfer.file_traversal(SERVER_DIR.path(), directory.path())
-                worked: bool = Transfer.recv_file(conn, safe_dir, byte_files)
-
-                # Send back if it worked or not
-                if worked:
-                    info_2: dict = {KeyData.MSG: "File uploaded successfully"}
-                    out_data_2: bytes = Encoder.encode(info_2, ResCode.OK)
-                else:
-                    out_data_2: bytes = Encoder.encode({}, ResCode.UPLOAD_FAILED)
-
-                conn.send(out_data_2)
-
+                return handle_upload(conn, encoder, in_data, operation)
             case Command.DOWNLOAD:
-                file_paths: list[RelativePath] = in_data[KeyData.REL_PATHS]
-
-                zs = ZipStream(compress_type=ZIP_DEFLATED, compress_level=6) # high compression level, 1-7
-
-                num_bytes: int = 0 # approximated size
-
-                for file_path in file_paths:
-                    full_path = SERVER_DIR / file_path
-                    if not full_path.path().exists() or (full_path.path().is_dir() and not any(full_path.path().iterdir())):
-                        continue
-
-                    safe_path = Transfer.file_traversal(SERVER_DIR.path(), file_path.path())
-
-                    num_bytes += int(safe_path.stat().st_size) # approximation not perfectly accurate
-
-                    zs.add_path(safe_path)
-
-                if zs.is_empty():
-                    out_data: bytes = Encoder.encode({}, ResCode.NO_FIlES_SELECTED)
-                    conn.send(out_data)
-                    continue
-
-                # Send the amount of bytes client
-                info: dict = {
-                    KeyData.BYTES: num_bytes,
-                }
-                out_data: bytes = Encoder.encode(info, ResCode.OK)
-                conn.send(out_data)
-
-                # Wait for client confirmation
-                in_data_2 = conn.recv(SIZE)
-                response_2: dict = Encoder.decode(in_data_2)
-                response_cmd_2: ResCode = response_2[KeyData.CMD]
-
-                if response_cmd_2 == ResCode.CANCEL:
-                    print("Client cancelled download")
-                    continue
-
-                if response_cmd_2 != ResCode.OK:
-                    print(f"Unexpected response from client: {response_cmd_2}")
-                    continue
-
-                # Send the file
-                succeeded: bool = Transfer.send_file(conn, zs, num_bytes)
-
-                if succeeded:
-                    print(f"File sent successfully to {addr}")
-                else:
-                    print(f"Failed to send file to {addr}")
-
-            case Command.CD:
-                selected_path: RelativePath = in_data[KeyData.REL_PATH]
-
-                if selected_path.isdir and (SERVER_DIR / selected_path).path().exists():
-                    out_data: bytes = Encoder.encode({}, ResCode.OK)
-                else:
-                    out_data: bytes = Encoder.encode({}, ResCode.EXISTS)
-
-                conn.send(out_data)
-
-            case Command.RMDIR | Command.DELETE:
-                selected_path: RelativePath = in_data[KeyData.REL_PATH]
-
-                if Transfer.recursively_remove_dir(SERVER_DIR.path(), selected_path.path()):
-                    out_data: bytes = Encoder.encode({}, ResCode.OK)
-                else:
-                    out_data: bytes = Encoder.encode({}, ResCode.EXISTS)
-                conn.send(out_data)
-
-            case Command.MKDIR:
-                selected_path: RelativePath = in_data[KeyData.REL_PATH]
-
-                if Transfer.create_directory(SERVER_DIR.path(), selected_path.path()):
-                    out_data: bytes = Encoder.encode({}, ResCode.OK)
-                else:
-                    out_data: bytes = Encoder.encode({}, ResCode.EXISTS)
-                conn.send(out_data)
+                return handle_download(conn, addr, encoder, in_data, operation)
+            case Command.STRIPE:
+                return handle_stripe(conn, addr, encoder, in_data)
+        return True
+    finally:
+        LIMITER.release(cmd)
+        RECORDER.finish(operation)
+
+
+def handle_upload(conn, encoder: Encoder, in_data: dict, operation: Operation) -> bool:
+    directory: RelativePath = in_data[KeyData.REL_PATH]
+    byte_files: int = in_data[KeyData.BYTES]
+
+    # Validate directory exists
+    target_dir = SERVER_DIR / directory
+    if not target_dir.path().exists() or not target_dir.path().is_dir():
+        out_data: bytes = encoder.encode({},ResCode.DIRECTORY_NEEDED)
+        send_msg(conn, out_data)
+        return True
+
+    # Receive the file using safe path resolution
+    safe_dir = Transfer.file_traversal(SERVER_DIR.path(), directory.path())
+    try:
+        if in_data.get(KeyData.RAW):
+            file_path: Path = safe_dir / Path(in_data[KeyData.FILE_NAME]).name
+            return handle_striped_upload(conn, encoder, file_path, byte_files, in_data.get(KeyData.STRIPES, 1),
+                                         in_data.get(KeyData.VERSION, 0), operation)
+        if in_data.get(KeyData.DELTA):
+            file_path: Path = safe_dir / Path(in_data[KeyData.FILE_NAME]).name
+            return handle_delta_upload(conn, encoder, file_path, byte_files, operation)
+
+        # Send OK to start receiving file
+        out_data: bytes = encoder.encode({}, ResCode.OK)
+        send_msg(conn, out_data)
+
+        # every extracted file is hashed while it is written and stored once in BLOBS
+        extractor = ZipExtractor(safe_dir, on_file=BLOBS.add, hashed=True)
+        try:
+            worked: bool = Transfer.recv_file(conn, safe_dir, byte_files, extractor=extractor)
+        finally:
+            BLOBS.release(extractor.replaced)
+            # even a failed upload may have written files, the top level entries it wrote are read again
+            for top in {path.relative_to(extractor.directory).parts[0]
+                        for path in extractor.files + extractor.directories if path != extractor.directory}:
+                changed(safe_dir / top)
+
+        # Send back if it worked or not
+        if worked:
+            operation.num_bytes = byte_files
+            info_2: dict = {KeyData.MSG: "File uploaded successfully"}
+            out_data_2: bytes = encoder.encode(info_2, ResCode.OK)
+        else:
+            out_data_2: bytes = encoder.encode({}, ResCode.UPLOAD_FAILED)
+
+        send_msg(conn, out_data_2)
+        return True
+    finally:
+        # a failed upload may have left or removed temporary files, cached listings of the directory are stale
+        LISTINGS.invalidate(safe_dir)
+
+
+def handle_striped_upload(conn, encoder: Encoder, file_path: Path, num_bytes: int, stripes: int,
+                          version: int, operation: Operation) -> bool:
+    """
+    Receives one large file as ranges over this connection and the client's data connections.
+    The ranges go into a partial file in PARTIAL_DIR whose checkpoint outlives a dropped connection,
+    uploading the same version of the file again only sends what is missing.
+    The complete file is moved into place.
+    """
+    Checkpoint.collect_stale(PARTIAL_DIR, sett.PARTIAL_TTL_HOURS * 3600)
+    part_path: Path = PARTIAL_DIR / (hashlib.sha256(str(file_path).encode()).hexdigest() + PART_SUFFIX)
+    try:
+        checkpoint: Checkpoint = Checkpoint.load(part_path, num_bytes, version,
+                                                 int(sett.MAX_UPLOAD_GB * 1024 ** 3) or None)
+    except ValueError as e:
+        print(f"Refused upload of {file_path.name}: {e}")
+        send_msg(conn, encoder.encode({}, ResCode.INVALID_ARGS))
+        return True
+    except OSError as e:
+        print(f"Error creating {part_path}: {e}")
+        send_msg(conn, encoder.encode({}, ResCode.UPLOAD_FAILED))
+        return True
+
+    striped = StripedTransfer(part_path, num_bytes, min(stripes, sett.MAX_STRIPES), upload=True)
+    striped.commit = checkpoint.commit
+    STRIPES.register(striped)
+    try:
+        # Send OK to start receiving file, with the id the data connections attach with
+        # and the ranges a previous attempt left behind
+        info: dict = {KeyData.TRANSFER_ID: striped.id, KeyData.STRIPES: striped.stripes,
+                      KeyData.RANGES: checkpoint.committed()}
+        send_msg(conn, encoder.encode(info, ResCode.OK))
+
+        # the client answers with the ranges that match its copy, the rest is sent again
+        response: dict = encoder.decode(receive_msg(conn, encoder.max_msg_size))
+        if response[KeyData.CMD] != ResCode.OK:
+            print("Client cancelled upload")
+            return True
+        try:
+            kept: int = checkpoint.keep(response.get(KeyData.RANGES, []))
+        except ValueError as e:
+            # the client already sends the ranges, the connection can not be used for another request
+            print(f"Refused upload of {file_path.name}: {e}")
+            send_msg(conn, encoder.encode({}, ResCode.INVALID_ARGS))
+            return False
+        if kept:
+            print(f"Resuming upload of {file_path.name} with {kept} of {num_bytes} bytes kept")
+
+        received: int = Transfer.recv_ranges(conn, part_path, num_bytes, commit=checkpoint.commit)
+        striped.wait_received(received, num_bytes - kept)
+        worked: bool = checkpoint.complete()
+        if worked:
+            # ranges arrive out of order, the digest is taken once the file is complete
+            replaced: list[tuple[int, int]] = BlobStore.inodes(file_path)
+            checkpoint.finish(file_path)
+            BLOBS.add(file_path, BlobStore.file_digest(file_path))
+            BLOBS.release(replaced)
+            changed(file_path)
+            operation.num_bytes = num_bytes - kept
+    finally:
+        STRIPES.remove(striped)
+
+    # Send back if it worked or not, an incomplete file stays in PARTIAL_DIR for a resume
+    if worked:
+        info_2: dict = {KeyData.MSG: "File uploaded successfully"}
+        out_data_2: bytes = encoder.encode(info_2, ResCode.OK)
+    else:
+        out_data_2: bytes = encoder.encode({}, ResCode.UPLOAD_FAILED)
+
+    send_msg(conn, out_data_2)
+    return True
+
+
+def handle_delta_upload(conn, encoder: Encoder, file_path: Path, num_bytes: int, operation: Operation) -> bool:
+    """
+    Updates a file the server already has: the client gets the block signatures of this copy
+    and sends back which blocks to keep and the bytes of the rest (delta.py).
+    The new version is built next to the old one and replaces it in one step.
+    """
+    if not file_path.is_file():
+        send_msg(conn, encoder.encode({}, ResCode.FILE_NOT_FOUND))  # the client uploads the whole file
+        return True
+
+    try:
+        block_size: int = Delta.block_size(file_path.stat().st_size)
+        signatures: bytes = Delta.signatures(file_path, block_size)
+    except OSError as e:
+        print(f"Error reading {file_path}: {e}")
+        send_msg(conn, encoder.encode({}, ResCode.UPLOAD_FAILED))
+        return True
+
+    info: dict = {KeyData.BLOCK_SIZE: block_size, KeyData.SIGNATURES: signatures}
+    send_msg(conn, encoder.encode(info, ResCode.OK))
+
+    # the client cancels when too much changed and uploads the whole file instead
+    response: dict = encoder.decode(receive_msg(conn, encoder.max_msg_size))
+    if response[KeyData.CMD] != ResCode.OK:
+        return True
+
+    temp_path: Path = file_path.with_name(f".{file_path.name}.{secrets.token_hex(4)}.delta")
+    digest: str | None = Transfer.recv_delta(conn, file_path, temp_path, num_bytes)
+    if digest:
+        replaced: list[tuple[int, int]] = BlobStore.inodes(file_path)
+        os.replace(temp_path, file_path)
+        BLOBS.add(file_path, digest)
+        BLOBS.release(replaced)
+        changed(file_path)
+        operation.num_bytes = num_bytes
+
+    # Send back if it worked or not, a failed delta leaves the old version untouched
+    if digest:
+        info_2: dict = {KeyData.MSG: "File uploaded successfully"}
+        out_data_2: bytes = encoder.encode(info_2, ResCode.OK)
+    else:
+        out_data_2: bytes = encoder.encode({}, ResCode.UPLOAD_FAILED)
+
+    send_msg(conn, out_data_2)
+    return True
+
+
+def handle_download(conn, addr, encoder: Encoder, in_data: dict, operation: Operation) -> bool:
+    file_paths: list[RelativePath] = in_data[KeyData.REL_PATHS]
+
+    # a single already compressed file skips the zip stream and is sent raw with sendfile
+    raw_path: Path | None = None
+    if len(file_paths) == 1:
+        single_path = Transfer.file_traversal(SERVER_DIR.path(), file_paths[0].path())
+        if single_path.is_file() and Compression.is_incompressible(single_path):
+            raw_path = single_path
+
+    striped: StripedTransfer | None = None
+    if raw_path is None:
+        zs = ZipStream()  # the codec is chosen per file by Compression.add_path
+
+        num_bytes: int = 0 # approximated size
+
+        for file_path in file_paths:
+            full_path = SERVER_DIR / file_path
+            if not full_path.path().exists() or (full_path.path().is_dir() and not any(full_path.path().iterdir())):
+                continue
+
+            safe_path = Transfer.file_traversal(SERVER_DIR.path(), file_path.path())
+
+            # the zip adds headers and compresses, the client only uses this for the progress bar
+            num_bytes += INDEX.total_size(safe_path) if INDEX is not None else int(safe_path.stat().st_size)
+
+            Compression.add_path(zs, safe_path, safe_path.name, sett.COMPRESS_LVL)
+
+        if zs.is_empty():
+            out_data: bytes = encoder.encode({}, ResCode.NO_FIlES_SELECTED)
+            send_msg(conn, out_data)
+            return True
+
+        # Send the amount of bytes client
+        info: dict = {
+            KeyData.BYTES: num_bytes,
+        }
+    else:
+        # a raw transfer announces the exact size so the client can preallocate the file
+        num_bytes: int = raw_path.stat().st_size
+        info: dict = {
+            KeyData.BYTES: num_bytes,
+            KeyData.FILE_NAME: raw_path.name,
+            KeyData.RAW: True,
+        }
+
+        # a large file is sent as ranges, split over the client's data connections
+        # and resumable from the ranges the client already has
+        if num_bytes >= STRIPE_MIN_SIZE:
+            stripes: int = max(1, min(in_data.get(KeyData.STRIPES, 1), sett.MAX_STRIPES))
+            striped = StripedTransfer(raw_path, num_bytes, stripes, upload=False)
+            info[KeyData.TRANSFER_ID] = striped.id
+            info[KeyData.STRIPES] = stripes
+            info[KeyData.VERSION] = raw_path.stat().st_mtime_ns
+            STRIPES.register(striped)
+
+    try:
+        out_data: bytes = encoder.encode(info, ResCode.OK)
+        send_msg(conn, out_data)
+
+        # Wait for client confirmation
+        in_data_2 = receive_msg(conn, encoder.max_msg_size)
+        response_2: dict = encoder.decode(in_data_2)
+        response_cmd_2: ResCode = response_2[KeyData.CMD]
+
+        if response_cmd_2 == ResCode.CANCEL:
+            print("Client cancelled download")
+            return True
+
+        if response_cmd_2 != ResCode.OK:
+            print(f"Unexpected response from client: {response_cmd_2}")
+            return True
+
+        # Send the file
+        if raw_path is None:
+            start_cpu: float = time.thread_time()
+            succeeded: bool = Transfer.send_file(conn, zs, num_bytes)
+            if succeeded:
+                stats: dict[str, float] = Compression.stats(zs, time.thread_time() - start_cpu)
+                SERVER_METRICS.incr("download_bytes_saved", stats["bytes_saved"])
+                SERVER_METRICS.incr("download_compress_cpu_seconds", stats["cpu_time"])
+                print(f"[COMPRESSION] {addr}: {Compression.stats_str(stats)}")
+        else:
+            if striped is None:
+                succeeded: bool = Transfer.send_raw(conn, raw_path, num_bytes)
+            else:
+                # only the ranges whose crc does not match the client's partial file are sent
+                verified: list[list[int]] = Checkpoint.verify(raw_path, response_2.get(KeyData.RANGES, []))
+                striped.queue = RangeQueue(num_bytes, verified)
+                send_msg(conn, encoder.encode({KeyData.RANGES: verified}, ResCode.OK))
+                succeeded: bool = Transfer.send_ranges(conn, raw_path, striped.queue)
+            if not succeeded:
+                # raw bytes have no abort frame, the client only notices a closed connection
+                print(f"Failed to send file to {addr}")
+                return False
+
+        if succeeded:
+            operation.num_bytes = num_bytes
+            print(f"File sent successfully to {addr}")
+        else:
+            print(f"Failed to send file to {addr}")
+        return True
+    finally:
+        if striped is not None:
+            STRIPES.remove(striped)
+
+
+def handle_stripe(conn, addr, encoder: Encoder, in_data: dict) -> bool:
+    """
+    Serves a data connection of a striped transfer: the client proves who it is with its JWT
+    and names the transfer, then the connection sends or receives ranges until the transfer is done.
+    Returns: False, a data connection is closed afterward
+    """
+    striped: StripedTransfer | None = STRIPES.get(in_data[KeyData.TRANSFER_ID])
+    if not Data.verify_token(in_data[KeyData.AUTH_TOKEN]):
+        send_msg(conn, encoder.encode({}, ResCode.AUTH_FAILED))
+        return False
+    if striped is None:
+        send_msg(conn, encoder.encode({}, ResCode.FILE_NOT_FOUND))
+        return False
+
+    striped.attach()
+    received: int = 0
+    try:
+        send_msg(conn, encoder.encode({}, ResCode.OK))
+        if striped.upload:
+            received = Transfer.recv_ranges(conn, striped.file_path, striped.num_bytes, commit=striped.commit)
+        elif not Transfer.send_ranges(conn, striped.file_path, striped.queue):
+            print(f"Failed to send file ranges to {addr}")
+    finally:
+        striped.detach(received)
+    return False
+
+
+def resource_exists(rel_path: RelativePath) -> tuple[bool, bool]:
+    """Returns whether the path below SERVER_DIR exists and whether it is a directory, from INDEX if there is one"""
+    if INDEX is None:
+        path: Path = (SERVER_DIR / rel_path).path()
+        return path.exists(), path.is_dir()
+    entry: tuple[int, float, bool] | None = INDEX.lookup(Transfer.file_traversal(SERVER_DIR.path(), rel_path.path()))
+    return entry is not None, entry is not None and entry[2]
+
+
+def resources_exist(rel_paths: list[RelativePath]) -> list[tuple[bool, bool]]:
+    """resource_exists of every path, INDEX answers all of them with one query"""
+    if INDEX is None:
+        return [resource_exists(rel_path) for rel_path in rel_paths]
+    entries: list[tuple[int, float, bool] | None] = INDEX.lookup_many(
+        [Transfer.file_traversal(SERVER_DIR.path(), rel_path.path()) for rel_path in rel_paths])
+    return [(entry is not None, entry is not None and entry[2]) for entry in entries]
+
+
+def verify_resource(rel_path: RelativePath, is_dir: bool | None, exists: bool,
+                    found: tuple[bool, bool] | None = None) -> ResCode:
+    """
+    Checks a path below SERVER_DIR for VERIFY_RES.
 
-            case Command.STATS:
-                out_data: bytes = Encoder.encode({KeyData.STATS: "Dummy stats"}, ResCode.OK)
-                conn.send(out_data)
+    Args:
+        rel_path: Path to check
+        is_dir: Whether it has to be a directory or a file, None for either
+        exists: Whether it has to exist or must not
+        found: What resource_exists returns for rel_path if it was looked up already
+    """
+    found, found_dir = found if found is not None else resource_exists(rel_path)
+    if found ^ exists:
+        return ResCode.EXISTS
+    elif exists and is_dir is not None and (found_dir ^ is_dir):
+        return ResCode.DIRECTORY_NEEDED if is_dir else ResCode.FILE_NEEDED
+    else:
+        return ResCode.OK
 
-            # default case
-            case _:
-                out_data: bytes = Encoder.encode({}, ResCode.INVALID_CMD)
-                conn.send(out_data)
 
-    print(f"{addr} disconnected")
-    conn.close()
+def changed(path: Path) -> None:
+    """
+    Called by every handler after it wrote, created or deleted path: INDEX reads it again, the cached
+    listings of path and of the directories above and below it go
+    """
+    if INDEX is not None:
+        INDEX.update(path)
+    LISTINGS.invalidate(path)
 
 
-def list_directory(server_dir: RelativePath, base_dir: RelativePath, recursive: bool) -> list[RelativePath]:
+def list_directory(server_dir: RelativePath, base_dir: RelativePath, recursive: bool, cursor: str = "",
+                   limit: int = PAGE_SIZE) -> tuple[list[RelativePath], str]:
     """
-    Private function to take in a Path/directory and return the list of starting_path
+    Private function to take in a Path/directory and return a page of its entries after cursor
+    and the cursor of the next page, empty once every entry was sent
     Used for sending the TREE and DIR commands
     """
     assert base_dir.isdir, f"Input needs to be a directory not a file: {base_dir}"
 
-    file_list = []
-
     base_path: Path = Transfer.file_traversal(server_dir.path(), base_dir.path())
 
-    # rglob represents all files recursively while glob is not recursive
-    iterator = base_path.rglob('*') if recursive else base_path.glob('*')
-
-    for file_path_obj in iterator:
-        file_list.append(RelativePath.from_path(file_path_obj, base_path))
-
-    return file_list
+    # small listings are served from memory while the directory is unchanged, large ones stream from a walk
+    return LISTINGS.page(base_path, recursive, cursor, limit)
 
 
 def main():
+    if sett.SERVER_MODE == "async":
+        # every transfer at MAX_STRIPES, its control connection and data connections, has a thread
+        AsyncServer(sett.SERVER_ADDR, sett.ASYNC_WORKERS, sett.MAX_STRIPES * (sett.MAX_UPLOADS + sett.MAX_DOWNLOADS),
+                    sett.ALLOW_PICKLE, handle_request, handle_transfer, TRANSFER_COMMANDS).run()
+        return
+
     print("Starting the server")
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  ## used IPV4 and TCP connection
     server.bind(sett.SERVER_ADDR)  # bind the address
     server.listen()  ## start listening
     print(f"server is listening on {sett.SERVER_IP}:{sett.PORT}")
+    # a fixed number of threads serve the clients, extra connections wait in a bounded queue.
+    # Data connections of striped transfers get threads of their own, enough for every transfer at MAX_STRIPES
+    pool = WorkerPool(handle_client, sett.MAX_WORKERS, sett.PENDING_CONNECTIONS, SERVER_METRICS,
+                      sett.MAX_STRIPES * (sett.MAX_UPLOADS + sett.MAX_DOWNLOADS), sett.IDLE_TIMEOUT)
     while True:
         conn, addr = server.accept()  ### accept a connection from a client
-        thread = threading.Thread(target=handle_client, args=(conn, addr))  ## assigning a thread for each client
-        thread.start()
+        if not pool.submit(conn, addr):
+            print(f"[REJECTED] {addr} server is saturated")
 
 
 if __name__ == "__main__":
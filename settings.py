@@ -18,6 +18,53 @@ class Settings:
 
         self.COMPRESS_LVL: int = self.config.getint('DEFAULT', 'COMPRESS_LEVEL', fallback=5) # can only be from 0-7
 
+        # pickled messages can run arbitrary code when decoded, the server refuses them unless enabled
+        self.ALLOW_PICKLE: bool = self.config.getboolean('DEFAULT', 'ALLOW_PICKLE', fallback=False)
+
+        # "thread" runs one thread per client, "async" serves every client from one event loop
+        self.SERVER_MODE: str = self.config.get('DEFAULT', 'SERVER_MODE', fallback='thread')
+        self.ASYNC_WORKERS: int = self.config.getint('DEFAULT', 'ASYNC_WORKERS', fallback=16) # threads for disk/CPU work in async mode
+
+        # admission control, past these limits clients get SERVER_NOT_READY
+        self.MAX_WORKERS: int = self.config.getint('DEFAULT', 'MAX_WORKERS', fallback=64) # client threads in thread mode
+        self.PENDING_CONNECTIONS: int = self.config.getint('DEFAULT', 'PENDING_CONNECTIONS', fallback=128) # connections waiting for a thread
+        self.MAX_UPLOADS: int = self.config.getint('DEFAULT', 'MAX_UPLOADS', fallback=8)
+        self.MAX_DOWNLOADS: int = self.config.getint('DEFAULT', 'MAX_DOWNLOADS', fallback=8)
+        # seconds a connection may wait between requests before its thread is given to another client, 0 for no limit
+        self.IDLE_TIMEOUT: float = self.config.getfloat('DEFAULT', 'IDLE_TIMEOUT', fallback=600)
+
+        # connections a large file is striped over, 0 tunes the count from measured throughput
+        self.STRIPES: int = self.config.getint('DEFAULT', 'STRIPES', fallback=0)
+        self.MAX_STRIPES: int = self.config.getint('DEFAULT', 'MAX_STRIPES', fallback=8) # server side cap
+        # largest file a striped upload may announce, its partial file is preallocated at that size, 0 for no limit
+        self.MAX_UPLOAD_GB: float = self.config.getfloat('DEFAULT', 'MAX_UPLOAD_GB', fallback=256)
+        # partial files of interrupted transfers are kept this long for a resume
+        self.PARTIAL_TTL_HOURS: float = self.config.getfloat('DEFAULT', 'PARTIAL_TTL_HOURS', fallback=24)
+        # memory for cached DIR/TREE listings on the server
+        self.LISTING_CACHE_MB: int = self.config.getint('DEFAULT', 'LISTING_CACHE_MB', fallback=64)
+        # DIR/TREE stop after this many entries, 0 shows everything
+        self.LISTING_LIMIT: int = self.config.getint('DEFAULT', 'LISTING_LIMIT', fallback=0)
+        # threads that read directories ahead of a listing of the disk, for slow or network storage, 0 for none
+        self.LISTING_THREADS: int = self.config.getint('DEFAULT', 'LISTING_THREADS', fallback=0)
+        # files the server already has are updated by sending only the blocks that changed
+        self.DELTA_SYNC: bool = self.config.getboolean('DEFAULT', 'DELTA_SYNC', fallback=True)
+        # DIR, TREE and existence checks read the files table in data.db instead of the disk
+        self.FILE_INDEX: bool = self.config.getboolean('DEFAULT', 'FILE_INDEX', fallback=True)
+        # bcrypt checks of logins run in a pool of their own, 0 workers for half the cores
+        self.AUTH_WORKERS: int = self.config.getint('DEFAULT', 'AUTH_WORKERS', fallback=0)
+        self.AUTH_PROCESSES: bool = self.config.getboolean('DEFAULT', 'AUTH_PROCESSES', fallback=False) # processes instead of threads
+        # logins in flight, past these limits clients get SERVER_NOT_READY
+        self.AUTH_QUEUE: int = self.config.getint('DEFAULT', 'AUTH_QUEUE', fallback=8) # on the whole server
+        self.AUTH_PER_USER: int = self.config.getint('DEFAULT', 'AUTH_PER_USER', fallback=2)
+        self.AUTH_PER_IP: int = self.config.getint('DEFAULT', 'AUTH_PER_IP', fallback=4)
+        # verified login tokens kept on the server, VERIFY_AUTH of a known token skips decoding it
+        self.TOKEN_CACHE: int = self.config.getint('DEFAULT', 'TOKEN_CACHE', fallback=4096)
+        # statistics of every command wait in memory and are written to data.db in batches
+        self.STATS_BUFFER: int = self.config.getint('DEFAULT', 'STATS_BUFFER', fallback=65536) # records, the oldest are dropped past it
+        self.STATS_FLUSH_SECONDS: float = self.config.getfloat('DEFAULT', 'STATS_FLUSH_SECONDS', fallback=1.0)
+        # statistics rows older than this are deleted, their minute/hour/day rollups stay for STATS, 0 keeps them
+        self.STATS_RETENTION_DAYS: float = self.config.getfloat('DEFAULT', 'STATS_RETENTION_DAYS', fallback=30)
+
         self.SERVER_ADDR: tuple[str, int] = (self.SERVER_IP, self.PORT)
         self.CLIENT_ADDR: tuple[str, int] = (self.CLIENT_IP, self.PORT)
 
@@ -36,6 +83,32 @@ class Settings:
                                   'SERVER_IP'   : self.SERVER_IP,
                                   'USERNAME'    : self.USERNAME,
                                   'COMPRESS_LVL': self.COMPRESS_LVL,
+                                  'ALLOW_PICKLE': self.ALLOW_PICKLE,
+                                  'SERVER_MODE' : self.SERVER_MODE,
+                                  'ASYNC_WORKERS': self.ASYNC_WORKERS,
+                                  'MAX_WORKERS' : self.MAX_WORKERS,
+                                  'PENDING_CONNECTIONS': self.PENDING_CONNECTIONS,
+                                  'MAX_UPLOADS' : self.MAX_UPLOADS,
+                                  'MAX_DOWNLOADS': self.MAX_DOWNLOADS,
+                                  'IDLE_TIMEOUT': self.IDLE_TIMEOUT,
+                                  'STRIPES'     : self.STRIPES,
+                                  'MAX_STRIPES' : self.MAX_STRIPES,
+                                  'MAX_UPLOAD_GB': self.MAX_UPLOAD_GB,
+                                  'PARTIAL_TTL_HOURS': self.PARTIAL_TTL_HOURS,
+                                  'LISTING_CACHE_MB': self.LISTING_CACHE_MB,
+                                  'LISTING_LIMIT': self.LISTING_LIMIT,
+                                  'LISTING_THREADS': self.LISTING_THREADS,
+                                  'DELTA_SYNC'  : self.DELTA_SYNC,
+                                  'FILE_INDEX'  : self.FILE_INDEX,
+                                  'AUTH_WORKERS': self.AUTH_WORKERS,
+                                  'AUTH_PROCESSES': self.AUTH_PROCESSES,
+                                  'AUTH_QUEUE'  : self.AUTH_QUEUE,
+                                  'AUTH_PER_USER': self.AUTH_PER_USER,
+                                  'AUTH_PER_IP' : self.AUTH_PER_IP,
+                                  'TOKEN_CACHE' : self.TOKEN_CACHE,
+                                  'STATS_BUFFER': self.STATS_BUFFER,
+                                  'STATS_FLUSH_SECONDS': self.STATS_FLUSH_SECONDS,
+                                  'STATS_RETENTION_DAYS': self.STATS_RETENTION_DAYS,
                                   }
         self.config['DONT SHARE WITH ANYONE'] = {'jwt_secret_key': self.JWT_SECRET_KEY,
                                                  'AUTH_KEY': self.AUTH_KEY,}
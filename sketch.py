@@ -0,0 +1,76 @@
+"""
+Percentiles of the statistics without keeping every value: a Sketch counts values in buckets
+whose bounds grow by a constant factor, so any quantile it answers is within ACCURACY of a
+value that was added, relative to it. Sketches of the same metric merge by adding the counts,
+which is how the minute, hour and day rollups (rollup.py) are built and read back.
+"""
+import math
+import struct
+
+ACCURACY = 0.01  # relative error of a quantile
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)  # ratio of the bounds of a bucket
+LOG_GAMMA = math.log(GAMMA)
+MIN_VALUE = 1e-9  # smaller values, and zero, are counted as zero
+BIN = struct.Struct("<iI")  # bucket index and count
+ZERO_INDEX = -2 ** 31  # index the zeros are stored under, no bucket has it
+
+
+class Sketch:
+    """Counts of values by logarithmic bucket, with their number and sum"""
+
+    __slots__ = ("bins", "zeros", "count", "total")
+
+    def __init__(self, count: int = 0, total: float = 0.0):
+        self.bins: dict[int, int] = {}
+        self.zeros: int = 0
+        self.count: int = count
+        self.total: float = total
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < MIN_VALUE:
+            self.zeros += 1
+        else:
+            index: int = math.ceil(math.log(value) / LOG_GAMMA)
+            self.bins[index] = self.bins.get(index, 0) + 1
+
+    def merge(self, other: "Sketch") -> None:
+        self.count += other.count
+        self.total += other.total
+        self.zeros += other.zeros
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def quantile(self, q: float) -> float:
+        """The value below which a share q of the values lie, 0.0 for an empty sketch"""
+        if not self.count:
+            return 0.0
+        rank: float = q * (self.count - 1)
+        seen: int = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # the middle of the bucket in relative terms, within ACCURACY of both bounds
+                return 2 * GAMMA ** index / (GAMMA + 1)
+        return 2 * GAMMA ** max(self.bins) / (GAMMA + 1)
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_bytes(self) -> bytes:
+        """The buckets and the zeros, count and total are stored apart"""
+        return b"".join(BIN.pack(index, count) for index, count in
+                        ([(ZERO_INDEX, self.zeros)] if self.zeros else []) + list(self.bins.items()))
+
+    @staticmethod
+    def from_bytes(data: bytes, count: int, total: float) -> "Sketch":
+        sketch = Sketch(count, total)
+        for index, bin_count in BIN.iter_unpack(data):
+            if index == ZERO_INDEX:
+                sketch.zeros = bin_count
+            else:
+                sketch.bins[index] = bin_count
+        return sketch
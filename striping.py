@@ -0,0 +1,196 @@
+"""
+Striped transfers move one large file over several TCP connections at once.
+The file is cut into byte ranges that the sending side hands out from a RangeQueue, every
+connection sends a range header followed by the bytes (Transfer.send_ranges) and the receiver
+writes them at their offset with positional writes (Transfer.recv_ranges).
+The control connection carries its share of the ranges, the other connections are data
+connections that attach to the transfer with Command.STRIPE and the client's JWT.
+"""
+import secrets
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable
+
+STRIPE_MIN_SIZE = 64 * 1024 * 1024  # smaller files gain nothing from extra connections
+STRIPE_RANGE = 16 * 1024 * 1024  # bytes handed to a connection at a time
+STRIPE_TIMEOUT = 30.0  # seconds the receiver waits for data connections that are still writing
+AUTO_START = 2  # stripes of the first transfer when the count is tuned automatically
+AUTO_LIMIT = 16  # the tuner never asks for more, the server caps it with MAX_STRIPES
+AUTO_GAIN = 1.1  # more stripes are kept when the throughput grows by at least 10%
+AUTO_DROP = 0.75  # below this share of the best throughput the tuner probes again
+
+
+class RangeQueue:
+    """
+    Hands out the byte ranges of a file to the sending connections.
+    A range that could not be sent goes back into the queue for another connection, next()
+    waits while ranges are still being sent so the last connections do not stop before a
+    failed range was sent again.
+
+    Args:
+        num_bytes: Size of the file
+        skip: (offset, length, ...) of ranges the receiver already has, a resumed transfer leaves them out
+        range_size: Largest range handed out
+    """
+
+    def __init__(self, num_bytes: int, skip: list[list[int]] = (), range_size: int = STRIPE_RANGE):
+        self.cond = threading.Condition()
+        self.ranges: deque[tuple[int, int]] = deque()
+        self.in_flight: int = 0
+
+        position: int = 0
+        for offset, length, *_ in sorted(skip) + [[num_bytes, 0]]:
+            for start in range(position, offset, range_size):
+                self.ranges.append((start, min(range_size, offset - start)))
+            position = max(position, offset + length)
+
+    def next(self) -> tuple[int, int] | None:
+        """Returns (offset, length) of the next range to send, None once every range was sent"""
+        with self.cond:
+            while not self.ranges and self.in_flight:
+                self.cond.wait()
+            if not self.ranges:
+                return None
+            self.in_flight += 1
+            return self.ranges.popleft()
+
+    def done(self, byte_range: tuple[int, int], sent: bool) -> None:
+        with self.cond:
+            self.in_flight -= 1
+            if not sent:
+                self.ranges.appendleft(byte_range)
+            self.cond.notify_all()
+
+    def remaining(self) -> int:
+        with self.cond:
+            return len(self.ranges) + self.in_flight
+
+
+class StripeProgress:
+    """
+    Adds up the bytes moved by every connection of a striped transfer.
+    Only the thread that created it calls progress_func, the GUI can not be updated from other threads.
+    """
+
+    def __init__(self, num_bytes: int, progress_func: Callable[[int, int, int], None]):
+        self.num_bytes: int = num_bytes
+        self.progress_func = progress_func
+        self.owner: int = threading.get_ident()
+        self.lock = threading.Lock()
+        self.bytes: int = 0
+        self.reported_bytes: int = 0
+        self.reported_time: float = time.perf_counter()
+        progress_func(0, 0, num_bytes)
+
+    def add(self, num_bytes: int) -> None:
+        with self.lock:
+            self.bytes += num_bytes
+        self.report()
+
+    def report(self) -> None:
+        """Updates the progress every 0.2 seconds"""
+        elapsed_time: float = time.perf_counter() - self.reported_time
+        if threading.get_ident() != self.owner or elapsed_time < 0.2:
+            return
+        moved: int = self.bytes
+        self.progress_func(min(moved * 100 // max(self.num_bytes, 1), 99),
+                           int((moved - self.reported_bytes) / elapsed_time), self.num_bytes)
+        self.reported_bytes = moved
+        self.reported_time = time.perf_counter()
+
+
+class StripedTransfer:
+    """
+    A striped transfer the server registered and that data connections can attach to.
+    For a download the server sends from queue, for an upload it receives into file_path,
+    passes every completed range to commit and counts the bytes of those ranges.
+    """
+
+    def __init__(self, file_path: Path, num_bytes: int, stripes: int, upload: bool):
+        self.id: str = secrets.token_urlsafe(16)
+        self.file_path: Path = file_path
+        self.num_bytes: int = num_bytes
+        self.stripes: int = stripes
+        self.upload: bool = upload
+        self.queue: RangeQueue | None = None  # set once the ranges the receiver already has are known
+        self.commit: Callable[[int, int, int, int], None] | None = None
+        self.cond = threading.Condition()
+        self.received: int = 0
+        self.connections: int = 0  # data connections currently attached
+
+    def attach(self) -> None:
+        with self.cond:
+            self.connections += 1
+
+    def detach(self, received: int = 0) -> None:
+        with self.cond:
+            self.connections -= 1
+            self.received += received
+            self.cond.notify_all()
+
+    def wait_received(self, received: int, expected: int) -> bool:
+        """
+        Adds the bytes received on the control connection and waits for the data connections.
+        Returns: True if the expected bytes, the ones the receiver did not have yet, arrived
+        """
+        with self.cond:
+            self.received += received
+            self.cond.wait_for(lambda: self.received >= expected or not self.connections, STRIPE_TIMEOUT)
+            return self.received >= expected
+
+
+class StripeRegistry:
+    """Striped transfers the server is running, looked up by the id data connections present"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._transfers: dict[str, StripedTransfer] = {}
+
+    def register(self, transfer: StripedTransfer) -> None:
+        with self._lock:
+            self._transfers[transfer.id] = transfer
+
+    def get(self, transfer_id: str) -> StripedTransfer | None:
+        with self._lock:
+            return self._transfers.get(transfer_id)
+
+    def remove(self, transfer: StripedTransfer) -> None:
+        with self._lock:
+            self._transfers.pop(transfer.id, None)
+
+
+class StripeTuner:
+    """
+    Picks the stripe count of the next transfer. A fixed count from the settings is used as is,
+    with 0 the count is tuned from measured throughput: it doubles while that keeps making
+    transfers faster, falls back to the best count once it stops helping and probes again
+    when the throughput at the best count drops.
+    """
+
+    def __init__(self, fixed: int):
+        self.fixed: int = fixed
+        self.stripes: int = AUTO_START
+        self.best_stripes: int = AUTO_START
+        self.best_rate: float = 0.0
+
+    def count(self) -> int:
+        return self.fixed or self.stripes
+
+    def record(self, stripes: int, num_bytes: int, seconds: float) -> None:
+        """Feeds back the result of a transfer that used stripes connections"""
+        if self.fixed:
+            return
+
+        rate: float = num_bytes / max(seconds, 1e-6)
+        if rate >= self.best_rate * AUTO_GAIN:
+            self.best_stripes, self.best_rate = stripes, rate
+            self.stripes = min(stripes * 2, AUTO_LIMIT)
+        elif stripes == self.best_stripes:
+            # the link changed, remember what it does now and look for a better count again
+            dropped: bool = rate < self.best_rate * AUTO_DROP
+            self.best_rate = rate
+            self.stripes = min(stripes * 2, AUTO_LIMIT) if dropped else stripes
+        else:
+            self.stripes = self.best_stripes
@@ -0,0 +1,61 @@
+"""
+ListingCache with the file index: a cached listing is only dropped by invalidate(), so removing
+or renaming a directory has to drop the listings of every directory below it as well.
+"""
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from database import DataStorage
+from fileindex import FileIndex
+from listing import ListingCache
+from metrics import Metrics
+
+
+class IndexedListingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        self.root: Path = (Path(self.temp.name) / "server_location").resolve()
+        (self.root / "a" / "b").mkdir(parents=True)
+        (self.root / "a" / "b" / "f.txt").write_bytes(b"listed")
+        self.index = FileIndex(DataStorage("test", str(Path(self.temp.name) / "data.db")), self.root, Metrics())
+        self.index.reconcile()
+        self.cache = ListingCache(1024 * 1024, Metrics(), self.index)
+
+    def changed(self, path: Path) -> None:
+        """What server.changed does after a handler wrote path"""
+        self.index.update(path)
+        self.cache.invalidate(path)
+
+    def names(self, directory: Path, recursive: bool = False) -> list[str]:
+        return [path.name for path in self.cache.page(directory, recursive)[0]]
+
+    def test_rmdir_of_ancestor(self):
+        self.assertEqual(self.names(self.root / "a" / "b"), ["f.txt"])
+        self.assertEqual(self.names(self.root / "a", True), ["", "f.txt"])
+        shutil.rmtree(self.root / "a")
+        self.changed(self.root / "a")
+        self.assertEqual(self.names(self.root / "a" / "b"), [])
+        self.assertEqual(self.names(self.root / "a", True), [])
+
+    def test_rename_of_ancestor(self):
+        self.assertEqual(self.names(self.root / "a" / "b"), ["f.txt"])
+        (self.root / "a").rename(self.root / "c")
+        self.changed(self.root / "a")
+        self.changed(self.root / "c")
+        self.assertEqual(self.names(self.root / "a" / "b"), [])
+        self.assertEqual(self.names(self.root / "c" / "b"), ["f.txt"])
+
+    def test_unrelated_listing_is_kept(self):
+        (self.root / "d").mkdir()
+        self.changed(self.root / "d")
+        self.names(self.root / "a" / "b")
+        self.changed(self.root / "d")
+        self.assertIn((self.root / "a" / "b", False), self.cache.listings)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+Checkpoint against what the other side of a transfer may send: the size it claims and the
+ranges it says it verified are checked before anything is preallocated or kept.
+"""
+import tempfile
+import unittest
+from pathlib import Path
+
+from resume import PART_SUFFIX, Checkpoint
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        self.part_path: Path = Path(self.temp.name) / f"file{PART_SUFFIX}"
+
+    def test_claimed_size(self):
+        for num_bytes in (-1, 1025, "1"):
+            with self.subTest(num_bytes=num_bytes), self.assertRaises(ValueError):
+                Checkpoint.load(self.part_path, num_bytes, 1, max_bytes=1024)
+        self.assertFalse(self.part_path.exists())
+        with self.assertRaises(OSError):
+            Checkpoint.load(self.part_path, 1 << 62, 1)
+        self.assertEqual(Checkpoint.load(self.part_path, 1024, 1, max_bytes=1024).num_bytes, 1024)
+
+    def test_keep(self):
+        checkpoint = Checkpoint.load(self.part_path, 1024, 1)
+        with open(self.part_path, "r+b") as file:
+            checkpoint.commit(file.fileno(), 0, 512, 7)
+        resumed = Checkpoint.load(self.part_path, 1024, 1)
+        for verified in ([[0, 512]], [["0", 512, 7]], [[-1, 512, 7]], [[512, 513, 7]], [[0, 0, 7]], [None],
+                         "0,512,7", [[0, 512, 7.0]]):
+            with self.subTest(verified=verified), self.assertRaises(ValueError):
+                resumed.keep(verified)
+        self.assertEqual(resumed.keep([[0, 512, 7], [512, 512, 9]]), 512)
+        self.assertEqual(resumed.committed(), [[0, 512, 7]])
+
+
+if __name__ == "__main__":
+    unittest.main()
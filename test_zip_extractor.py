@@ -0,0 +1,67 @@
+"""
+ZipExtractor against archives made by ZipStream, the way the server receives them: cut into
+pieces of any size, so headers, deflate streams and data descriptors end up split across feeds.
+"""
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+
+from zipstream import ZipStream
+
+from zip_extractor import ZipExtractor
+
+PIECE_SIZES = (1, 2, 7, 13, 4096, 65537)
+
+
+class ZipExtractorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        self.source: Path = Path(self.temp.name) / "src"
+        (self.source / "sub").mkdir(parents=True)
+        self.contents: dict[str, bytes] = {
+            "empty.txt": b"",
+            "text.txt": b"hello zip " * 500,
+            "sub/random.bin": os.urandom(70000),
+            "sub/a:b.txt": b"colon in the name",
+        }
+        for name, content in self.contents.items():
+            (self.source / name).write_bytes(content)
+
+    def archive(self, compress_type: int) -> bytes:
+        zs = ZipStream(compress_type=compress_type)
+        zs.add_path(self.source)
+        return b"".join(zs)
+
+    def extract(self, archive: bytes, size: int) -> Path:
+        target: Path = Path(self.temp.name) / f"out-{size}"
+        extractor = ZipExtractor(target)
+        for pos in range(0, len(archive), size):
+            extractor.feed(archive[pos:pos + size])
+        extractor.finish()
+        return target
+
+    def test_pieces(self):
+        for compress_type in (ZIP_DEFLATED, ZIP_STORED):
+            archive: bytes = self.archive(compress_type)
+            for size in PIECE_SIZES:
+                with self.subTest(compress_type=compress_type, size=size):
+                    target: Path = self.extract(archive, size)
+                    for name, content in self.contents.items():
+                        self.assertEqual((target / "src" / name).read_bytes(), content)
+
+    def test_names(self):
+        extractor = ZipExtractor(Path(self.temp.name))
+        directory: Path = extractor.directory
+        self.assertEqual(extractor._target("/etc/../x/./y.txt"), directory / "etc" / "x" / "y.txt")
+        self.assertEqual(extractor._target("..\\..\\z.txt"), directory / "z.txt")
+        self.assertIsNone(extractor._target("../.."))
+        if os.name != "nt":
+            self.assertEqual(extractor._target("src/sub/a:b.txt"), directory / "src" / "sub" / "a:b.txt")
+
+
+if __name__ == "__main__":
+    unittest.main()
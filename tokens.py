@@ -0,0 +1,98 @@
+"""
+Verified JWT tokens, kept so VERIFY_AUTH does not decode and check the HMAC of the same token
+on every reconnect. A token is looked up by its SHA-256 digest, the token itself is never kept.
+Entries go at the token's exp or as the least recently used once the cache is full, and all at
+once when the secret changes or a user is deleted. A revoked token fails in the same lookup,
+before the cache is consulted.
+"""
+import hashlib
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Metrics
+
+TOKEN_CACHE = 4096  # verified tokens kept by default
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+class TokenCache:
+    """Bounded LRU of token digest -> payload, thread safe"""
+
+    def __init__(self, max_entries: int = TOKEN_CACHE, metrics: Metrics | None = None):
+        self.max_entries: int = max_entries
+        self.metrics: Metrics | None = metrics
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[bytes, dict] = OrderedDict()
+        # (exp, digest) of every entry, the next to expire first, stale pairs are skipped
+        self.expiries: list[tuple[float, bytes]] = []
+        self.revoked: dict[bytes, float] = {}  # digest -> exp, dropped once the token expired anyway
+        self.revoked_until: float = float("inf")  # the first exp in revoked
+        # counts the clears, a payload verified before one is not kept
+        self.generation: int = 0
+
+    def get(self, digest: bytes) -> dict | None | bool:
+        """
+        The payload of a verified token that has not expired.
+
+        Returns:
+            False if the token is revoked, None if it has to be verified
+        """
+        with self.lock:
+            self._expire(time.time())
+            if digest in self.revoked:
+                return False
+            payload: dict | None = self.entries.get(digest)
+            if payload is not None:
+                self.entries.move_to_end(digest)
+        if self.metrics is not None:
+            self.metrics.incr("token_cache_hits" if payload is not None else "token_cache_misses")
+        return dict(payload) if payload is not None else None
+
+    def put(self, digest: bytes, payload: dict, generation: int) -> None:
+        """
+        Keeps a verified payload until its exp, tokens without one are not kept.
+        generation is the one read before the token was verified.
+        """
+        exp: float | None = payload.get('exp')
+        if exp is None or self.max_entries <= 0:
+            return
+        with self.lock:
+            if digest in self.revoked or generation != self.generation:
+                return
+            self.entries[digest] = dict(payload)
+            self.entries.move_to_end(digest)
+            heapq.heappush(self.expiries, (exp, digest))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            if len(self.expiries) > 2 * self.max_entries:
+                # pairs of entries the LRU dropped pile up, rebuilt from what is left
+                self.expiries = [(entry['exp'], key) for key, entry in self.entries.items()]
+                heapq.heapify(self.expiries)
+
+    def revoke(self, digest: bytes, exp: float) -> None:
+        with self.lock:
+            self.revoked[digest] = exp
+            self.revoked_until = min(self.revoked_until, exp)
+            self.entries.pop(digest, None)
+
+    def clear(self) -> None:
+        """Forgets every verified token, revocations stay"""
+        with self.lock:
+            self.entries.clear()
+            self.expiries.clear()
+            self.generation += 1
+
+    def _expire(self, now: float) -> None:
+        while self.expiries and self.expiries[0][0] <= now:
+            exp, digest = heapq.heappop(self.expiries)
+            entry: dict | None = self.entries.get(digest)
+            if entry is not None and entry['exp'] == exp:
+                del self.entries[digest]
+        if self.revoked_until <= now:
+            self.revoked = {digest: exp for digest, exp in self.revoked.items() if exp > now}
+            self.revoked_until = min(self.revoked.values(), default=float("inf"))
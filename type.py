@@ -3,6 +3,8 @@ Lists all the available commands, response codes and keys used in data dictionar
 (in client_CLI.py, client_interface.py, and server.py). Commands indicate what logic
 to perform.
 """
+import struct
+import threading
 from enum import Enum, IntEnum
 
 
@@ -40,6 +42,15 @@ def format_table(table_data: list[list[str]], header: list[str]) -> str:
 
 SIZE = 1024
 
+MSG_HEADER = struct.Struct("<I")  # little endian size prefix of every control message
+MAX_MSG_SIZE = 256 * 1024 * 1024  # larger size prefixes are treated as a broken connection
+# the limit until a client logged in, a size prefix alone must not make the server allocate MAX_MSG_SIZE
+MAX_LOGIN_MSG_SIZE = 1024 * 1024
+MSG_BUFFER_RETAIN = 1024 * 1024  # receive buffers up to this size are reused per thread
+MAX_CHECKS = 1000  # paths one VERIFY_RES request checks, a client sends larger selections in parts
+
+_thread_buffers = threading.local()
+
 def auto() -> int:
     """
     Overriding the auto() function to make sure multiple enums have different values
@@ -57,6 +68,7 @@ class Command(Enum):
     DELETE = auto(), "Delete a file"
     DIR = auto(), "Show the directory"
     TREE = auto(), "Show every file recursively"
+    SEARCH = auto(), "Find files by name, size and modification time"
     DOWNLOAD = auto(), "Download multiple files/directories"
     HELP = auto(), "Show all available commands"
     LOGOUT = auto(), "Log out"
@@ -72,6 +84,8 @@ class Command(Enum):
     VERIFY_PAS = auto(), "Private cmd to verify a user/pass is correct"
     VERIFY_AUTH = auto(), "Private cmd to verify JWT auth is correct"
     STARTING_MSG = auto(), "Private cmd to get welcome message"
+    STRIPE = auto(), "Private cmd to attach a data connection to a striped transfer"
+    DEDUP = auto(), "Private cmd to link files the server already stores instead of uploading them"
 
 
     def __new__(cls, num: int, desc: str):
@@ -84,8 +98,9 @@ class Command(Enum):
     def cmd_str() -> str:
         # Convert Enum members to a list of lists, excluding the last one
         table_data = []
-        for command in list(Command)[:-3]:  # Excludes VERIFY_RES, VERIFY_PAS, STARTING_MSG
-            table_data.append([command.name, command.desc])
+        for command in Command:
+            if not command.desc.startswith("Private cmd"):  # Excludes VERIFY_RES, VERIFY_PAS, STARTING_MSG...
+                table_data.append([command.name, command.desc])
 
         return format_table(table_data, ["Commands", "Description"])
 
@@ -150,6 +165,28 @@ class KeyData(IntEnum):
     EXISTS = auto()
     IS_DIR = auto()
 
+    CODECS = auto()
+    CODEC = auto()
+    RAW = auto()
+
+    TRANSFER_ID = auto()
+    STRIPES = auto()
+    RANGES = auto()
+    VERSION = auto()
+    DIGESTS = auto()
+    DELTA = auto()
+    BLOCK_SIZE = auto()
+    SIGNATURES = auto()
+    CURSOR = auto()
+    LIMIT = auto()
+    PATTERN = auto()
+    MIN_SIZE = auto()
+    MAX_SIZE = auto()
+    SINCE = auto()
+    CHECKS = auto()
+    RESULTS = auto()
+    REQ_ID = auto()
+
     def __int__(self):
         return self.value
 
@@ -194,21 +231,112 @@ def format_time(seconds: float) -> str:
         return f"{minutes:02d}:{secs:02d}"
 
 
-def receive_msg(sock) -> bytes:
+def recv_exact(sock, view: memoryview) -> int:
+    """
+    Fills the whole view from the socket, looping over recv_into until every byte arrived.
+    Returns: The number of bytes read, less than len(view) only when the peer closed the connection.
+    """
+    total: int = 0
+    size: int = len(view)
+    while total < size:
+        received: int = sock.recv_into(view[total:])
+        if not received:
+            break
+        total += received
+    return total
+
+
+def _recv_buffer(size: int) -> bytearray:
     """
-    Receives the first 4 bytes as it's size
-    Returns: The complete message data as bytes, excluding the EOF marker.
+    Returns the receive buffer of the calling thread, grown to at least size bytes.
+    Buffers above MSG_BUFFER_RETAIN are handed out once and not kept, so a single huge
+    listing does not pin its memory for the lifetime of the connection.
     """
-    size_chunk:bytes = sock.recv(4)
-    return sock.recv(size_chunk.from_bytes(4, byteorder='little'))
+    buffer: bytearray | None = getattr(_thread_buffers, "buffer", None)
+    if buffer is not None and len(buffer) >= size:
+        return buffer
+
+    buffer = bytearray(max(size, SIZE))
+    if size <= MSG_BUFFER_RETAIN:
+        _thread_buffers.buffer = buffer
+    return buffer
+
+
+def receive_msg(sock, max_size: int = MAX_MSG_SIZE) -> memoryview:
+    """
+    Receives the first 4 bytes as it's size, then exactly that many bytes of message.
+    The returned view points into a per-thread buffer that is reused by the next call,
+    so decode it before receiving another message.
+
+    Returns: The complete message data, empty if the peer closed the connection between messages.
+    Raises: ConnectionError if the connection closes mid message or the size is above max_size
+    """
+    header = bytearray(MSG_HEADER.size)
+    received: int = recv_exact(sock, memoryview(header))
+    if received == 0:
+        return memoryview(b"")
+    if received < MSG_HEADER.size:
+        raise ConnectionError("Connection closed while receiving a message header")
+
+    (msg_size,) = MSG_HEADER.unpack(header)
+    if msg_size > max_size:
+        raise ConnectionError(f"Message of {msg_size} bytes exceeds the {max_size} byte limit")
+
+    view = memoryview(_recv_buffer(msg_size))[:msg_size]
+    if recv_exact(sock, view) < msg_size:
+        raise ConnectionError("Connection closed while receiving a message")
+    return view
 
 def send_msg(sock, msg: bytes) -> None:
     """
-    Sends the first 4 bytes as it's size
+    Sends the first 4 bytes as it's size, followed by the message in the same write
+    so the header and a small message leave in one segment.
     """
-    b_size = len(msg).to_bytes(4, byteorder='little')
-    sock.send(bytes(msg) + msg)
+    if len(msg) > MAX_MSG_SIZE:
+        raise ValueError(f"Message of {len(msg)} bytes exceeds the {MAX_MSG_SIZE} byte limit")
+    sock.sendall(MSG_HEADER.pack(len(msg)) + msg)
+
+
 
+async def recv_exact_async(loop, sock, view: memoryview) -> int:
+    """recv_exact for a non-blocking socket driven by an asyncio event loop"""
+    total: int = 0
+    size: int = len(view)
+    while total < size:
+        received: int = await loop.sock_recv_into(sock, view[total:])
+        if not received:
+            break
+        total += received
+    return total
+
+
+async def receive_msg_async(loop, sock, max_size: int = MAX_MSG_SIZE) -> bytearray:
+    """
+    receive_msg for the asyncio server. Many connections share one thread there,
+    so every message gets its own buffer instead of the per-thread one.
+    """
+    header = bytearray(MSG_HEADER.size)
+    received: int = await recv_exact_async(loop, sock, memoryview(header))
+    if received == 0:
+        return bytearray()
+    if received < MSG_HEADER.size:
+        raise ConnectionError("Connection closed while receiving a message header")
+
+    (msg_size,) = MSG_HEADER.unpack(header)
+    if msg_size > max_size:
+        raise ConnectionError(f"Message of {msg_size} bytes exceeds the {max_size} byte limit")
+
+    buffer = bytearray(msg_size)
+    if await recv_exact_async(loop, sock, memoryview(buffer)) < msg_size:
+        raise ConnectionError("Connection closed while receiving a message")
+    return buffer
+
+
+async def send_msg_async(loop, sock, msg: bytes) -> None:
+    """send_msg for the asyncio server"""
+    if len(msg) > MAX_MSG_SIZE:
+        raise ValueError(f"Message of {len(msg)} bytes exceeds the {MAX_MSG_SIZE} byte limit")
+    await loop.sock_sendall(sock, MSG_HEADER.pack(len(msg)) + msg)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,317 @@
+"""
+Extracts a zip archive while it is still arriving, so uploads and downloads never hold
+the whole archive in memory. The archive is parsed from its local file headers in order,
+each member is decompressed straight into its final path and the central directory at the
+end is ignored. This matches what ZipStream produces: every member is followed by a data
+descriptor because its sizes are not known when the header is written.
+"""
+import hashlib
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+LOCAL_HEADER = struct.Struct("<4sHHHHHLLLHH")
+LOCAL_SIG = b"PK\x03\x04"
+DESCRIPTOR_SIG = b"PK\x07\x08"
+CENTRAL_SIGS = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")  # anything after the last member
+DESCRIPTOR = struct.Struct("<LLL")  # crc, compressed size, size
+DESCRIPTOR_64 = struct.Struct("<LQQ")
+ZIP64_EXTRA_ID = 0x0001
+
+FLAG_ENCRYPTED = 0x01
+FLAG_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+WINDOWS_INVALID = str.maketrans(':<>|"?*', "_______")  # characters zipfile replaces on Windows
+OUT_CHUNK = 64 * 1024  # most bytes inflated per call, bounds memory against zip bombs
+
+
+class ZipExtractor:
+    """
+    Feed archive bytes in any sized pieces with feed(), then call finish().
+    Members are written below directory, names that would escape it are sanitized the
+    same way zipfile.extractall does. Peak memory is a few chunks no matter the archive size.
+    """
+
+    def __init__(self, directory: Path, on_file: Callable[[Path, str], None] = lambda path, digest: None,
+                 hashed: bool = False):
+        self.directory: Path = directory.resolve()
+        # called with the path of every completed file and its SHA-256, "" unless hashed
+        self.on_file: Callable[[Path, str], None] = on_file
+        self.hashed: bool = hashed
+        self.files: list[Path] = []
+        self.directories: list[Path] = []  # created for directory members, files create their parents silently
+        self.replaced: list[tuple[int, int]] = []  # (device, inode) of files that were overwritten
+
+        self._buffer = bytearray()
+        self._done: bool = False
+        self._file: BinaryIO | None = None
+        self._path: Path | None = None
+
+        # state of the member being extracted
+        self._method: int = 0
+        self._flags: int = 0
+        self._zip64: bool = False
+        self._expected_crc: int = 0
+        self._remaining: int = 0  # compressed bytes left when the header has the sizes
+        self._crc: int = 0
+        self._size: int = 0
+        self._compressed: int = 0
+        self._inflater = None
+        self._descriptor: bool = False  # the member's data ended, its data descriptor is read next
+        self._hash = None
+        self._in_data: bool = False
+
+    def feed(self, data) -> None:
+        """Consumes the next piece of the archive"""
+        if self._done:
+            return
+        self._buffer += data
+
+        while not self._done:
+            if self._in_data:
+                if not self._read_data():
+                    return
+            elif not self._read_header():
+                return
+
+    def finish(self) -> list[Path]:
+        """Checks the archive ended after a complete member and returns the extracted files"""
+        if not self._done and (self._in_data or self._buffer):
+            self.abort()
+            raise ValueError("Archive ended in the middle of a member")
+        self._close_file()
+        return self.files
+
+    def abort(self) -> None:
+        """Stops extracting and removes the partially written member"""
+        path = self._path
+        self._close_file()
+        if path is not None:
+            path.unlink(missing_ok=True)
+        self._done = True
+
+    def _read_header(self) -> bool:
+        """Parses the next local file header, returns False if more bytes are needed"""
+        if len(self._buffer) < 4:
+            return False
+
+        signature = bytes(self._buffer[:4])
+        if signature in CENTRAL_SIGS:
+            # the rest is the central directory which repeats what the local headers said
+            self._done = True
+            self._buffer.clear()
+            return True
+        if signature != LOCAL_SIG:
+            raise ValueError(f"Unexpected zip signature {signature!r}")
+
+        if len(self._buffer) < LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, compressed_size, size,
+         name_len, extra_len) = LOCAL_HEADER.unpack_from(self._buffer)
+        header_end: int = LOCAL_HEADER.size + name_len + extra_len
+        if len(self._buffer) < header_end:
+            return False
+
+        if flags & FLAG_ENCRYPTED:
+            raise ValueError("Encrypted zip members are not supported")
+        if method not in (ZIP_STORED, ZIP_DEFLATED):
+            raise ValueError(f"Unsupported zip compression method {method}")
+
+        raw_name = bytes(self._buffer[LOCAL_HEADER.size:LOCAL_HEADER.size + name_len])
+        name: str = raw_name.decode("utf-8" if flags & FLAG_UTF8 else "cp437")
+        extra = bytes(self._buffer[LOCAL_HEADER.size + name_len:header_end])
+        del self._buffer[:header_end]
+
+        self._flags = flags
+        self._method = method
+        self._expected_crc = crc
+        self._zip64 = False
+        for field_id, field in self._extra_fields(extra):
+            if field_id == ZIP64_EXTRA_ID:
+                self._zip64 = True
+                if size == 0xFFFFFFFF and len(field) >= 8:
+                    size = struct.unpack_from("<Q", field, 0)[0]
+                if compressed_size == 0xFFFFFFFF and len(field) >= 16:
+                    compressed_size = struct.unpack_from("<Q", field, 8)[0]
+
+        self._remaining = compressed_size
+        self._crc = self._size = self._compressed = 0
+        self._inflater = zlib.decompressobj(-zlib.MAX_WBITS) if method == ZIP_DEFLATED else None
+        self._path = self._target(name)
+
+        if name.endswith("/"):
+            if self._path is not None:
+                self._path.mkdir(parents=True, exist_ok=True)
+                self.directories.append(self._path)
+            self._path = None
+            return True
+
+        if self._path is not None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._unlink_existing(self._path)
+            self._file = open(self._path, "wb")
+        self._hash = hashlib.sha256() if self.hashed else None
+        self._in_data = True
+        return True
+
+    def _read_data(self) -> bool:
+        """Extracts buffered member data, returns False if more bytes are needed"""
+        if self._descriptor:
+            return self._read_descriptor()
+        if self._inflater is not None:
+            return self._inflate()
+        if self._flags & FLAG_DESCRIPTOR:
+            return self._store_until_descriptor()
+
+        take: int = min(self._remaining, len(self._buffer))
+        self._write(self._buffer[:take])
+        del self._buffer[:take]
+        self._remaining -= take
+        if self._remaining:
+            return False
+        return self._end_member(self._expected_crc, self._size)
+
+    def _inflate(self) -> bool:
+        inflater = self._inflater
+        while self._buffer or inflater.unconsumed_tail:
+            data = inflater.unconsumed_tail or bytes(self._buffer)
+            if not inflater.unconsumed_tail:
+                self._buffer.clear()
+            self._write(inflater.decompress(data, OUT_CHUNK))
+            if inflater.eof:
+                break
+
+        if not inflater.eof:
+            return False
+        # the bytes after the deflate stream go back into the buffer once, the inflater is done with
+        self._buffer[:0] = inflater.unused_data
+        self._inflater = None
+        if not self._flags & FLAG_DESCRIPTOR:
+            return self._end_member(self._expected_crc, self._size)
+        # the descriptor may arrive with a later piece, until then only the buffer is read
+        self._descriptor = True
+        return self._read_descriptor()
+
+    def _read_descriptor(self) -> bool:
+        """Reads the data descriptor that follows a member whose sizes were not in the header"""
+        descriptor = DESCRIPTOR_64 if self._zip64 else DESCRIPTOR
+        offset: int = 4 if self._buffer[:4] == DESCRIPTOR_SIG else 0
+        if len(self._buffer) < offset + descriptor.size:
+            return False
+        crc, _, size = descriptor.unpack_from(self._buffer, offset)
+        del self._buffer[:offset + descriptor.size]
+        return self._end_member(crc, size)
+
+    def _store_until_descriptor(self) -> bool:
+        """
+        A stored member with a data descriptor has no length anywhere before its data,
+        so the end is found by looking for the descriptor signature whose crc and size
+        match what was written so far. Everything before a possible match is written out.
+        """
+        descriptor = DESCRIPTOR_64 if self._zip64 else DESCRIPTOR
+        start: int = 0
+        while True:
+            index: int = self._buffer.find(DESCRIPTOR_SIG, start)
+            if index == -1:
+                # keep a partial signature that may complete with the next piece
+                self._flush_stored(max(len(self._buffer) - len(DESCRIPTOR_SIG) + 1, 0))
+                return False
+
+            end: int = index + 4 + descriptor.size
+            if len(self._buffer) < end:
+                self._flush_stored(index)
+                return False
+
+            crc, compressed_size, size = descriptor.unpack_from(self._buffer, index + 4)
+            data = memoryview(self._buffer)[:index]
+            if compressed_size == self._size + index and crc == zlib.crc32(data, self._crc):
+                data.release()
+                self._flush_stored(index)
+                del self._buffer[:4 + descriptor.size]
+                return self._end_member(crc, size)
+            data.release()
+            start = index + 1
+
+    def _flush_stored(self, length: int) -> None:
+        if length:
+            self._write(self._buffer[:length])
+            del self._buffer[:length]
+
+    def _write(self, data) -> None:
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        if self._file is not None:
+            self._file.write(data)
+        if self._hash is not None:
+            self._hash.update(data)
+
+    def _end_member(self, crc: int, size: int) -> bool:
+        if crc != self._crc or size != self._size:
+            path = self._path
+            self.abort()
+            raise ValueError(f"Corrupt zip member {path}: crc or size does not match")
+
+        path = self._path
+        self._close_file()
+        self._in_data = False
+        self._descriptor = False
+        if path is not None:
+            self.files.append(path)
+            self.on_file(path, self._hash.hexdigest() if self._hash is not None else "")
+        return True
+
+    def _unlink_existing(self, path: Path) -> None:
+        """
+        Removes a file that is about to be overwritten instead of truncating it,
+        it may be a hardlink whose content is shared with other files.
+        """
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return
+        if not path.is_dir():
+            self.replaced.append((stat.st_dev, stat.st_ino))
+            path.unlink()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._path = None
+
+    def _target(self, name: str) -> Path | None:
+        """
+        Maps an archive name below the extraction directory like zipfile.extractall: a leading
+        drive, absolute prefixes and '', '.' and '..' parts are dropped, on Windows characters it
+        does not allow in names are replaced. Backslashes separate parts as well.
+        Returns None when nothing is left of the name.
+        """
+        name = os.path.splitdrive(name.replace("\\", "/"))[1]
+        parts: list[str] = [part for part in name.split("/") if part not in ("", ".", "..")]
+        if os.name == "nt":
+            parts = [part for part in (ZipExtractor._windows_part(part) for part in parts) if part]
+        if not parts:
+            return None
+        target: Path = self.directory.joinpath(*parts)
+        if not target.resolve().is_relative_to(self.directory):
+            return None
+        return target
+
+    @staticmethod
+    def _windows_part(part: str) -> str:
+        """A name part as zipfile writes it on Windows, invalid characters as '_' and no trailing dots"""
+        return part.translate(WINDOWS_INVALID).rstrip(".")
+
+    @staticmethod
+    def _extra_fields(extra: bytes):
+        pos: int = 0
+        while pos + 4 <= len(extra):
+            field_id, length = struct.unpack_from("<HH", extra, pos)
+            yield field_id, extra[pos + 4:pos + 4 + length]
+            pos += 4 + length